@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -53,11 +54,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -140,6 +144,24 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# Resized copies of uploaded recipe images, see recipe.images. Sizes are
+# the longest edge in pixels. Without workers, images are processed in
+# the request.
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+IMAGE_VARIANT_SIZES = {'thumb': 160, 'medium': 640, 'large': 1280}
+IMAGE_VARIANT_FORMATS = ['webp', 'jpeg']
+IMAGE_VARIANT_QUALITY = int(os.environ.get('IMAGE_VARIANT_QUALITY', 80))
+
+# Limits of uploaded recipe images, see recipe.uploads. The proxy's
+# client_max_body_size caps request bodies at 10M as well.
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+)
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_PIXELS', 40_000_000)
+)
+IMAGE_UPLOAD_FORMATS = ['JPEG', 'PNG', 'WEBP']
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -149,6 +171,114 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',}
 
+# Keyset pagination of list endpoints.
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+# Most recipes accepted by one bulk write request.
+API_BULK_MAX_ITEMS = int(os.environ.get('API_BULK_MAX_ITEMS', 10000))
+
+# Render recipe lists from raw rows instead of model instances.
+FAST_RECIPE_LIST = bool(int(os.environ.get('FAST_RECIPE_LIST', 1)))
+
+# Per-user cache of list responses. The local memory backend is private
+# to each process, use recipe.cache.FileBackend with several workers.
+# Its directory holds users' data and must stay out of the served /vol/web.
+RESPONSE_CACHE = {
+    'BACKEND': os.environ.get(
+        'RESPONSE_CACHE_BACKEND',
+        'recipe.cache.LocMemBackend',
+    ),
+    'LOCATION': os.environ.get('RESPONSE_CACHE_DIR', '/vol/cache/responses'),
+    'MAX_ENTRIES': int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1000)),
+}
+
+# Per-request query counts and times, see core.middleware. Views over
+# their query budget raise in strict mode, which the tests run in.
+SQL_INSTRUMENTATION = bool(int(os.environ.get('SQL_INSTRUMENTATION', 1)))
+SQL_REPEATED_QUERY_THRESHOLD = int(
+    os.environ.get('SQL_REPEATED_QUERY_THRESHOLD', 10)
+)
+SQL_QUERY_BUDGETS_STRICT = bool(
+    int(os.environ.get('SQL_QUERY_BUDGETS_STRICT', 0))
+)
+
+# Requests profiled on demand by staff or sampled, see core.profiling.
+# The directory must not be served by the proxy, which serves /vol/web.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/vol/profiles')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SAMPLE_MEMORY = bool(int(os.environ.get('PROFILE_SAMPLE_MEMORY', 0)))
+PROFILE_MAX_ARTIFACTS = int(os.environ.get('PROFILE_MAX_ARTIFACTS', 100))
+PROFILE_REPORT_LINES = int(os.environ.get('PROFILE_REPORT_LINES', 50))
+
+# Request metrics of all workers, see core.metrics. The directory is
+# shared by the processes and must not be served by the proxy.
+METRICS_ENABLED = bool(int(os.environ.get('METRICS_ENABLED', 1)))
+METRICS_DIR = os.environ.get('METRICS_DIR', '/vol/metrics')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+METRICS_ALLOWED_IPS = os.environ.get(
+    'METRICS_ALLOWED_IPS', '127.0.0.1,::1',
+).split(',')
+
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON line per request, at INFO, or WARNING when it repeats
+        # a query shape or goes over its budget.
+        'core.middleware': {
+            'handlers': ['console'],
+            'level': os.environ.get('SQL_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+        'core.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Caches shared by the worker processes of a host.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SHARED_CACHE_DIR', '/vol/cache/shared'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Token lookups cached per process, see user.authentication. A zero
+# timeout disables the cache. With several workers, name a shared cache
+# so that revoked tokens and changed users are seen by all of them.
+TOKEN_AUTH_CACHE = {
+    'TIMEOUT': float(os.environ.get('TOKEN_AUTH_CACHE_TIMEOUT', 60)),
+    'MAX_ENTRIES': int(os.environ.get('TOKEN_AUTH_CACHE_MAX_ENTRIES', 10000)),
+    'SHARED': os.environ.get('TOKEN_AUTH_CACHE_SHARED', ''),
+}
+
+# Tokens answered by the token endpoint: 'db' for the token table, or
+# 'signed' for short-lived signed access tokens with refresh tokens, see
+# user.tokens. Lifetimes are in seconds.
+AUTH_TOKEN_MODE = os.environ.get('AUTH_TOKEN_MODE', 'db')
+SIGNED_TOKEN_ACCESS_LIFETIME = int(
+    os.environ.get('SIGNED_TOKEN_ACCESS_LIFETIME', 300)
+)
+SIGNED_TOKEN_REFRESH_LIFETIME = int(
+    os.environ.get('SIGNED_TOKEN_REFRESH_LIFETIME', 14 * 24 * 3600)
+)
+# Seconds between reloads of the revoked tokens by each process.
+SIGNED_TOKEN_DENYLIST_SYNC_INTERVAL = float(
+    os.environ.get('SIGNED_TOKEN_DENYLIST_SYNC_INTERVAL', 5)
+)
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
\ No newline at end of file
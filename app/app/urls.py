@@ -29,6 +29,12 @@ from core import views as core_views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/health-check/', core_views.health_check, name='health-check'),
+    path('api/metrics/', core_views.metrics, name='metrics'),
+    path(
+        'api/profiles/<str:name>',
+        core_views.profile_artifact,
+        name='profile-artifact',
+    ),
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
     path(
         'api/docs/',
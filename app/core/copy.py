@@ -0,0 +1,45 @@
+"""
+Bulk loading helpers built on PostgreSQL COPY.
+"""
+import csv
+import io
+
+from django.db import connection
+
+
+def copy_rows(cursor, sql, rows):
+    """Copy rows into a table through an in-memory CSV buffer.
+
+    The statement must read `FROM STDIN WITH (FORMAT csv)`. Unquoted
+    empty fields load as NULL, so text columns that take empty strings
+    belong in its FORCE_NOT_NULL option.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(sql, buffer)
+
+
+def array_literal(values):
+    """Return the text form of an integer array, as COPY reads it."""
+    return '{%s}' % ','.join(str(value) for value in values)
+
+
+def reserve_ids(cursor, model, count):
+    """Draw count ids from a model's primary key sequence.
+
+    Rows copied with these ids can be referenced before they are loaded.
+    """
+    # The sequence is looked up once, not for every id.
+    cursor.execute(
+        'SELECT nextval(sequence) '
+        'FROM pg_get_serial_sequence(%s, %s) AS sequence, '
+        'generate_series(1, %s)',
+        [model._meta.db_table, model._meta.pk.column, count],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def quote_table(model):
+    """Return the quoted table name of a model."""
+    return connection.ops.quote_name(model._meta.db_table)
@@ -0,0 +1,24 @@
+"""
+Custom database lookups.
+"""
+from django.db.models import Field, ForeignObject, Lookup
+
+
+@Field.register_lookup
+@ForeignObject.register_lookup
+class Any(Lookup):
+    """Match any element of a list passed as a single array parameter.
+
+    Unlike `__in`, the SQL is the same for any number of values, so long
+    id lists neither bloat the query text nor defeat statement caching.
+    """
+    lookup_name = 'any'
+    prepare_rhs = False
+
+    def get_db_prep_lookup(self, value, connection):
+        return '%s', [list(value)]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} = ANY({rhs})', lhs_params + rhs_params
@@ -0,0 +1,91 @@
+"""
+Django command to benchmark the cost of authenticating a request.
+"""
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from core.management.commands.benchmark_endpoints import percentile
+from user import tokens
+from user.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
+
+
+class Command(BaseCommand):
+    """Django command to time each authentication class on one request.
+
+    The user and its tokens are created in a transaction that is rolled
+    back. Each class authenticates the same request repeatedly after one
+    warmup, so the cached lookup is measured once it is cached, and the
+    signed tokens once the revocations are loaded.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument(
+            '--output', help='File the JSON results are written to.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                'benchmark-auth@example.com',
+            )
+            token = Token.objects.create(user=user).key
+            access = tokens.issue(user.pk, tokens.ACCESS)
+            results = [
+                self._measure(
+                    name, authentication, header, options['iterations'],
+                )
+                for name, authentication, header in (
+                    ('token', TokenAuthentication(), f'Token {token}'),
+                    ('cached-token', CachedTokenAuthentication(),
+                     f'Token {token}'),
+                    ('signed', SignedTokenAuthentication(),
+                     f'Bearer {access}'),
+                )
+            ]
+            transaction.set_rollback(True)
+
+        for result in results:
+            self.stdout.write(
+                f'{result["authentication"]:<13} '
+                f'mean={result["mean_us"]:.1f}us '
+                f'p50={result["p50_us"]:.1f}us p95={result["p95_us"]:.1f}us '
+                f'queries={result["queries"]:g}'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(
+                    {'iterations': options['iterations'], 'results': results},
+                    file, indent=2,
+                )
+
+    def _measure(self, name, authentication, header, iterations):
+        """Return the timings and queries per call of an authentication."""
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=header)
+        authentication.authenticate(request)
+        timings = []
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(iterations):
+                start = time.perf_counter()
+                authentication.authenticate(request)
+                timings.append((time.perf_counter() - start) * 1e6)
+        return {
+            'authentication': name,
+            'mean_us': statistics.mean(timings),
+            'p50_us': statistics.median(timings),
+            'p95_us': percentile(timings, 95),
+            'queries': len(queries) / iterations,
+        }
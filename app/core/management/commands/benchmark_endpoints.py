@@ -0,0 +1,247 @@
+"""
+Django command to benchmark the API endpoints against budgets.
+"""
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+PASSWORD = 'benchmark-password'
+
+# Budget limits a run may exceed by the threshold before it fails.
+# Query counts are exact, they do not vary between machines.
+TIMED_METRICS = ('p95_ms', 'peak_kib')
+
+
+def percentile(values, percent):
+    """Return the percentile of the values, by the nearest rank."""
+    values = sorted(values)
+    return values[max(0, -(-len(values) * percent // 100) - 1)]
+
+
+def endpoints(user):
+    """Return the benchmarked requests as (name, method, path, data)."""
+    recipe = Recipe.objects.filter(user=user).order_by('id').first()
+    tag_ids = Tag.objects.filter(user=user).order_by('id').values_list(
+        'pk', flat=True,
+    )[:2]
+    recipes_url = reverse('recipe:recipe-list')
+    return [
+        ('recipe-list', 'get', recipes_url, None),
+        ('recipe-list-filtered', 'get', recipes_url,
+         {'tags': ','.join(str(pk) for pk in tag_ids)}),
+        ('recipe-search', 'get', recipes_url, {'search': 'curry'}),
+        ('recipe-detail', 'get',
+         reverse('recipe:recipe-detail', args=[recipe.pk]), None),
+        ('recipe-create', 'post', recipes_url, {
+            'title': 'Benchmark curry',
+            'time_minutes': 30,
+            'price': '7.50',
+            'tags': [{'name': 'tag 0'}, {'name': 'benchmark'}],
+            'ingredients': [{'name': 'ingredient 0'}],
+        }),
+        ('tag-list', 'get', reverse('recipe:tag-list'), None),
+        ('tag-list-usage', 'get', reverse('recipe:tag-list'),
+         {'with_counts': 1, 'ordering': 'usage'}),
+        ('ingredient-list', 'get', reverse('recipe:ingredient-list'),
+         {'assigned_only': 1}),
+        ('token-create', 'post', reverse('user:token'),
+         {'email': user.email, 'password': PASSWORD}),
+        ('user-me', 'get', reverse('user:me'), None),
+    ]
+
+
+class Command(BaseCommand):
+    """Django command to measure latency, queries and memory per endpoint.
+
+    Each dataset size seeds users with that many recipes each, inside a
+    transaction that is rolled back. Every endpoint is requested through
+    the test client as the first user, with token authentication and
+    without the response cache.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='10,1000',
+            help='Comma separated recipes per user of each dataset.',
+        )
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--output', help='File the JSON results are written to.',
+        )
+        parser.add_argument(
+            '--budgets',
+            default=str(settings.BASE_DIR / 'benchmark_budgets.json'),
+            help='JSON budgets the results are checked against.',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.25,
+            help='Fraction a timed budget may be exceeded by.',
+        )
+        parser.add_argument(
+            '--update-budgets', action='store_true',
+            help='Write the results to the budgets file instead.',
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        if min(sizes) < 1:
+            raise CommandError('Every dataset needs at least one recipe.')
+        results = []
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            RESPONSE_CACHE={'BACKEND': ''},
+        ), transaction.atomic():
+            for size in sizes:
+                results += self._run_size(size, options)
+            transaction.set_rollback(True)
+
+        report = {'repeat': options['repeat'], 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        if options['budgets']:
+            if options['update_budgets']:
+                self._write_budgets(options['budgets'], results)
+            else:
+                self._check_budgets(
+                    options['budgets'], results, options['threshold'],
+                )
+
+    def _run_size(self, size, options):
+        self.stdout.write(f'Seeding {options["users"]} users with {size} '
+                          f'recipes each...')
+        prefix = f'benchmark-{size}-'
+        call_command(
+            'generate_dataset', users=options['users'], recipes=size,
+            recipes_distribution='fixed', email_prefix=prefix,
+            stdout=self.stdout,
+        )
+        user = get_user_model().objects.get(email=f'{prefix}0@example.com')
+        user.set_password(PASSWORD)
+        user.save(update_fields=['password'])
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}',
+        )
+
+        results = []
+        for name, method, path, data in endpoints(user):
+            result = self._measure(
+                client, method, path, data, options['repeat'],
+            )
+            results.append({'endpoint': name, 'size': size, **result})
+            self.stdout.write(
+                f'{name:<21} size={size:<6} '
+                f'p50={result["p50_ms"]:.1f}ms p95={result["p95_ms"]:.1f}ms '
+                f'queries={result["queries"]:<3} '
+                f'sql={result["sql_ms"]:.1f}ms '
+                f'peak={result["peak_kib"]:.0f}KiB'
+            )
+        return results
+
+    def _measure(self, client, method, path, data, repeat):
+        """Return the metrics of a request repeated after one warmup."""
+        def request():
+            if method == 'post':
+                response = client.post(path, data, format='json')
+            else:
+                response = client.get(path, data)
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{method.upper()} {path} answered '
+                    f'{response.status_code}: {response.content[:200]}'
+                )
+            return response
+
+        request()
+        timings, counts, sql_timings = [], [], []
+        for _ in range(repeat):
+            # Requests clear the query log as they start, which would skip
+            # their queries if the log held any before the capture.
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                request()
+                timings.append((time.perf_counter() - start) * 1000)
+            counts.append(len(queries))
+            sql_timings.append(
+                sum(float(query['time']) for query in queries) * 1000
+            )
+
+        tracemalloc.start()
+        try:
+            request()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'p50_ms': statistics.median(timings),
+            'p95_ms': percentile(timings, 95),
+            'queries': max(counts),
+            'sql_ms': statistics.median(sql_timings),
+            'peak_kib': peak / 1024,
+        }
+
+    def _check_budgets(self, path, results, threshold):
+        """Fail when a result exceeds its budget."""
+        with open(path) as file:
+            budgets = json.load(file)
+        failures = []
+        for result in results:
+            budget = budgets.get(result['endpoint'], {}).get(
+                str(result['size']),
+            )
+            if budget is None:
+                continue
+            if result['queries'] > budget['queries']:
+                failures.append(
+                    f'{result["endpoint"]} size={result["size"]}: '
+                    f'{result["queries"]} queries, budget {budget["queries"]}'
+                )
+            for metric in TIMED_METRICS:
+                limit = budget[metric] * (1 + threshold)
+                if result[metric] > limit:
+                    failures.append(
+                        f'{result["endpoint"]} size={result["size"]}: '
+                        f'{metric} {result[metric]:.1f}, budget '
+                        f'{budget[metric]:.1f} +{threshold:.0%}'
+                    )
+        if failures:
+            raise CommandError(
+                'Budgets exceeded:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('All budgets met.'))
+
+    def _write_budgets(self, path, results):
+        """Record the results as the new budgets."""
+        budgets = {}
+        for result in results:
+            budgets.setdefault(result['endpoint'], {})[
+                str(result['size'])
+            ] = {
+                'queries': result['queries'],
+                **{
+                    metric: round(result[metric], 1)
+                    for metric in TIMED_METRICS
+                },
+            }
+        with open(path, 'w') as file:
+            json.dump(budgets, file, indent=2, sort_keys=True)
+            file.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'Budgets written to {path}.'))
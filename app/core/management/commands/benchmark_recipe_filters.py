@@ -0,0 +1,118 @@
+"""
+Django command to compare the plans of recipe tag filters.
+"""
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Recipe, Tag
+from recipe.filters import filter_by_related, MATCH_ALL, MATCH_ANY
+
+SEED_RECIPES_SQL = """
+INSERT INTO core_recipe (user_id, title, description, time_minutes,
+                         price, link, tag_ids, ingredient_ids, updated_at)
+SELECT %(user)s, 'Recipe ' || g, '', 10, 1.00, '', '{}', '{}', now()
+FROM generate_series(1, %(recipes)s) g
+"""
+
+SEED_TAGS_SQL = """
+INSERT INTO core_tag (user_id, name, updated_at)
+SELECT %(user)s, 'Tag ' || g, now() FROM generate_series(1, %(tags)s) g
+"""
+
+# Recipe n links tags (31n + j) mod T for j < k, which are all distinct.
+SEED_LINKS_SQL = """
+WITH r AS (
+    SELECT id, row_number() OVER (ORDER BY id) AS rn
+    FROM core_recipe WHERE user_id = %(user)s
+), t AS (
+    SELECT id, row_number() OVER (ORDER BY id) - 1 AS tn
+    FROM core_tag WHERE user_id = %(user)s
+)
+INSERT INTO core_recipe_tags (recipe_id, tag_id)
+SELECT r.id, t.id
+FROM r CROSS JOIN generate_series(0, %(per_recipe)s - 1) j
+JOIN t ON t.tn = (r.rn * 31 + j) %% %(tags)s
+"""
+
+
+class Command(BaseCommand):
+    """Django command to benchmark join and id array tag filters."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000,
+                            help='Rows to seed in core_recipe_tags.')
+        parser.add_argument('--tags', type=int, default=500,
+                            help='Tags owned by the benchmark user.')
+        parser.add_argument('--per-recipe', type=int, default=5,
+                            help='Tags linked to each recipe.')
+        parser.add_argument('--filter-size', type=int, default=3,
+                            help='Tag ids in each filter.')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # Everything is seeded in a transaction that is rolled back.
+        with transaction.atomic():
+            user = self._seed(options)
+            self._run(user, options)
+            transaction.set_rollback(True)
+
+    def _seed(self, options):
+        self.stdout.write(f'Seeding {options["rows"]} tag links...')
+        user = get_user_model().objects.create_user(
+            'benchmark-filters@example.com',
+        )
+        params = {
+            'user': user.pk,
+            'recipes': max(options['rows'] // options['per_recipe'], 1),
+            'tags': options['tags'],
+            'per_recipe': options['per_recipe'],
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(SEED_RECIPES_SQL, params)
+            cursor.execute(SEED_TAGS_SQL, params)
+            cursor.execute(SEED_LINKS_SQL, params)
+        # Raw inserts skip the signals that maintain the id arrays.
+        Recipe.objects.filter(user=user).update_relation_ids()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_recipe, core_tag, core_recipe_tags')
+        return user
+
+    def _plans(self, user, tag_ids):
+        """Return the old join plans and the new id array plans."""
+        recipes = Recipe.objects.filter(user=user).order_by('-id')
+        old_all = recipes
+        for tag_id in tag_ids:
+            old_all = old_all.filter(tags__id=tag_id)
+        return [
+            ('any: join + DISTINCT',
+             recipes.filter(tags__id__in=tag_ids).distinct()),
+            ('any: array overlap',
+             filter_by_related(recipes, 'tags', tag_ids, MATCH_ANY)),
+            ('all: joins + DISTINCT', old_all.distinct()),
+            ('all: array contains',
+             filter_by_related(recipes, 'tags', tag_ids, MATCH_ALL)),
+        ]
+
+    def _run(self, user, options):
+        tags = Tag.objects.filter(user=user).order_by('id')
+        # Adjacent tags co-occur on recipes, so `all` has matches.
+        tag_ids = list(
+            tags.values_list('id', flat=True)[:options['filter_size']]
+        )
+        for name, queryset in self._plans(user, tag_ids):
+            page = queryset[:options['page_size']]
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                rows = len(page.all())
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(
+                f'{name:<24} rows={rows:<5} '
+                f'median={statistics.median(timings) * 1000:.1f}ms '
+                f'min={min(timings) * 1000:.1f}ms'
+            )
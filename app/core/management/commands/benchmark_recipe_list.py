@@ -0,0 +1,115 @@
+"""
+Django command to compare recipe list serializers.
+"""
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.fast_list import FastRecipeList
+from recipe.query_plan import build_query_plan
+from recipe.serializers import RecipeSerializer
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the fast recipe list renderer."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--per-recipe', type=int, default=3,
+                            help='Tags and ingredients linked to each recipe.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # Everything is seeded in a transaction that is rolled back.
+        with transaction.atomic():
+            user = self._seed(options)
+            self._run(user, options)
+            transaction.set_rollback(True)
+
+    def _seed(self, options):
+        self.stdout.write(f'Seeding {options["recipes"]} recipes...')
+        user = get_user_model().objects.create_user(
+            'benchmark-list@example.com',
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=f'Tag {i}') for i in range(options['tags'])
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(user=user, name=f'Ingredient {i}')
+            for i in range(options['tags'])
+        )
+        recipes = []
+        for i in range(options['recipes']):
+            linked = [
+                (i + j) % options['tags']
+                for j in range(options['per_recipe'])
+            ]
+            recipes.append(Recipe(
+                user=user,
+                title=f'Recipe {i}',
+                description='',
+                time_minutes=i % 120,
+                price=Decimal('9.99'),
+                tag_ids=sorted(tags[n].pk for n in linked),
+                ingredient_ids=sorted(ingredients[n].pk for n in linked),
+            ))
+        # bulk_create sends no signals, so the id arrays are set above.
+        recipes = Recipe.objects.bulk_create(recipes, batch_size=1000)
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for recipe in recipes for tag_id in recipe.tag_ids
+            ],
+            batch_size=5000,
+        )
+        Recipe.ingredients.through.objects.bulk_create(
+            [
+                Recipe.ingredients.through(
+                    recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                )
+                for recipe in recipes
+                for ingredient_id in recipe.ingredient_ids
+            ],
+            batch_size=5000,
+        )
+        return user
+
+    def _run(self, user, options):
+        request = Request(RequestFactory().get('/api/recipe/recipes/'))
+        serializer = RecipeSerializer(context={'request': request})
+        queryset = Recipe.objects.filter(user=user).order_by('-id')
+        planned = build_query_plan(serializer).apply(queryset)
+        fast_list = FastRecipeList(serializer)
+
+        def serialize():
+            return RecipeSerializer(
+                planned.all(), many=True, context={'request': request},
+            ).data
+
+        def render():
+            return fast_list.render(list(fast_list.values(queryset)))
+
+        results = {}
+        for name, func in (('RecipeSerializer', serialize),
+                           ('FastRecipeList', render)):
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                rows = len(func())
+                timings.append(time.perf_counter() - start)
+            results[name] = statistics.median(timings)
+            self.stdout.write(
+                f'{name:<18} rows={rows:<6} '
+                f'median={results[name] * 1000:.1f}ms '
+                f'min={min(timings) * 1000:.1f}ms'
+            )
+        speedup = results['RecipeSerializer'] / results['FastRecipeList']
+        self.stdout.write(f'Speedup: {speedup:.1f}x')
@@ -0,0 +1,325 @@
+"""
+Django command to generate a synthetic dataset for scale testing.
+"""
+import io
+import random
+import re
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from core.copy import array_literal, copy_rows, quote_table, reserve_ids
+from core.models import Recipe, Tag, Ingredient
+
+COPY_RECIPES_SQL = """
+COPY {table} (
+    id, user_id, title, description, time_minutes, price, link, image,
+    tag_ids, ingredient_ids, updated_at
+)
+FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (description, link))
+"""
+
+COPY_ITEMS_SQL = """
+COPY {table} (id, user_id, name, updated_at) FROM STDIN WITH (FORMAT csv)
+"""
+
+COPY_LINKS_SQL = """
+COPY {table} (recipe_id, {column}) FROM STDIN WITH (FORMAT csv)
+"""
+
+# The tables rows are copied into.
+LOADED_MODELS = (
+    Recipe, Tag, Ingredient,
+    Recipe.tags.through, Recipe.ingredients.through,
+)
+
+WORDS = [
+    'quick', 'spicy', 'creamy', 'roasted', 'grilled', 'classic', 'smoky',
+    'crispy', 'tangy', 'sweet', 'rustic', 'zesty', 'herby', 'golden',
+]
+DISHES = [
+    'curry', 'salad', 'soup', 'stew', 'pasta', 'tacos', 'risotto', 'pie',
+    'noodles', 'bowl', 'toast', 'cake', 'chili', 'omelette',
+]
+
+DISTRIBUTIONS = ('fixed', 'uniform', 'exponential')
+
+
+def draw(rng, distribution, mean):
+    """Return a non-negative count drawn around a mean."""
+    if distribution == 'fixed':
+        return mean
+    if distribution == 'uniform':
+        return rng.randint(0, 2 * mean)
+    return int(rng.expovariate(1 / mean)) if mean else 0
+
+
+def pick(rng, vocabulary, count):
+    """Return count distinct indexes, popular words first more often.
+
+    Squaring a uniform draw skews the picks towards the start of the
+    vocabulary, as a few ingredients and tags are far more common.
+    """
+    count = min(count, vocabulary)
+    picked = set()
+    while len(picked) < count:
+        picked.add(int(vocabulary * rng.random() ** 2))
+    return picked
+
+
+def dummy_image():
+    """Return the bytes of a small JPEG image."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    """Django command to generate users with recipes, tags and ingredients.
+
+    The dataset is a function of the options and --seed alone. Rows are
+    written with COPY in batches of users, each batch in a transaction,
+    with ids drawn from the sequences up front, so no row is read back.
+    Tag and ingredient names come from shared vocabularies, as different
+    users name the same things alike.
+
+    The tables are analyzed once after the last batch, not after each,
+    then the search vectors of all the recipes are derived in one
+    statement.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument(
+            '--recipes', type=int, default=100,
+            help='Mean number of recipes per user.',
+        )
+        parser.add_argument(
+            '--recipes-distribution', choices=DISTRIBUTIONS,
+            default='exponential',
+        )
+        parser.add_argument(
+            '--tags', type=int, default=3,
+            help='Mean number of tags per recipe.',
+        )
+        parser.add_argument(
+            '--tags-distribution', choices=DISTRIBUTIONS, default='uniform',
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=6,
+            help='Mean number of ingredients per recipe.',
+        )
+        parser.add_argument(
+            '--ingredients-distribution', choices=DISTRIBUTIONS,
+            default='uniform',
+        )
+        parser.add_argument(
+            '--tag-vocabulary', type=int, default=200,
+            help='Distinct tag names shared by all users.',
+        )
+        parser.add_argument(
+            '--ingredient-vocabulary', type=int, default=2000,
+            help='Distinct ingredient names shared by all users.',
+        )
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Fraction of recipes given a dummy image file.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--email-prefix', default='dataset',
+            help='Users are named <prefix><n>@example.com.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=50000,
+            help='Recipes written per transaction, at least one user.',
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['email_prefix']
+        if get_user_model().objects.filter(
+            email__regex=rf'^{re.escape(prefix)}[0-9]+@example\.com$',
+        ).exists():
+            raise CommandError(
+                f'Users named {prefix}*@example.com exist, pick another '
+                f'--email-prefix.'
+            )
+        self.options = options
+        # Counts and contents are drawn from separate generators, in user
+        # and recipe order, so batching does not change the dataset.
+        self.rng = random.Random(options['seed'])
+        self.detail_rng = random.Random(f'{options["seed"]}-details')
+        self.now = timezone.now().isoformat()
+        self.image = dummy_image() if options['images'] else None
+        self.totals = dict.fromkeys(['users', 'recipes', 'links'], 0)
+        self.user_ids = []
+
+        start = time.monotonic()
+        batch = []
+        for n in range(options['users']):
+            batch.append((n, self._draw_user()))
+            if sum(len(recipes) for _, recipes in batch) >= \
+                    options['batch_size']:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+        # The id arrays are copied, only the vectors are derived, with
+        # statistics that show the link tables' real size.
+        self._analyze(LOADED_MODELS)
+        Recipe.objects.filter(
+            user_id__in=self.user_ids, search_vector__isnull=True,
+        ).update_search_vector()
+        self._analyze([Recipe])
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {self.totals["users"]} users, '
+            f'{self.totals["recipes"]} recipes and '
+            f'{self.totals["links"]} links in {elapsed:.1f}s.'
+        ))
+
+    def _draw_user(self):
+        """Return the drawn recipes of a user as (tags, ingredients)."""
+        options = self.options
+        return [
+            (
+                pick(self.rng, options['tag_vocabulary'], draw(
+                    self.rng, options['tags_distribution'], options['tags'],
+                )),
+                pick(self.rng, options['ingredient_vocabulary'], draw(
+                    self.rng, options['ingredients_distribution'],
+                    options['ingredients'],
+                )),
+            )
+            for _ in range(draw(
+                self.rng, options['recipes_distribution'], options['recipes'],
+            ))
+        ]
+
+    @transaction.atomic
+    def _write_batch(self, batch):
+        """Write the users of a batch and everything they own."""
+        prefix = self.options['email_prefix']
+        # One hash for all users, none of them can log in.
+        password = make_password(None)
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(
+                email=f'{prefix}{n}@example.com',
+                name=f'User {n}',
+                password=password,
+            )
+            for n, _ in batch
+        )
+        used = [
+            (
+                sorted(set().union(*(tags for tags, _ in recipes))),
+                sorted(set().union(*(items for _, items in recipes))),
+            )
+            for _, recipes in batch
+        ]
+        recipe_rows, tag_rows, ingredient_rows = [], [], []
+        tag_links, ingredient_links = [], []
+        with connection.cursor() as cursor:
+            recipe_ids = iter(reserve_ids(
+                cursor, Recipe, sum(len(recipes) for _, recipes in batch),
+            ))
+            tag_ids = iter(reserve_ids(
+                cursor, Tag, sum(len(tags) for tags, _ in used),
+            ))
+            ingredient_ids = iter(reserve_ids(
+                cursor, Ingredient, sum(len(items) for _, items in used),
+            ))
+            for user, (_, recipes), (tag_words, ingredient_words) in zip(
+                users, batch, used,
+            ):
+                tags = self._items(user, 'tag', tag_words, tag_ids, tag_rows)
+                ingredients = self._items(
+                    user, 'ingredient', ingredient_words, ingredient_ids,
+                    ingredient_rows,
+                )
+                for index, (tag_picks, ingredient_picks) in enumerate(recipes):
+                    recipe_id = next(recipe_ids)
+                    linked_tags = sorted(tags[word] for word in tag_picks)
+                    linked_ingredients = sorted(
+                        ingredients[word] for word in ingredient_picks
+                    )
+                    recipe_rows.append(self._recipe_row(
+                        recipe_id, user, index, linked_tags,
+                        linked_ingredients,
+                    ))
+                    tag_links += [(recipe_id, pk) for pk in linked_tags]
+                    ingredient_links += [
+                        (recipe_id, pk) for pk in linked_ingredients
+                    ]
+
+            for sql, model, rows in (
+                (COPY_ITEMS_SQL, Tag, tag_rows),
+                (COPY_ITEMS_SQL, Ingredient, ingredient_rows),
+                (COPY_RECIPES_SQL, Recipe, recipe_rows),
+            ):
+                copy_rows(cursor, sql.format(table=quote_table(model)), rows)
+            for name, column, rows in (
+                ('tags', 'tag_id', tag_links),
+                ('ingredients', 'ingredient_id', ingredient_links),
+            ):
+                through = getattr(Recipe, name).through
+                copy_rows(cursor, COPY_LINKS_SQL.format(
+                    table=quote_table(through),
+                    column=connection.ops.quote_name(column),
+                ), rows)
+
+        self.user_ids += [user.pk for user in users]
+        self.totals['users'] += len(users)
+        self.totals['recipes'] += len(recipe_rows)
+        self.totals['links'] += len(tag_links) + len(ingredient_links)
+        self.stdout.write(
+            f'{self.totals["users"]} users, {self.totals["recipes"]} '
+            f'recipes, {self.totals["links"]} links written.'
+        )
+
+    def _analyze(self, models):
+        """Refresh the planner statistics of the tables of models."""
+        with connection.cursor() as cursor:
+            for model in models:
+                cursor.execute(f'ANALYZE {quote_table(model)}')
+
+    def _items(self, user, word, indexes, reserved, rows):
+        """Add the rows of a user's items, return their ids by index."""
+        ids = {index: next(reserved) for index in indexes}
+        rows += [
+            (ids[index], user.pk, f'{word} {index}', self.now)
+            for index in indexes
+        ]
+        return ids
+
+    def _recipe_row(self, recipe_id, user, index, tag_ids, ingredient_ids):
+        """Return the COPY row of a recipe."""
+        rng = self.detail_rng
+        image = ''
+        if self.image and rng.random() < self.options['images']:
+            image = default_storage.save(
+                f'uploads/recipe/{uuid.UUID(int=rng.getrandbits(128))}.jpg',
+                ContentFile(self.image),
+            )
+        return (
+            recipe_id,
+            user.pk,
+            f'{rng.choice(WORDS)} {rng.choice(DISHES)} {index}'[:32],
+            f'Serves {rng.randint(1, 8)}.',
+            rng.randint(5, 180),
+            f'{rng.randint(100, 99999) / 100:.2f}',
+            '',
+            image,
+            array_literal(tag_ids),
+            array_literal(ingredient_ids),
+            self.now,
+        )
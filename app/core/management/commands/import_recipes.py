@@ -0,0 +1,268 @@
+"""
+Django command to import recipes from NDJSON with COPY.
+"""
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.copy import copy_rows
+from core.models import ImportCheckpoint, Recipe, Tag, Ingredient
+from core.signals import touch_owner
+
+# Recipe fields read from the input, with their defaults.
+RECIPE_FIELDS = {
+    'title': None,
+    'description': '',
+    'time_minutes': None,
+    'price': None,
+    'link': '',
+}
+
+# The nested relations: input key, item model, through-table column.
+RELATIONS = (
+    ('tags', Tag, 'tag_id'),
+    ('ingredients', Ingredient, 'ingredient_id'),
+)
+
+# Staging tables are dropped after each batch, or with its transaction if
+# the batch fails. Recipe ids are drawn from the recipe sequence as rows
+# are copied in.
+CREATE_STAGING_SQL = """
+CREATE TEMPORARY TABLE import_recipe (
+    seq integer PRIMARY KEY,
+    id bigint NOT NULL DEFAULT nextval(%s::regclass),
+    title text NOT NULL,
+    description text NOT NULL,
+    time_minutes integer NOT NULL,
+    price numeric NOT NULL,
+    link text NOT NULL
+) ON COMMIT DROP;
+CREATE TEMPORARY TABLE import_link (
+    seq integer NOT NULL,
+    relation text NOT NULL,
+    name text NOT NULL
+) ON COMMIT DROP;
+"""
+
+# Empty CSV fields are NULL unless forced, blank texts are allowed here.
+COPY_RECIPES_SQL = """
+COPY import_recipe (seq, title, description, time_minutes, price, link)
+FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (description, link))
+"""
+
+COPY_LINKS_SQL = """
+COPY import_link (seq, relation, name) FROM STDIN WITH (FORMAT csv)
+"""
+
+INSERT_ITEMS_SQL = """
+INSERT INTO {table} (user_id, name, updated_at)
+SELECT DISTINCT %s::bigint, name, now() FROM import_link
+WHERE relation = %s
+ORDER BY name
+ON CONFLICT (user_id, name) DO NOTHING
+"""
+
+# The id arrays and search vectors are derived once the links exist.
+INSERT_RECIPES_SQL = """
+INSERT INTO {table} (
+    id, user_id, title, description, time_minutes, price, link,
+    tag_ids, ingredient_ids, updated_at
+)
+SELECT id, %s, title, description, time_minutes, price, link,
+    '{{}}', '{{}}', now()
+FROM import_recipe ORDER BY seq
+RETURNING id
+"""
+
+INSERT_LINKS_SQL = """
+INSERT INTO {through} (recipe_id, {column})
+SELECT DISTINCT recipe.id, item.id
+FROM import_link AS link
+JOIN import_recipe AS recipe USING (seq)
+JOIN {table} AS item ON item.user_id = %s AND item.name = link.name
+WHERE link.relation = %s
+"""
+
+
+def _clean(model, name, value):
+    """Return a value cleaned by a model field's validation."""
+    return model._meta.get_field(name).clean(value, None)
+
+
+def _item_name(item):
+    """Return the name of a nested item, given as a name or an object."""
+    if isinstance(item, dict):
+        return item.get('name')
+    return item
+
+
+class Command(BaseCommand):
+    """Django command to bulk load recipes for a user.
+
+    Each line of the input is a recipe object, as written by the recipe
+    export. A batch of lines is copied into temporary staging tables,
+    then merged into the recipe, tag, ingredient and link tables with a
+    statement each, all in one transaction. A named checkpoint row records
+    the last line of the batch in the same transaction, so an interrupted
+    import resumes right after the last batch committed.
+    Images are not imported.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='NDJSON file to import, - reads standard input.',
+        )
+        parser.add_argument(
+            '--user', required=True,
+            help='Email of the user the recipes are imported for.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Recipes imported per transaction.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Name of the checkpoint recording the last line imported, '
+                 'to resume from.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            self.user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist.')
+        checkpoint = options['checkpoint']
+        done = self._read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Resuming after line {done}.')
+
+        if options['path'] == '-':
+            self._import(sys.stdin, done, options['batch_size'], checkpoint)
+        else:
+            with open(options['path'], encoding='utf-8') as file:
+                self._import(file, done, options['batch_size'], checkpoint)
+
+    def _import(self, file, done, batch_size, checkpoint):
+        lines = islice(enumerate(file, start=1), done, None)
+        start = time.monotonic()
+        imported = 0
+        while True:
+            batch = list(islice(lines, batch_size))
+            if not batch:
+                break
+            recipes = [
+                self._parse(number, line)
+                for number, line in batch if line.strip()
+            ]
+            with transaction.atomic():
+                if recipes:
+                    self._import_batch(recipes)
+                self._write_checkpoint(checkpoint, batch[-1][0])
+            imported += len(recipes)
+
+            rate = imported / max(time.monotonic() - start, 1e-6)
+            self.stdout.write(
+                f'Imported {imported} recipes up to line {batch[-1][0]} '
+                f'({rate:.0f} rows/s).'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{imported} recipes imported for {self.user.email}.'
+        ))
+
+    def _parse(self, number, line):
+        """Return a validated recipe row and its nested item names."""
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise ValidationError('Expected an object.')
+            row = [
+                _clean(Recipe, name, data.get(name, default))
+                for name, default in RECIPE_FIELDS.items()
+            ]
+            items = {
+                key: {
+                    _clean(model, 'name', _item_name(item))
+                    for item in data.get(key) or []
+                }
+                for key, model, _ in RELATIONS
+            }
+        except (TypeError, ValueError) as error:
+            raise CommandError(f'Line {number}: {error}')
+        except ValidationError as error:
+            raise CommandError(f'Line {number}: {"; ".join(error.messages)}')
+        return row, items
+
+    def _import_batch(self, recipes):
+        """Stage a batch with COPY and merge it in set-based statements.
+
+        Run in the transaction that records the batch's checkpoint.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_get_serial_sequence(%s, %s)',
+                [Recipe._meta.db_table, Recipe._meta.pk.column],
+            )
+            cursor.execute(CREATE_STAGING_SQL, [cursor.fetchone()[0]])
+            copy_rows(cursor, COPY_RECIPES_SQL, (
+                [seq, *row] for seq, (row, _) in enumerate(recipes)
+            ))
+            copy_rows(cursor, COPY_LINKS_SQL, (
+                [seq, key, name]
+                for seq, (_, items) in enumerate(recipes)
+                for key, _, _ in RELATIONS for name in sorted(items[key])
+            ))
+            cursor.execute('ANALYZE import_recipe, import_link')
+
+            for key, model, _ in RELATIONS:
+                cursor.execute(
+                    INSERT_ITEMS_SQL.format(
+                        table=connection.ops.quote_name(model._meta.db_table),
+                    ),
+                    [self.user.pk, key],
+                )
+            cursor.execute(
+                INSERT_RECIPES_SQL.format(
+                    table=connection.ops.quote_name(Recipe._meta.db_table),
+                ),
+                [self.user.pk],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            for key, model, column in RELATIONS:
+                through = getattr(Recipe, key).through
+                cursor.execute(
+                    INSERT_LINKS_SQL.format(
+                        through=connection.ops.quote_name(
+                            through._meta.db_table,
+                        ),
+                        column=connection.ops.quote_name(column),
+                        table=connection.ops.quote_name(model._meta.db_table),
+                    ),
+                    [self.user.pk, key],
+                )
+            cursor.execute('DROP TABLE import_recipe, import_link')
+
+        # Raw statements send no signals, refresh what they would.
+        Recipe.objects.filter(pk__any=ids).update_relation_data()
+        touch_owner(self.user.pk)
+
+    def _read_checkpoint(self, name):
+        """Return the last line imported by a previous run."""
+        if not name:
+            return 0
+        return ImportCheckpoint.objects.filter(name=name).values_list(
+            'line', flat=True,
+        ).first() or 0
+
+    def _write_checkpoint(self, name, line):
+        """Record the last line imported, with the batch of that line."""
+        if not name:
+            return
+        ImportCheckpoint.objects.update_or_create(
+            name=name, defaults={'line': line},
+        )
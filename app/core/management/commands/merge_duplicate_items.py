@@ -0,0 +1,109 @@
+"""
+Django command to merge tags and ingredients sharing a user and name.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Recipe, Tag, Ingredient
+from core.signals import touch_owners
+
+# Each group lists the ids of one user's items sharing a name.
+DUPLICATE_GROUPS_SQL = """
+SELECT array_agg(id ORDER BY id) FROM {table}
+GROUP BY user_id, name HAVING count(*) > 1
+LIMIT %s
+"""
+
+LOCK_ITEMS_SQL = """
+SELECT id FROM {table} WHERE id = ANY(%s) ORDER BY id FOR UPDATE
+"""
+
+# Link the recipes of each duplicate to the item that is kept.
+REPOINT_LINKS_SQL = """
+INSERT INTO {through} (recipe_id, {column})
+SELECT links.recipe_id, merged.keep_id
+FROM {through} AS links
+JOIN unnest(%s::bigint[], %s::bigint[]) AS merged (id, keep_id)
+    ON links.{column} = merged.id
+ON CONFLICT (recipe_id, {column}) DO NOTHING
+"""
+
+DELETE_LINKS_SQL = """
+DELETE FROM {through} WHERE {column} = ANY(%s) RETURNING recipe_id
+"""
+
+DELETE_ITEMS_SQL = """
+DELETE FROM {table} WHERE id = ANY(%s) RETURNING user_id
+"""
+
+
+class Command(BaseCommand):
+    """Django command to merge duplicate tags and ingredients.
+
+    The oldest item of each group is kept and the recipes of the others
+    are linked to it. Every batch of groups is merged in a transaction
+    of its own, which only locks the rows it touches.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Duplicate groups merged per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        for model, relation in ((Tag, 'tags'), (Ingredient, 'ingredients')):
+            merged = 0
+            while True:
+                count = self._merge_batch(
+                    model, relation, options['batch_size'],
+                )
+                if not count:
+                    break
+                merged += count
+                self.stdout.write(
+                    f'Merged {count} duplicate {model._meta.db_table} rows.'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'{merged} duplicate {model._meta.verbose_name_plural} '
+                f'merged.'
+            ))
+
+    @transaction.atomic
+    def _merge_batch(self, model, relation, batch_size):
+        """Merge one batch of duplicate groups, return the rows removed."""
+        through = getattr(Recipe, relation).through
+        column = getattr(Recipe, relation).field.m2m_reverse_name()
+        names = {
+            'table': connection.ops.quote_name(model._meta.db_table),
+            'through': connection.ops.quote_name(through._meta.db_table),
+            'column': connection.ops.quote_name(column),
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(
+                DUPLICATE_GROUPS_SQL.format(**names), [batch_size],
+            )
+            merged = [
+                (pk, ids[0]) for ids, in cursor.fetchall() for pk in ids[1:]
+            ]
+            if not merged:
+                return 0
+            ids, keep_ids = [list(column) for column in zip(*merged)]
+
+            # Writers linking a duplicate wait for the merge to commit.
+            cursor.execute(
+                LOCK_ITEMS_SQL.format(**names), [ids + keep_ids],
+            )
+            cursor.execute(
+                REPOINT_LINKS_SQL.format(**names), [ids, keep_ids],
+            )
+            cursor.execute(DELETE_LINKS_SQL.format(**names), [ids])
+            recipe_ids = {row[0] for row in cursor.fetchall()}
+            cursor.execute(DELETE_ITEMS_SQL.format(**names), [ids])
+            user_ids = {row[0] for row in cursor.fetchall()}
+
+        # Raw statements send no signals, refresh what they would.
+        Recipe.objects.filter(pk__in=recipe_ids).update_relation_data()
+        if user_ids:
+            touch_owners(user_ids)
+        return len(ids)
@@ -0,0 +1,62 @@
+"""
+Django command to backfill and verify the recipe relation id arrays.
+
+The migrations adding the arrays and the search vector leave existing
+recipes with empty arrays and no vector, the backfill fills them in.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Django command to sync Recipe.tag_ids and Recipe.ingredient_ids."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report recipes whose arrays are out of sync.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Recipes updated per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            self._backfill(options['batch_size'])
+
+        for recipes, state in (
+            (Recipe.objects.out_of_sync(), 'out of sync'),
+            (Recipe.objects.filter(search_vector__isnull=True),
+             'without a search vector'),
+        ):
+            count = recipes.count()
+            if count:
+                sample = list(recipes.values_list('pk', flat=True)[:10])
+                raise CommandError(
+                    f'{count} recipes {state}, e.g. ids {sample}.'
+                )
+        self.stdout.write(self.style.SUCCESS('Recipe relations in sync.'))
+
+    def _backfill(self, batch_size):
+        """Recompute the arrays in id ranges, one transaction each.
+
+        Recipes without a search vector get theirs in the same batch.
+        """
+        max_id = Recipe.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+        for start in range(0, max_id + 1, batch_size):
+            batch = Recipe.objects.filter(
+                pk__gte=start,
+                pk__lt=start + batch_size,
+            )
+            with transaction.atomic():
+                updated = batch.update_relation_ids()
+                batch.filter(search_vector__isnull=True).update_search_vector()
+            if updated:
+                end = min(start + batch_size - 1, max_id)
+                self.stdout.write(
+                    f'Synced {updated} recipes with ids {start}-{end}.'
+                )
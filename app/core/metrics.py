@@ -0,0 +1,263 @@
+"""
+Request metrics shared by the worker processes.
+
+Each process counts in its own memory and writes its values to
+METRICS_DIR as `<pid>.json`, from a background thread every
+METRICS_FLUSH_INTERVAL seconds when they changed, and before it serves
+a scrape. The metrics view adds up the files of every process, those of
+exited workers included, so counters never go backwards while the
+server runs; `scripts/run.sh` empties the directory before uwsgi starts.
+Values read from other workers are at most one interval old.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from core.middleware import view_name
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Name: (type, help, histogram buckets).
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests by view, method and status code.', None,
+    ),
+    'http_request_duration_seconds': (
+        'histogram', 'Time to produce a response.', DURATION_BUCKETS,
+    ),
+    'http_request_db_seconds': (
+        'histogram', 'Time spent in SQL queries per request.',
+        DURATION_BUCKETS,
+    ),
+    'http_request_db_queries_total': (
+        'counter', 'SQL queries run by requests.', None,
+    ),
+    'http_response_bytes': (
+        'histogram', 'Size of non-streaming response bodies.', BYTES_BUCKETS,
+    ),
+    'response_cache_requests_total': (
+        'counter', 'Response cache lookups by result.', None,
+    ),
+}
+
+# Requests no URL pattern matched share a label, whatever their path.
+UNMATCHED_VIEW = 'unmatched'
+
+
+def _labels_key(labels):
+    """Return a JSON key of the labels, the same for any order."""
+    return json.dumps(sorted(labels.items()), separators=(',', ':'))
+
+
+class Registry:
+    """The metric values of the current process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._values = {}
+        self._dirty = False
+        self._flusher = None
+
+    def _series(self, name):
+        """Return the values of a metric, forgetting a forked parent's."""
+        if self._pid != os.getpid():
+            self._reset()
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, daemon=True,
+            )
+            self._flusher.start()
+        self._dirty = True
+        return self._values.setdefault(name, {})
+
+    def inc(self, name, labels, value=1):
+        """Add to a counter."""
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._series(name)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """Record a value in a histogram."""
+        buckets = METRICS[name][2]
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._series(name)
+            # Per bucket counts, then the sum and the count.
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * len(buckets) + [0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    values[index] += 1
+                    break
+            values[-2] += value
+            values[-1] += 1
+
+    def flush(self):
+        """Write the values of this process to the metrics directory."""
+        with self._lock:
+            if self._pid != os.getpid() or not self._dirty:
+                return
+            content = json.dumps(self._values)
+            self._dirty = False
+        directory = settings.METRICS_DIR
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+            with os.fdopen(fd, 'w') as tmp_file:
+                tmp_file.write(content)
+            os.replace(tmp_path, os.path.join(directory, f'{self._pid}.json'))
+        except OSError:
+            self._dirty = True
+            logger.exception('Could not write the metrics to %s', directory)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+
+registry = Registry()
+
+
+def collect():
+    """Return the values of all processes, added up by metric and labels."""
+    registry.flush()
+    totals = {}
+    directory = settings.METRICS_DIR
+    try:
+        names = [
+            name for name in os.listdir(directory)
+            if name.endswith('.json') and not name.startswith('.')
+        ]
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name)) as metrics_file:
+                values = json.load(metrics_file)
+        except (OSError, ValueError):
+            continue
+        for metric, series in values.items():
+            if metric not in METRICS:
+                continue
+            merged = totals.setdefault(metric, {})
+            for key, value in series.items():
+                if isinstance(value, list):
+                    previous = merged.get(key, [0] * len(value))
+                    merged[key] = [a + b for a, b in zip(previous, value)]
+                else:
+                    merged[key] = merged.get(key, 0) + value
+    return totals
+
+
+def _format_labels(labels):
+    """Return the label pairs as written after a metric name."""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace(
+            '"', '\\"',
+        ).replace('\n', '\\n')
+
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        f'{name}="{escape(value)}"' for name, value in labels
+    )
+
+
+def _format_number(value):
+    """Return a number as written in the exposition format."""
+    if isinstance(value, float) and value.is_integer():
+        return repr(int(value))
+    return repr(value)
+
+
+def render(totals):
+    """Return the metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key, value in sorted(totals.get(name, {}).items()):
+            labels = [tuple(pair) for pair in json.loads(key)]
+            if kind != 'histogram':
+                lines.append(
+                    f'{name}{_format_labels(labels)} {_format_number(value)}'
+                )
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                bucket_labels = labels + [('le', _format_number(bound))]
+                lines.append(
+                    f'{name}_bucket{_format_labels(bucket_labels)} '
+                    f'{cumulative}'
+                )
+            bucket_labels = labels + [('le', '+Inf')]
+            lines.append(
+                f'{name}_bucket{_format_labels(bucket_labels)} {value[-1]}'
+            )
+            lines.append(
+                f'{name}_sum{_format_labels(labels)} '
+                f'{_format_number(value[-2])}'
+            )
+            lines.append(
+                f'{name}_count{_format_labels(labels)} {value[-1]}'
+            )
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Count requests and measure their latency, SQL time and size."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        request.metrics_view = UNMATCHED_VIEW
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        labels = {'view': request.metrics_view, 'method': request.method}
+        registry.inc('http_requests_total', {
+            **labels, 'status': str(response.status_code),
+        })
+        registry.observe('http_request_duration_seconds', labels, duration)
+        recorder = getattr(request, 'query_recorder', None)
+        if recorder is not None:
+            registry.observe(
+                'http_request_db_seconds', labels, recorder.duration,
+            )
+            registry.inc(
+                'http_request_db_queries_total', labels, recorder.count,
+            )
+        if not response.streaming:
+            registry.observe(
+                'http_response_bytes', labels, len(response.content),
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'metrics_view'):
+            request.metrics_view = view_name(
+                view_func, request.method.lower(),
+            )
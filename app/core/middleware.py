@@ -0,0 +1,227 @@
+"""
+Per-request SQL instrumentation.
+
+Every query a request runs goes through `connection.execute_wrapper`,
+which counts it, times it and groups it by shape: the statement with its
+literals and parameter lists taken out. A shape repeated past the
+threshold is the mark of an N+1 pattern, and is reported with the
+serializer and the line of project code that ran it. The totals are sent
+back in a `Server-Timing` header and logged as a JSON line.
+
+Views declare their budget with a `query_budget` attribute, a number or
+a dict by viewset action (or lower case HTTP method for plain views).
+Views whose queries grow with the request, by batch rather than by row,
+add to it with extend_query_budget().
+Going over it is logged, and raises QueryBudgetExceeded in strict mode,
+which the test runner turns on. Queries run while a streaming response
+is iterated are not counted, the response has left the middleware then.
+"""
+import json
+import logging
+import re
+import sys
+import time
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+logger = logging.getLogger(__name__)
+
+SHAPE_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    # IN lists and VALUES rows vary in length with the data, not the code.
+    (re.compile(r'\?(?:\s*,\s*\?)+'), '?, ...'),
+    (re.compile(r'(\(\?(?:, \.\.\.)?\))(?:\s*,\s*\(\?(?:, \.\.\.)?\))+'),
+     r'\1'),
+    (re.compile(r'\s+'), ' '),
+]
+
+SAVEPOINT_PATTERN = re.compile(
+    r'(?:RELEASE |ROLLBACK TO )?SAVEPOINT ', re.IGNORECASE,
+)
+
+
+class QueryBudgetExceeded(Exception):
+    """A view ran more queries than its declared budget."""
+
+
+def query_shape(sql):
+    """Return the statement with its literals and parameters taken out."""
+    for pattern, replacement in SHAPE_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def _serializer_path(serializer):
+    """Return the root serializer's name and the fields down to one."""
+    names = []
+    while serializer.parent is not None:
+        if serializer.field_name:
+            names.append(serializer.field_name)
+        serializer = serializer.parent
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    names.append(type(serializer).__name__)
+    return '.'.join(reversed(names))
+
+
+def _query_origin():
+    """Return the serializer and project line running the current query."""
+    serializer = source = None
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None and not (serializer and source):
+        code = frame.f_code
+        if source is None and code.co_filename.startswith(base_dir) \
+                and code.co_filename != __file__:
+            path = code.co_filename[len(base_dir):].lstrip('/')
+            source = f'{path}:{frame.f_lineno}'
+        owner = frame.f_locals.get('self')
+        if serializer is None and isinstance(owner, BaseSerializer):
+            serializer = _serializer_path(owner)
+        frame = frame.f_back
+    return serializer, source
+
+
+class QueryRecorder:
+    """Execute wrapper counting and timing queries by shape.
+
+    A request run inside a transaction, as every test is, turns its
+    outermost atomic blocks into savepoints. Those statements stand for
+    a BEGIN and COMMIT, which are not run through execute, so they are
+    not counted: `depth` is the number of savepoints open when the
+    request starts.
+    """
+
+    def __init__(self, threshold, depth=0):
+        self.threshold = threshold
+        self.depth = depth
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = {}
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if len(context['connection'].savepoint_ids) == self.depth \
+                and SAVEPOINT_PATTERN.match(sql):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            shape = query_shape(sql)
+            seen = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+            # The stack is walked once per repeated shape, not per query.
+            if seen == self.threshold:
+                self.origins[shape] = _query_origin()
+
+    def repeated(self):
+        """Return the shapes run at least threshold times."""
+        return [
+            {
+                'sql': shape,
+                'count': self.shapes[shape],
+                'serializer': serializer,
+                'source': source,
+            }
+            for shape, (serializer, source) in self.origins.items()
+        ]
+
+
+def view_name(view_func, method):
+    """Return the name of a view, with its action or method for classes."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__qualname__', repr(view_func))
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(method, method)}'
+
+
+def _query_budget(view_func, method):
+    """Return the query budget a view declares for a method, or None."""
+    cls = getattr(view_func, 'cls', None)
+    budget = getattr(cls, 'query_budget', None)
+    if isinstance(budget, dict):
+        actions = getattr(view_func, 'actions', None) or {}
+        budget = budget.get(actions.get(method, method))
+    return budget
+
+
+def extend_query_budget(request, queries):
+    """Allow a request more queries than its view's budget."""
+    request = getattr(request, '_request', request)
+    view, budget = getattr(request, 'query_view', (None, None))
+    if budget is not None:
+        request.query_view = (view, budget + queries)
+
+
+class QueryInstrumentationMiddleware:
+    """Count, time and attribute the queries of each request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SQL_INSTRUMENTATION:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(
+            settings.SQL_REPEATED_QUERY_THRESHOLD,
+            len(connection.savepoint_ids),
+        )
+        request.query_recorder = recorder
+        request.query_view = (None, None)
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view, budget = request.query_view
+        over_budget = budget is not None and recorder.count > budget
+        repeated = recorder.repeated()
+        self._add_header(response, recorder, duration)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'total_ms': round(duration * 1000, 2),
+            'budget': budget,
+            'repeated': repeated,
+        }
+        logger.log(
+            logging.WARNING if over_budget or repeated else logging.INFO,
+            json.dumps(record),
+        )
+        if over_budget and settings.SQL_QUERY_BUDGETS_STRICT:
+            raise QueryBudgetExceeded(
+                f'{view} ran {recorder.count} queries, its budget is '
+                f'{budget}.'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'query_recorder'):
+            method = request.method.lower()
+            request.query_view = (
+                view_name(view_func, method),
+                _query_budget(view_func, method),
+            )
+
+    def _add_header(self, response, recorder, duration):
+        """Append the database and total times to Server-Timing."""
+        timings = [
+            f'db;dur={recorder.duration * 1000:.2f};'
+            f'desc="{recorder.count} queries"',
+            f'total;dur={duration * 1000:.2f}',
+        ]
+        if response.has_header('Server-Timing'):
+            timings.insert(0, response['Server-Timing'])
+        response['Server-Timing'] = ', '.join(timings)
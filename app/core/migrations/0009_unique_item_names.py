@@ -0,0 +1,78 @@
+# Generated by Django 3.2.25 on 2026-10-17 10:02
+
+from django.db import migrations, models
+
+
+# The unique indexes are built without blocking writes, then attached as
+# constraints, which only takes a brief lock.
+UNIQUE_INDEXES = [
+    ('core_tag', 'core_tag_user_name_uniq'),
+    ('core_ingredient', 'core_ingredient_user_name_uniq'),
+]
+
+DUPLICATES_SQL = """
+SELECT count(*) FROM (
+    SELECT 1 FROM {table} GROUP BY user_id, name HAVING count(*) > 1
+) AS duplicates
+"""
+
+
+def check_no_duplicates(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table, _ in UNIQUE_INDEXES:
+            cursor.execute(DUPLICATES_SQL.format(table=table))
+            if cursor.fetchone()[0]:
+                raise RuntimeError(
+                    f'{table} has duplicate names, run '
+                    f'`manage.py merge_duplicate_items` first.'
+                )
+
+
+def unique_index_operations():
+    operations = []
+    for table, name in UNIQUE_INDEXES:
+        operations += [
+            migrations.RunSQL(
+                f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                f'ON {table} (user_id, name)',
+                f'DROP INDEX CONCURRENTLY IF EXISTS {name}',
+            ),
+            migrations.RunSQL(
+                f'ALTER TABLE {table} ADD CONSTRAINT {name} '
+                f'UNIQUE USING INDEX {name}',
+                f'ALTER TABLE {table} DROP CONSTRAINT {name}',
+            ),
+        ]
+    return operations
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_duplicates, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=unique_index_operations(),
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='tag',
+                    constraint=models.UniqueConstraint(
+                        fields=('user', 'name'),
+                        name='core_tag_user_name_uniq',
+                    ),
+                ),
+                migrations.AddConstraint(
+                    model_name='ingredient',
+                    constraint=models.UniqueConstraint(
+                        fields=('user', 'name'),
+                        name='core_ingredient_user_name_uniq',
+                    ),
+                ),
+            ],
+        ),
+    ]
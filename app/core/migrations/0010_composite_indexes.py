@@ -0,0 +1,61 @@
+# Generated by Django 3.2.25 on 2026-10-17 11:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+# Item to recipe lookups (assigned_only, usage counts) on the link tables,
+# which Django only indexes per column.
+REVERSE_INDEXES = [
+    ('core_recipe_tags', 'tag_id', 'core_recipe_tags_tag_recipe_idx'),
+    (
+        'core_recipe_ingredients',
+        'ingredient_id',
+        'core_recipe_ingredients_ingredient_recipe_idx',
+    ),
+]
+
+
+def reverse_index_operations():
+    return [
+        migrations.RunSQL(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+            f'ON {table} ({column}, recipe_id)',
+            f'DROP INDEX CONCURRENTLY IF EXISTS {name}',
+        )
+        for table, column, name in REVERSE_INDEXES
+    ]
+
+
+class Migration(migrations.Migration):
+
+    # The indexes are built without blocking writes.
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_unique_item_names'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(
+                fields=['user', '-id'], name='core_recipe_user_id_desc_idx',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='tag',
+            index=models.Index(
+                fields=['user', 'name', 'id'],
+                name='core_tag_user_name_id_idx',
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='ingredient',
+            index=models.Index(
+                fields=['user', 'name', 'id'],
+                name='core_ingr_user_name_id_idx',
+            ),
+        ),
+        *reverse_index_operations(),
+    ]
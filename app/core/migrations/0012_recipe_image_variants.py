@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:38
+
+from django.db import migrations, models
+
+
+# Rows inserted with raw SQL, such as the dataset and import commands'
+# COPY statements, get no variants without naming the column.
+SET_DEFAULT_SQL = """
+ALTER TABLE core_recipe ALTER COLUMN image_variants SET DEFAULT '{}'::jsonb;
+"""
+
+DROP_DEFAULT_SQL = """
+ALTER TABLE core_recipe ALTER COLUMN image_variants DROP DEFAULT;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.RunSQL(SET_DEFAULT_SQL, DROP_DEFAULT_SQL),
+    ]
@@ -6,7 +6,13 @@ import uuid
 import os
 
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.contrib.postgres.aggregates import StringAgg
+from django.db import models, router, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -51,13 +57,208 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Bumped by core.signals on any write to the user's recipe data.
+    content_updated_at = models.DateTimeField(default=timezone.now)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
 
-class Recipe(models.Model):
+# Text search configuration of the recipe search vector.
+SEARCH_CONFIG = 'english'
+
+
+def _related_names(model):
+    """Return a subquery of the space separated names linked to a recipe."""
+    return models.Subquery(
+        model.objects.filter(
+            recipe=models.OuterRef('pk'),
+        ).values('recipe').annotate(
+            names=StringAgg('name', ' '),
+        ).values('names')
+    )
+
+
+class ArraySubquery(models.Subquery):
+    """Collect the rows of a single column subquery into an array.
+
+    The array follows the ordering of the queryset, which Django drops
+    from other subqueries.
+    """
+    template = 'ARRAY(%(subquery)s)'
+
+    def __init__(self, queryset, **extra):
+        output_field = ArrayField(models.BigIntegerField())
+        super().__init__(queryset, output_field=output_field, **extra)
+
+    def resolve_expression(self, *args, **kwargs):
+        ordering = self.query.order_by
+        resolved = super().resolve_expression(*args, **kwargs)
+        resolved.query.add_ordering(*ordering)
+        return resolved
+
+
+def _linked_ids(through, column):
+    """Return the sorted ids linked to a recipe in a through-table."""
+    return ArraySubquery(
+        through.objects.filter(
+            recipe=models.OuterRef('pk'),
+        ).order_by(column).values(column)
+    )
+
+
+def search_vector():
+    """Return the search vector expression of a recipe.
+
+    Titles weigh most, then tag and ingredient names, then the
+    description.
+    """
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+        SearchVector(
+            _related_names(Tag), weight='B', config=SEARCH_CONFIG,
+        ) +
+        SearchVector(
+            _related_names(Ingredient), weight='B', config=SEARCH_CONFIG,
+        ) +
+        SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def relation_ids():
+    """Return the expressions of the denormalized relation id arrays."""
+    return {
+        'tag_ids': _linked_ids(Recipe.tags.through, 'tag_id'),
+        'ingredient_ids': _linked_ids(
+            Recipe.ingredients.through, 'ingredient_id',
+        ),
+    }
+
+
+# Sent once by each delete of owned rows, with the ids of their owners and
+# of the recipes linked to them, see OwnedQuerySet.delete.
+owned_rows_deleted = Signal()
+
+
+class OwnedQuerySet(models.QuerySet):
+    """Define queries over rows owned by a user."""
+
+    def linked_recipe_ids(self):
+        """Return the ids of the recipes linking to the rows."""
+        return set()
+
+    def delete(self):
+        """Delete the rows, then refresh what depended on them once.
+
+        Nothing receives pre_delete or post_delete for these models: any
+        receiver makes Django load and signal every row of a cascade
+        instead of deleting it with one query. Deleting the owner thus
+        drops their rows in a few queries, and leaves nothing to refresh.
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            owner_ids = set(
+                self.order_by().values_list('user_id', flat=True).distinct()
+            )
+            recipe_ids = self.linked_recipe_ids()
+            deleted = super().delete()
+            owned_rows_deleted.send(
+                sender=self.model, owner_ids=owner_ids,
+                recipe_ids=recipe_ids, using=self.db,
+            )
+        return deleted
+
+
+class ItemQuerySet(OwnedQuerySet):
+    """Define queries over tags and ingredients."""
+
+    def linked_recipe_ids(self):
+        return set(
+            self.order_by().filter(recipe__isnull=False)
+            .values_list('recipe', flat=True).distinct()
+        )
+
+
+class RecipeQuerySet(OwnedQuerySet):
+    """Define queries over recipes."""
+
+    def update_search_vector(self):
+        """Recompute the search vector of the recipes in one update."""
+        return self.update(search_vector=search_vector())
+
+    def update_relation_ids(self):
+        """Recompute the tag and ingredient id arrays in one update."""
+        return self.update(**relation_ids())
+
+    def update_relation_data(self):
+        """Recompute every field derived from tags and ingredients."""
+        return self.update(
+            search_vector=search_vector(),
+            updated_at=timezone.now(),
+            **relation_ids(),
+        )
+
+    def update_linked_names(self):
+        """Recompute the search vector after a linked item is renamed."""
+        return self.update(
+            search_vector=search_vector(),
+            updated_at=timezone.now(),
+        )
+
+    def out_of_sync(self):
+        """Return recipes whose id arrays disagree with their links."""
+        expected = relation_ids()
+        return self.annotate(
+            expected_tag_ids=expected['tag_ids'],
+            expected_ingredient_ids=expected['ingredient_ids'],
+        ).exclude(
+            tag_ids=models.F('expected_tag_ids'),
+            ingredient_ids=models.F('expected_ingredient_ids'),
+        )
+
+
+class TrackedModel(models.Model):
+    """A model recording when each of its rows last changed."""
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        """Save the row, always refreshing its modification time.
+
+        Partial saves, including those Django makes for instances loaded
+        with deferred fields, would otherwise leave `updated_at` behind.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding:
+            deferred = self.get_deferred_fields()
+            if deferred:
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred
+                ]
+        if update_fields:
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        super().save(*args, **kwargs)
+
+    def delete(self, using=None, keep_parents=False):
+        """Delete the row, sending owned_rows_deleted like its queryset."""
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            recipe_ids = type(self)._default_manager.using(using).filter(
+                pk=self.pk,
+            ).linked_recipe_ids()
+            deleted = super().delete(using, keep_parents)
+            owned_rows_deleted.send(
+                sender=type(self), owner_ids={self.user_id},
+                recipe_ids=recipe_ids, using=using,
+            )
+        return deleted
+
+
+class Recipe(TrackedModel):
     """Define the recipe object."""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -71,12 +272,56 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Resized copies of the image by size, written by recipe.images.
+    image_variants = models.JSONField(default=dict, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Sorted copies of the linked ids, kept in sync by core.signals.
+    tag_ids = ArrayField(
+        models.BigIntegerField(), default=list, editable=False,
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(), default=list, editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    # Columns only written by queryset updates.
+    DERIVED_FIELDS = (
+        'search_vector', 'tag_ids', 'ingredient_ids', 'image_variants',
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector']),
+            GinIndex(fields=['tag_ids']),
+            GinIndex(fields=['ingredient_ids']),
+            # A user's recipes, newest first.
+            models.Index(
+                fields=['user', '-id'], name='core_recipe_user_id_desc_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return str(self.title)
 
+    def save(self, *args, **kwargs):
+        """Save the recipe without overwriting the derived columns.
+
+        The in-memory copies of derived columns go stale as soon as the
+        relations change, so updates never write them back.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DERIVED_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
 
-class Tag(models.Model):
+
+class Tag(TrackedModel):
     """Define the tags fror filetering recipes."""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -84,11 +329,28 @@ class Tag(models.Model):
     )
     name = models.CharField(max_length=16)
 
+    objects = ItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='core_tag_user_name_uniq',
+            ),
+        ]
+        indexes = [
+            # The unique index lacks the id ending the keyset ordering,
+            # so listing a user's items would still sort without this.
+            models.Index(
+                fields=['user', 'name', 'id'],
+                name='core_tag_user_name_id_idx',
+            ),
+        ]
+
     def __str__(self) -> str:
         return str(self.name)
 
 
-class Ingredient(models.Model):
+class Ingredient(TrackedModel):
     """Define ingredient for recipes."""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -96,5 +358,41 @@ class Ingredient(models.Model):
     )
     name = models.CharField(max_length=128)
 
+    objects = ItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='core_ingredient_user_name_uniq',
+            ),
+        ]
+        indexes = [
+            # The unique index lacks the id ending the keyset ordering,
+            # so listing a user's items would still sort without this.
+            models.Index(
+                fields=['user', 'name', 'id'],
+                name='core_ingr_user_name_id_idx',
+            ),
+        ]
+
     def __str__(self) -> str:
         return str(self.name)
+
+
+class RevokedToken(models.Model):
+    """A signed token rejected until it expires, see user.tokens."""
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return str(self.jti)
+
+
+class ImportCheckpoint(models.Model):
+    """The last input line an import committed, see import_recipes."""
+    name = models.CharField(max_length=255, unique=True)
+    line = models.PositiveIntegerField()
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.line}'
@@ -0,0 +1,227 @@
+"""
+On-demand profiling of single requests.
+
+A staff user asks for a profile by sending `X-Profile: cpu`, or
+`X-Profile: memory` to trace allocations as well. Requests are also
+picked at random at the PROFILE_SAMPLE_RATE. A profiled request runs
+under cProfile (and tracemalloc), and its results are written to
+PROFILE_DIR as `<id>.prof`, a pstats dump, and `<id>.txt`, a readable
+report. The id comes back in the `X-Profile-Id` header, and staff users
+download both files from the profile artifact view.
+
+Profilers are process wide, so a request is only profiled while no
+other one is. Under uwsgi each worker profiles on its own and the files
+are shared through the directory. Requests that are not profiled only
+pay for a header lookup, and a random draw when sampling is on.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.urls import reverse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+MODES = ('cpu', 'memory')
+# Ids are also file names, client supplied request ids must fit.
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,31}')
+ARTIFACT_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}\.(prof|txt)$')
+
+_profiler_lock = threading.Lock()
+
+
+def _request_id(request):
+    """Return a new id for a profile, after the client's request id.
+
+    The random part keeps clients from naming, and so overwriting,
+    another request's files. Request ids unfit for a file name are left
+    out.
+    """
+    profile_id = uuid.uuid4().hex
+    request_id = request.META.get('HTTP_X_REQUEST_ID', '')
+    if REQUEST_ID_PATTERN.fullmatch(request_id):
+        return f'{request_id}-{profile_id}'
+    return profile_id
+
+
+def _is_staff(request):
+    """Return whether the request is made by a staff user.
+
+    Profiling is asked for before the view authenticates the request, so
+    session users are read from the request and tokens checked here.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        result = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return result is not None and result[0].is_staff
+
+
+def artifact_path(name):
+    """Return the path of a profile artifact, or None for a bad name."""
+    if not ARTIFACT_PATTERN.match(name):
+        return None
+    return os.path.join(settings.PROFILE_DIR, name)
+
+
+class ArtifactStore:
+    """Profile artifacts kept as files, the newest PROFILE_MAX_ARTIFACTS."""
+
+    def __init__(self, location, max_artifacts):
+        self.location = location
+        self.max_artifacts = max_artifacts
+
+    def save(self, request_id, profiler, report):
+        """Write the pstats dump and report of a request."""
+        os.makedirs(self.location, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, prefix='.tmp')
+        os.close(fd)
+        profiler.dump_stats(tmp_path)
+        os.replace(tmp_path, os.path.join(self.location, f'{request_id}.prof'))
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, prefix='.tmp')
+        with os.fdopen(fd, 'w') as report_file:
+            report_file.write(report)
+        os.replace(tmp_path, os.path.join(self.location, f'{request_id}.txt'))
+        self._cull()
+
+    def _cull(self):
+        """Remove the oldest profiles above the bound."""
+        with os.scandir(self.location) as entries:
+            files = [
+                entry for entry in entries
+                if entry.name.endswith('.txt')
+                and not entry.name.startswith('.')
+            ]
+        excess = len(files) - self.max_artifacts
+        if excess <= 0:
+            return
+
+        def mtime(entry):
+            try:
+                return entry.stat().st_mtime
+            except OSError:
+                return 0
+
+        for entry in sorted(files, key=mtime)[:excess]:
+            stem = entry.path[:-len('.txt')]
+            for path in (f'{stem}.txt', f'{stem}.prof'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class ProfilingMiddleware:
+    """Run requests asked for or sampled under the profilers."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = self._mode(request)
+        if mode is None or not _profiler_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self._profile(request, mode)
+        finally:
+            _profiler_lock.release()
+
+    def _mode(self, request):
+        """Return the profiling mode of a request, None if not profiled."""
+        asked = request.META.get(PROFILE_HEADER)
+        if asked:
+            if asked in MODES and _is_staff(request):
+                return asked
+            return None
+        rate = settings.PROFILE_SAMPLE_RATE
+        if rate and random.random() < rate:
+            return 'memory' if settings.PROFILE_SAMPLE_MEMORY else 'cpu'
+        return None
+
+    def _profile(self, request, mode):
+        request_id = _request_id(request)
+        profiler = cProfile.Profile()
+        trace_memory = mode == 'memory' and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler, such as a coverage tool, holds the hook.
+            if trace_memory:
+                tracemalloc.stop()
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - start
+            snapshot = None
+            if trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+        report = self._report(request, response, duration, profiler)
+        if snapshot is not None:
+            report += self._memory_report(snapshot, peak)
+        try:
+            ArtifactStore(
+                settings.PROFILE_DIR, settings.PROFILE_MAX_ARTIFACTS,
+            ).save(request_id, profiler, report)
+        except OSError:
+            logger.exception('Could not save the profile of %s', request_id)
+            return response
+
+        logger.info(json.dumps({
+            'profile': request_id,
+            'method': request.method,
+            'path': request.path,
+            'mode': mode,
+            'total_ms': round(duration * 1000, 2),
+        }))
+        response['X-Profile-Id'] = request_id
+        response['X-Profile-Url'] = reverse(
+            'profile-artifact', args=[f'{request_id}.txt'],
+        )
+        return response
+
+    def _report(self, request, response, duration, profiler):
+        """Return the readable report of the profiled request."""
+        stream = io.StringIO()
+        stream.write(
+            f'{request.method} {request.get_full_path()} '
+            f'{response.status_code} in {duration * 1000:.1f}ms\n\n'
+        )
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(
+            settings.PROFILE_REPORT_LINES,
+        )
+        return stream.getvalue()
+
+    def _memory_report(self, snapshot, peak):
+        """Return the allocations still held, by line."""
+        lines = [f'\nMemory peak {peak / 1024:.0f}KiB, held by line:\n']
+        for stat in snapshot.statistics('lineno')[
+            :settings.PROFILE_REPORT_LINES
+        ]:
+            lines.append(f'{stat}\n')
+        return ''.join(lines)
@@ -0,0 +1,111 @@
+"""
+Signal handlers keeping derived recipe data current.
+
+The search vector and the tag/ingredient id arrays of a recipe are
+recomputed inside the transaction of the write that changed them, and
+the modification times read by conditional requests move with them.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from core.models import Recipe, Tag, Ingredient, owned_rows_deleted
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector_on_save(sender, instance, update_fields, **kwargs):
+    """Refresh the search vector after the recipe text changes."""
+    if update_fields and not {'title', 'description'} & set(update_fields):
+        return
+    Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_search_vector_on_rename(sender, instance, created, **kwargs):
+    """Refresh the search vectors of the recipes using a renamed item."""
+    if created:
+        return
+    instance.recipe_set.all().update_linked_names()
+
+
+def collect_linked_recipes(sender, instance, **kwargs):
+    """Remember the recipes of an item before its links are cleared."""
+    instance._linked_recipe_ids = list(
+        instance.recipe_set.values_list('pk', flat=True)
+    )
+
+
+@receiver(owned_rows_deleted)
+def update_relation_data_on_delete(sender, recipe_ids, **kwargs):
+    """Refresh the derived fields of the recipes that used deleted items."""
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update_relation_data()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_relation_data_on_relink(sender, instance, action, reverse,
+                                   pk_set, **kwargs):
+    """Refresh the derived fields of recipes linked or unlinked."""
+    if action == 'pre_clear' and reverse:
+        # A reverse clear does not report the recipes it unlinks.
+        collect_linked_recipes(sender, instance)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'post_clear':
+        recipe_ids = getattr(instance, '_linked_recipe_ids', [])
+    else:
+        recipe_ids = pk_set
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update_relation_data()
+
+
+# Sent with the ids of users whose recipe data changed, once it is marked
+# modified. Apps keeping copies of that data, such as the response cache
+# of the recipe app, drop them on it.
+owners_touched = Signal()
+
+
+def touch_owner(user_id):
+    """Mark a user's recipe data modified.
+
+    Bulk writes that send no signals call this once themselves.
+    """
+    touch_owners([user_id])
+
+
+def touch_owners(user_ids):
+    """Mark the recipe data of several users modified in one update."""
+    get_user_model().objects.filter(pk__in=user_ids).update(
+        content_updated_at=timezone.now(),
+    )
+    owners_touched.send(sender=get_user_model(), user_ids=user_ids)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_owner_on_write(sender, instance, **kwargs):
+    """Mark the owner's collections modified."""
+    touch_owner(instance.user_id)
+
+
+@receiver(owned_rows_deleted)
+def touch_owners_on_delete(sender, owner_ids, **kwargs):
+    """Mark the collections of the owners of deleted rows modified."""
+    if owner_ids:
+        touch_owners(owner_ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_owner_on_relink(sender, instance, action, **kwargs):
+    """Mark the owner's collections modified after relinking."""
+    if action.startswith('post_'):
+        touch_owner_on_write(sender, instance)
@@ -0,0 +1,34 @@
+"""
+Test runner for the app.
+"""
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+from core import metrics
+
+
+class TestRunner(DiscoverRunner):
+    """Run the tests with the views' query budgets enforced.
+
+    Metrics are written to a temporary directory, removed afterwards.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._saved = {
+            name: getattr(settings, name)
+            for name in ('SQL_QUERY_BUDGETS_STRICT', 'METRICS_DIR')
+        }
+        settings.SQL_QUERY_BUDGETS_STRICT = True
+        settings.METRICS_DIR = tempfile.mkdtemp()
+
+    def teardown_test_environment(self, **kwargs):
+        # Nothing is left for the flushing thread to write elsewhere.
+        metrics.registry.flush()
+        shutil.rmtree(settings.METRICS_DIR, ignore_errors=True)
+        for name, value in self._saved.items():
+            setattr(settings, name, value)
+        super().teardown_test_environment(**kwargs)
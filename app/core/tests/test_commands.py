@@ -1,14 +1,23 @@
 """
 Test custom Django commands.
 """
-
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, models
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+
+from core.models import ImportCheckpoint, Recipe, Tag
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -31,3 +40,330 @@ class CommandTest(SimpleTestCase):
         call_command('wait_for_db')
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class BenchmarkCommandTest(TestCase):
+    """Test benchmark commands."""
+
+    def test_benchmark_recipe_filters(self):
+        """Test the filter benchmark reports each plan and cleans up."""
+        out = StringIO()
+        call_command(
+            'benchmark_recipe_filters',
+            rows=200, tags=20, repeat=1, stdout=out,
+        )
+
+        output = out.getvalue()
+        self.assertIn('all: array contains', output)
+        self.assertIn('any: array overlap', output)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_benchmark_recipe_list(self):
+        """Test the list benchmark reports both renderers and cleans up."""
+        out = StringIO()
+        call_command(
+            'benchmark_recipe_list',
+            recipes=50, tags=5, repeat=1, stdout=out,
+        )
+
+        output = out.getvalue()
+        self.assertIn('RecipeSerializer', output)
+        self.assertIn('FastRecipeList', output)
+        self.assertIn('Speedup', output)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_benchmark_endpoints(self):
+        """Test endpoint results are written and checked against budgets."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = os.path.join(directory.name, 'results.json')
+        budgets = os.path.join(directory.name, 'budgets.json')
+        # Timings vary between runs, only the query budget may fail here.
+        options = {
+            'sizes': '2', 'users': 2, 'repeat': 2, 'threshold': 100,
+            'stdout': StringIO(),
+        }
+
+        call_command(
+            'benchmark_endpoints', budgets=budgets, update_budgets=True,
+            output=output, **options,
+        )
+        call_command('benchmark_endpoints', budgets=budgets, **options)
+
+        with open(output) as file:
+            results = json.load(file)['results']
+        self.assertIn('user-me', {result['endpoint'] for result in results})
+        self.assertFalse(Recipe.objects.exists())
+        with open(budgets) as file:
+            recorded = json.load(file)
+        recorded['recipe-list']['2']['queries'] = 0
+        with open(budgets, 'w') as file:
+            json.dump(recorded, file)
+        with self.assertRaisesMessage(CommandError, 'recipe-list size=2'):
+            call_command('benchmark_endpoints', budgets=budgets, **options)
+
+    def test_benchmark_auth(self):
+        """Test each authentication is timed and the user rolled back."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = os.path.join(directory.name, 'results.json')
+
+        call_command(
+            'benchmark_auth', iterations=5, output=output, stdout=StringIO(),
+        )
+
+        with open(output) as file:
+            results = {
+                result['authentication']: result
+                for result in json.load(file)['results']
+            }
+        self.assertEqual(results['token']['queries'], 1)
+        self.assertEqual(results['cached-token']['queries'], 0)
+        self.assertIn('signed', results)
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class SyncRecipeRelationsCommandTest(TestCase):
+    """Test syncing the recipe relation id arrays."""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('user@example.com')
+        self.recipe = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=10, price=Decimal('5.00'),
+        )
+        self.tag = Tag.objects.create(user=user, name='Vegan')
+        # Writing the through-table directly skips the sync signals.
+        Recipe.tags.through.objects.create(recipe=self.recipe, tag=self.tag)
+
+    def test_verify_reports_out_of_sync(self):
+        """Test verifying fails while arrays are out of sync."""
+        with self.assertRaises(CommandError):
+            call_command('sync_recipe_relations', verify=True,
+                         stdout=StringIO())
+
+    def test_backfill(self):
+        """Test the backfill repairs the arrays."""
+        call_command('sync_recipe_relations', batch_size=1, stdout=StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.tag_ids, [self.tag.id])
+        call_command('sync_recipe_relations', verify=True, stdout=StringIO())
+
+    def test_backfill_search_vector(self):
+        """Test the backfill gives recipes without one a search vector."""
+        Recipe.objects.update(search_vector=None)
+        with self.assertRaises(CommandError):
+            call_command('sync_recipe_relations', verify=True,
+                         stdout=StringIO())
+
+        call_command('sync_recipe_relations', batch_size=1, stdout=StringIO())
+
+        self.assertTrue(
+            Recipe.objects.filter(search_vector='vegan').exists(),
+        )
+
+
+class MergeDuplicateItemsCommandTest(TestCase):
+    """Test merging duplicate tags and ingredients."""
+
+    def setUp(self):
+        # Duplicates predate the constraint, drop it for this test only.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'ALTER TABLE core_tag DROP CONSTRAINT core_tag_user_name_uniq'
+            )
+        self.user = get_user_model().objects.create_user('user@example.com')
+        self.tags = [
+            Tag.objects.create(user=self.user, name='Vegan')
+            for _ in range(3)
+        ]
+        self.recipe1 = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        self.recipe1.tags.add(self.tags[0], self.tags[1])
+        self.recipe2 = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5,
+            price=Decimal('3.00'),
+        )
+        self.recipe2.tags.add(self.tags[2])
+
+    def test_merge(self):
+        """Test duplicates are merged into the oldest item."""
+        call_command('merge_duplicate_items', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            list(Tag.objects.values_list('pk', flat=True)),
+            [self.tags[0].pk],
+        )
+        for recipe in (self.recipe1, self.recipe2):
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.tag_ids, [self.tags[0].pk])
+            self.assertEqual(recipe.tags.count(), 1)
+        self.assertFalse(Recipe.objects.out_of_sync().exists())
+
+    def test_merge_keeps_other_users(self):
+        """Test items of different users are never merged."""
+        other = get_user_model().objects.create_user('other@example.com')
+        Tag.objects.create(user=other, name='Vegan')
+
+        call_command('merge_duplicate_items', stdout=StringIO())
+
+        self.assertEqual(Tag.objects.filter(name='Vegan').count(), 2)
+
+
+class ImportRecipesCommandTest(TestCase):
+    """Test importing recipes with COPY."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('user@example.com')
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'recipes.ndjson')
+        self.checkpoint = 'recipes'
+
+    def _write(self, *recipes):
+        with open(self.path, 'w') as file:
+            for recipe in recipes:
+                file.write(json.dumps(recipe) + '\n')
+
+    def _import(self, **options):
+        call_command(
+            'import_recipes', self.path, user='user@example.com',
+            checkpoint=self.checkpoint, stdout=StringIO(), **options,
+        )
+
+    def test_import(self):
+        """Test recipes, items and links are imported for the user."""
+        self._write(
+            {
+                'title': 'Curry', 'time_minutes': 30, 'price': '7.50',
+                'tags': [{'id': 999, 'name': 'Vegan'}, {'name': 'Spicy'}],
+                'ingredients': ['Rice', 'Chickpeas'],
+            },
+            {'title': 'Toast', 'time_minutes': 2, 'price': '1.00',
+             'tags': ['Spicy']},
+        )
+
+        self._import(batch_size=1)
+
+        curry = Recipe.objects.get(user=self.user, title='Curry')
+        self.assertEqual(curry.price, Decimal('7.50'))
+        self.assertEqual(
+            sorted(curry.tags.values_list('name', flat=True)),
+            ['Spicy', 'Vegan'],
+        )
+        self.assertIn(self.tag, curry.tags.all())
+        self.assertEqual(curry.ingredients.count(), 2)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(Recipe.objects.out_of_sync().exists())
+        self.assertTrue(
+            Recipe.objects.filter(search_vector='chickpeas').exists()
+        )
+
+    def test_resume(self):
+        """Test a failed import resumes after the last committed batch."""
+        good = {'title': 'Soup', 'time_minutes': 10, 'price': '3.00'}
+        self._write(good, good, {'title': 'Bad', 'price': '3.00'})
+
+        with self.assertRaisesMessage(CommandError, 'Line 3:'):
+            self._import(batch_size=2)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+        self._write(good, good, {**good, 'title': 'Fixed'})
+        self._import(batch_size=2)
+
+        self.assertEqual(
+            list(Recipe.objects.order_by('id').values_list(
+                'title', flat=True,
+            )),
+            ['Soup', 'Soup', 'Fixed'],
+        )
+        self.assertEqual(
+            ImportCheckpoint.objects.get(name=self.checkpoint).line, 3,
+        )
+
+    def test_checkpoint_with_batch(self):
+        """Test a batch is rolled back if its checkpoint is not recorded."""
+        self._write({'title': 'Soup', 'time_minutes': 10, 'price': '3.00'})
+
+        with patch.object(ImportCheckpoint.objects, 'update_or_create',
+                          side_effect=OperationalError), \
+                self.assertRaises(OperationalError):
+            self._import()
+        self.assertFalse(Recipe.objects.exists())
+
+        self._import()
+
+        self.assertEqual(Recipe.objects.count(), 1)
+
+
+class GenerateDatasetCommandTest(TestCase):
+    """Test generating synthetic datasets."""
+
+    def _generate(self, prefix, **options):
+        call_command(
+            'generate_dataset', users=4, recipes=5, tags=2, ingredients=3,
+            email_prefix=prefix, stdout=StringIO(), **options,
+        )
+        return [
+            [
+                (
+                    recipe.title,
+                    sorted(recipe.tags.values_list('name', flat=True)),
+                    sorted(recipe.ingredients.values_list('name', flat=True)),
+                )
+                for recipe in Recipe.objects.filter(user=user).order_by('id')
+            ]
+            for user in get_user_model().objects.filter(
+                email__startswith=prefix,
+            ).order_by('id')
+        ]
+
+    def test_generate(self):
+        """Test users get recipes linked to their own items."""
+        dataset = self._generate(
+            'gen', recipes_distribution='fixed', tags_distribution='fixed',
+        )
+
+        self.assertEqual(len(dataset), 4)
+        self.assertTrue(all(len(recipes) == 5 for recipes in dataset))
+        self.assertTrue(all(
+            len(tags) == 2 for recipes in dataset for _, tags, _ in recipes
+        ))
+        self.assertFalse(Recipe.objects.out_of_sync().exists())
+        self.assertFalse(Recipe.objects.filter(search_vector=None).exists())
+        self.assertFalse(
+            Recipe.tags.through.objects.exclude(
+                tag__user=models.F('recipe__user'),
+            ).exists()
+        )
+
+    def test_deterministic(self):
+        """Test the dataset depends on the seed, not on batching."""
+        first = self._generate('first', seed=7)
+        second = self._generate('second', seed=7, batch_size=1)
+        other = self._generate('other', seed=8)
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_images(self):
+        """Test recipes are given dummy image files."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with self.settings(MEDIA_ROOT=directory.name):
+            self._generate('gen', images=1.0)
+
+            recipes = Recipe.objects.all()
+            self.assertTrue(recipes)
+            for recipe in recipes:
+                self.assertTrue(os.path.exists(recipe.image.path))
+
+    def test_existing_users(self):
+        """Test generating for existing user names fails."""
+        self._generate('gen')
+
+        with self.assertRaises(CommandError):
+            self._generate('gen')
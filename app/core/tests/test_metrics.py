@@ -0,0 +1,162 @@
+"""
+Tests for the request metrics.
+"""
+import os
+import re
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import metrics
+
+METRICS_URL = reverse('metrics')
+HEALTH_CHECK_URL = reverse('health-check')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+SAMPLE_PATTERN = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+
+def scrape(client):
+    """Return the scraped samples by name and sorted label pairs."""
+    res = client.get(METRICS_URL)
+    samples = {}
+    for line in res.content.decode().splitlines():
+        if line.startswith('#'):
+            continue
+        name, labels, value = SAMPLE_PATTERN.match(line).groups()
+        pairs = tuple(sorted(re.findall(r'(\w+)="([^"]*)"', labels or '')))
+        samples[name, pairs] = float(value)
+    return samples
+
+
+def sample(samples, name, **labels):
+    """Return the value of a sample, zero when it is missing."""
+    return samples.get((name, tuple(sorted(labels.items()))), 0)
+
+
+class MetricsTests(TestCase):
+    """Test counting requests and exposing the metrics."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_request_metrics(self):
+        """Test requests are counted with their latency, SQL and size."""
+        labels = {'view': 'RecipeViewSet.list', 'method': 'GET'}
+        before = scrape(self.client)
+
+        res = self.client.get(RECIPES_URL)
+        after = scrape(self.client)
+
+        def delta(name, **extra):
+            return (
+                sample(after, name, **labels, **extra)
+                - sample(before, name, **labels, **extra)
+            )
+
+        self.assertEqual(delta('http_requests_total', status='200'), 1)
+        self.assertEqual(delta('http_request_duration_seconds_count'), 1)
+        self.assertEqual(
+            delta('http_request_duration_seconds_bucket', le='+Inf'), 1,
+        )
+        self.assertGreater(delta('http_request_duration_seconds_sum'), 0)
+        self.assertEqual(delta('http_request_db_seconds_count'), 1)
+        self.assertGreater(delta('http_request_db_queries_total'), 0)
+        self.assertEqual(
+            delta('http_response_bytes_sum'), len(res.content),
+        )
+
+    def test_status_codes(self):
+        """Test requests are counted by status code."""
+        before = scrape(self.client)
+
+        self.client.get(reverse('recipe:recipe-detail', args=[0]))
+        self.client.get('/api/missing/')
+        after = scrape(self.client)
+
+        for labels in (
+            {'view': 'RecipeViewSet.retrieve', 'status': '404'},
+            {'view': metrics.UNMATCHED_VIEW, 'status': '404'},
+        ):
+            self.assertEqual(
+                sample(after, 'http_requests_total', method='GET', **labels)
+                - sample(before, 'http_requests_total', method='GET',
+                         **labels),
+                1,
+            )
+
+    def test_cache_lookups(self):
+        """Test response cache hits and misses are counted."""
+        before = scrape(self.client)
+
+        self.client.get(RECIPES_URL, {'search': 'metrics'})
+        self.client.get(RECIPES_URL, {'search': 'metrics'})
+        after = scrape(self.client)
+
+        for result in ('hit', 'miss'):
+            self.assertEqual(
+                sample(after, 'response_cache_requests_total', result=result)
+                - sample(before, 'response_cache_requests_total',
+                         result=result),
+                1,
+            )
+
+    def test_aggregated_across_processes(self):
+        """Test the counts of every worker process are added up."""
+        labels = {'view': 'test', 'method': 'GET', 'status': '200'}
+        before = sample(scrape(self.client), 'http_requests_total', **labels)
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                metrics.registry.inc('http_requests_total', labels, 2)
+                metrics.registry.flush()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        metrics.registry.inc('http_requests_total', labels)
+
+        after = sample(scrape(self.client), 'http_requests_total', **labels)
+        self.assertEqual(after - before, 3)
+
+    def test_histogram_buckets(self):
+        """Test histogram buckets are cumulative."""
+        labels = {'view': 'test-buckets', 'method': 'GET'}
+        for size in (100, 300, 5000000):
+            metrics.registry.observe('http_response_bytes', labels, size)
+
+        samples = scrape(self.client)
+
+        def bucket(le):
+            return sample(samples, 'http_response_bytes_bucket', le=le,
+                          **labels)
+
+        self.assertEqual(bucket('256'), 1)
+        self.assertEqual(bucket('1024'), 2)
+        self.assertEqual(bucket('4194304'), 2)
+        self.assertEqual(bucket('+Inf'), 3)
+        self.assertEqual(
+            sample(samples, 'http_response_bytes_sum', **labels), 5000400,
+        )
+
+    def test_text_format(self):
+        """Test metrics are exposed in the Prometheus text format."""
+        res = self.client.get(METRICS_URL)
+
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        self.assertIn(
+            '# TYPE http_request_duration_seconds histogram',
+            res.content.decode(),
+        )
+
+    def test_local_only(self):
+        """Test the metrics are not answered to other addresses."""
+        res = self.client.get(METRICS_URL, REMOTE_ADDR='203.0.113.9')
+
+        self.assertEqual(res.status_code, 404)
@@ -0,0 +1,189 @@
+"""
+Tests for the SQL instrumentation middleware.
+"""
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+from rest_framework import serializers
+from rest_framework.generics import ListAPIView
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from core.middleware import QueryBudgetExceeded, query_shape
+from core.models import Recipe
+
+
+class OwnerSerializer(serializers.ModelSerializer):
+    """Serializer reading each recipe's owner with a query of its own."""
+    owner = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = ['id', 'owner']
+
+    def get_owner(self, recipe):
+        return get_user_model().objects.get(pk=recipe.user_id).email
+
+
+class OwnerListView(ListAPIView):
+    """A list view with an N+1 query pattern."""
+    serializer_class = OwnerSerializer
+    queryset = Recipe.objects.order_by('id')
+    permission_classes = []
+    query_budget = {'get': 4}
+
+
+class AtomicCountView(APIView):
+    """A view counting recipes inside nested atomic blocks."""
+    permission_classes = []
+    query_budget = {'get': 3}
+
+    def get(self, request):
+        with transaction.atomic():
+            with transaction.atomic():
+                count = Recipe.objects.count()
+        return Response({'count': count})
+
+
+urlpatterns = [
+    path('owners/', OwnerListView.as_view(), name='owners'),
+    path('atomic/', AtomicCountView.as_view(), name='atomic'),
+]
+
+
+def create_recipes(count):
+    """Create recipes of a user."""
+    user = get_user_model().objects.create_user('user@example.com')
+    for i in range(count):
+        Recipe.objects.create(
+            user=user,
+            title=f'Recipe {i}',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+
+
+def log_records(logs):
+    """Return the JSON records of captured log lines."""
+    return [json.loads(record.getMessage()) for record in logs.records]
+
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    SQL_INSTRUMENTATION=True,
+    SQL_REPEATED_QUERY_THRESHOLD=3,
+    SQL_QUERY_BUDGETS_STRICT=False,
+)
+class QueryInstrumentationMiddlewareTests(TestCase):
+    """Test per-request query counting."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_server_timing(self):
+        """Test the query count and times are sent in Server-Timing."""
+        create_recipes(2)
+
+        res = self.client.get(reverse('owners'))
+
+        timings = res['Server-Timing'].split(', ')
+        self.assertTrue(timings[0].startswith('db;dur='))
+        self.assertTrue(timings[0].endswith(';desc="3 queries"'))
+        self.assertTrue(timings[1].startswith('total;dur='))
+
+    def test_log_line(self):
+        """Test each request is logged as a JSON line."""
+        create_recipes(1)
+
+        with self.assertLogs('core.middleware', 'INFO') as logs:
+            self.client.get(reverse('owners'))
+
+        record, = log_records(logs)
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(record['view'], 'OwnerListView.get')
+        self.assertEqual(record['path'], '/owners/')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], 2)
+        self.assertEqual(record['budget'], 4)
+        self.assertEqual(record['repeated'], [])
+
+    def test_repeated_queries(self):
+        """Test an N+1 pattern is reported with its serializer."""
+        create_recipes(3)
+
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(reverse('owners'))
+
+        repeated, = log_records(logs)[0]['repeated']
+        self.assertEqual(repeated['count'], 3)
+        self.assertEqual(repeated['serializer'], 'OwnerSerializer')
+        self.assertTrue(
+            repeated['source'].startswith('core/tests/test_middleware.py:'),
+        )
+        self.assertIn('"core_user"."id" = ?', repeated['sql'])
+
+    def test_budget_exceeded_logged(self):
+        """Test going over the query budget is logged."""
+        create_recipes(4)
+
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            res = self.client.get(reverse('owners'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(log_records(logs)[0]['queries'], 5)
+
+    def test_budget_exceeded_strict(self):
+        """Test going over the query budget raises in strict mode."""
+        create_recipes(4)
+
+        with self.settings(SQL_QUERY_BUDGETS_STRICT=True), \
+                self.assertLogs('core.middleware', 'WARNING'), \
+                self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('owners'))
+
+    def test_budget_met_strict(self):
+        """Test a view within its budget passes in strict mode."""
+        create_recipes(2)
+
+        with self.settings(SQL_QUERY_BUDGETS_STRICT=True):
+            res = self.client.get(reverse('owners'))
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_outermost_savepoints_not_counted(self):
+        """Test only the savepoints the request would run are counted.
+
+        The test's transaction turns the outermost atomic block into a
+        savepoint, which runs as a transaction outside of tests.
+        """
+        with self.settings(SQL_QUERY_BUDGETS_STRICT=True), \
+                self.assertLogs('core.middleware', 'INFO') as logs:
+            res = self.client.get(reverse('atomic'))
+
+        self.assertEqual(res.status_code, 200)
+        # The count and the nested block's SAVEPOINT and RELEASE.
+        self.assertEqual(log_records(logs)[0]['queries'], 3)
+
+    def test_disabled(self):
+        """Test nothing is added when instrumentation is off."""
+        with self.settings(SQL_INSTRUMENTATION=False):
+            res = self.client.get(reverse('owners'))
+
+        self.assertFalse(res.has_header('Server-Timing'))
+
+    def test_query_shape(self):
+        """Test literals and parameter lists are taken out of shapes."""
+        self.assertEqual(
+            query_shape("SELECT * FROM t WHERE a = 'x' AND b IN (%s, %s)\n"
+                        "AND c = 12"),
+            'SELECT * FROM t WHERE a = ? AND b IN (?, ...) AND c = ?',
+        )
+        self.assertEqual(
+            query_shape('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+            query_shape('INSERT INTO t (a, b) VALUES (%s, %s)'),
+        )
@@ -4,7 +4,9 @@ Test custom user model.
 from decimal import Decimal
 from unittest.mock import patch
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 
 from core import models
@@ -95,3 +97,171 @@ class ModelTests(TestCase):
 
         file_path = models.recipe_image_file_path(None, 'example.jpg')
         self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
+
+
+class RecipeRelationIdsTests(TestCase):
+    """Test the denormalized relation id arrays of recipes."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.recipe = models.Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=4,
+            price=Decimal('6.98'),
+        )
+        self.tag1 = models.Tag.objects.create(user=self.user, name='Vegan')
+        self.tag2 = models.Tag.objects.create(user=self.user, name='Quick')
+
+    def assertTagIds(self, expected):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.tag_ids, sorted(expected))
+
+    def test_add_and_remove(self):
+        """Test adding and removing tags updates the array."""
+        self.recipe.tags.add(self.tag2, self.tag1)
+        self.assertTagIds([self.tag1.id, self.tag2.id])
+
+        self.recipe.tags.remove(self.tag1)
+        self.assertTagIds([self.tag2.id])
+
+    def test_sorted_whatever_the_plan(self):
+        """Test the array is sorted when the links are read unordered."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SET LOCAL enable_indexscan = off; '
+                'SET LOCAL enable_bitmapscan = off'
+            )
+        self.recipe.tags.add(self.tag2)
+        self.recipe.tags.add(self.tag1)
+        self.assertTagIds([self.tag1.id, self.tag2.id])
+
+    def test_clear(self):
+        """Test clearing tags empties the array."""
+        self.recipe.tags.add(self.tag1)
+        self.recipe.tags.clear()
+        self.assertTagIds([])
+
+    def test_reverse_relations(self):
+        """Test changes from the tag side update the array."""
+        self.tag1.recipe_set.add(self.recipe)
+        self.assertTagIds([self.tag1.id])
+
+        self.tag1.recipe_set.clear()
+        self.assertTagIds([])
+
+    def test_delete_tag(self):
+        """Test deleting a tag removes it from the array."""
+        self.recipe.tags.add(self.tag1, self.tag2)
+        self.tag1.delete()
+        self.assertTagIds([self.tag2.id])
+
+    def test_delete_tags_queryset(self):
+        """Test deleting tags in bulk removes them from the array."""
+        self.recipe.tags.add(self.tag1, self.tag2)
+        models.Tag.objects.filter(pk=self.tag1.pk).delete()
+        self.assertTagIds([self.tag2.id])
+
+    def test_ingredients(self):
+        """Test the ingredient array follows the ingredients."""
+        ingredient = models.Ingredient.objects.create(
+            user=self.user, name='Salt',
+        )
+        self.recipe.ingredients.set([ingredient])
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.ingredient_ids, [ingredient.id])
+
+    def test_save_keeps_arrays(self):
+        """Test saving a stale instance does not overwrite the array."""
+        stale = models.Recipe.objects.get(pk=self.recipe.pk)
+        self.recipe.tags.add(self.tag1)
+
+        stale.title = 'New title'
+        stale.save()
+
+        self.assertTagIds([self.tag1.id])
+        self.assertEqual(self.recipe.title, 'New title')
+
+
+class UpdatedAtTests(TestCase):
+    """Test the modification times of recipe data."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.recipe = models.Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=4,
+            price=Decimal('6.98'),
+        )
+
+    def assertRecipeTouched(self):
+        previous = self.recipe.updated_at
+        self.recipe.refresh_from_db()
+        self.assertGreater(self.recipe.updated_at, previous)
+
+    def test_save_with_deferred_fields(self):
+        """Test a partially loaded recipe refreshes updated_at."""
+        recipe = models.Recipe.objects.only('id', 'title').get()
+        recipe.title = 'New title'
+        recipe.save()
+
+        self.assertRecipeTouched()
+
+    def test_relink(self):
+        """Test linking a tag marks the recipe modified."""
+        tag = models.Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+
+        self.assertRecipeTouched()
+
+    def test_owner_touched_on_delete(self):
+        """Test deleting a recipe marks the owner's data modified."""
+        previous = self.user.content_updated_at
+        self.recipe.delete()
+
+        self.user.refresh_from_db()
+        self.assertGreater(self.user.content_updated_at, previous)
+
+    def test_owner_touched_on_queryset_delete(self):
+        """Test deleting tags in bulk marks the owner's data modified."""
+        models.Tag.objects.bulk_create(
+            models.Tag(user=self.user, name=f'Tag {i}') for i in range(3)
+        )
+        previous = self.user.content_updated_at
+
+        with self.assertNumQueries(6):
+            models.Tag.objects.filter(user=self.user).delete()
+
+        self.user.refresh_from_db()
+        self.assertGreater(self.user.content_updated_at, previous)
+
+
+class CascadeDeleteTests(TestCase):
+    """Test deleting a user drops their recipe data in a few queries."""
+
+    def test_no_queries_per_row(self):
+        """Test the cascade of 200 rows costs only more delete batches."""
+        counts = []
+        for count in (2, 200):
+            user = create_user(f'user{count}@example.com')
+            tags = models.Tag.objects.bulk_create(
+                models.Tag(user=user, name=f'Tag {i}') for i in range(count)
+            )
+            models.Ingredient.objects.bulk_create(
+                models.Ingredient(user=user, name=f'Salt {i}')
+                for i in range(count)
+            )
+            recipe = models.Recipe.objects.create(
+                user=user, title='Sample', time_minutes=4,
+                price=Decimal('6.98'),
+            )
+            recipe.tags.add(*tags)
+            with CaptureQueriesContext(connection) as queries:
+                user.delete()
+            counts.append(len(queries))
+
+            self.assertFalse(models.Tag.objects.filter(user=user).exists())
+        # Tags and ingredients are each deleted 100 ids at a time.
+        self.assertEqual(counts[1], counts[0] + 2)
@@ -0,0 +1,184 @@
+"""
+Tests for request profiling.
+"""
+import cProfile
+import os
+import pstats
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.profiling import ArtifactStore
+
+HEALTH_CHECK_URL = reverse('health-check')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def artifact_url(name):
+    """Create and return a profile artifact URL."""
+    return reverse('profile-artifact', args=[name])
+
+
+class ProfilingTests(TestCase):
+    """Test profiling requests and downloading the results."""
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        settings = override_settings(
+            PROFILE_DIR=self.profile_dir,
+            PROFILE_SAMPLE_RATE=0,
+            PROFILE_SAMPLE_MEMORY=False,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.staff = get_user_model().objects.create_user(
+            'staff@example.com', 'password123', is_staff=True,
+        )
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'password123',
+        )
+        self.client = APIClient()
+        self.authenticate(self.staff)
+
+    def authenticate(self, user):
+        """Send a token of the user with the requests."""
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def profile(self, url, **headers):
+        """Request a URL under the profiler, return the response."""
+        with self.assertLogs('core.profiling', 'INFO'):
+            return self.client.get(url, **headers)
+
+    def test_staff_profile(self):
+        """Test a staff user's request is profiled on demand."""
+        res = self.profile(RECIPES_URL, HTTP_X_PROFILE='cpu')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        profile_id = res['X-Profile-Id']
+        self.assertEqual(
+            res['X-Profile-Url'], artifact_url(f'{profile_id}.txt'),
+        )
+        path = os.path.join(self.profile_dir, profile_id)
+        stats = pstats.Stats(f'{path}.prof')
+        self.assertGreater(stats.total_calls, 0)
+        with open(f'{path}.txt') as report:
+            content = report.read()
+        self.assertTrue(content.startswith(f'GET {RECIPES_URL} 200 in '))
+        self.assertIn('cumulative', content)
+        self.assertNotIn('Memory peak', content)
+
+    def test_memory_profile(self):
+        """Test allocations are traced in memory mode."""
+        res = self.profile(RECIPES_URL, HTTP_X_PROFILE='memory')
+
+        path = os.path.join(self.profile_dir, f'{res["X-Profile-Id"]}.txt')
+        with open(path) as report:
+            self.assertIn('Memory peak', report.read())
+
+    def test_request_id(self):
+        """Test the client's request id starts the profile's name."""
+        res = self.profile(
+            RECIPES_URL, HTTP_X_PROFILE='cpu', HTTP_X_REQUEST_ID='abc-123',
+        )
+
+        profile_id = res['X-Profile-Id']
+        self.assertTrue(profile_id.startswith('abc-123-'))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.profile_dir, f'{profile_id}.prof'),
+        ))
+
+    def test_repeated_request_id(self):
+        """Test a request id sent again does not overwrite a profile."""
+        ids = {
+            self.profile(
+                RECIPES_URL, HTTP_X_PROFILE='cpu', HTTP_X_REQUEST_ID='abc',
+            )['X-Profile-Id']
+            for _ in range(2)
+        }
+
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(len(os.listdir(self.profile_dir)), 4)
+
+    def test_unsafe_request_id(self):
+        """Test a request id unfit for a file name is left out."""
+        res = self.profile(
+            RECIPES_URL, HTTP_X_PROFILE='cpu', HTTP_X_REQUEST_ID='../x',
+        )
+
+        self.assertRegex(res['X-Profile-Id'], '^[0-9a-f]{32}$')
+
+    def test_non_staff_not_profiled(self):
+        """Test the profile header is ignored for other users."""
+        self.authenticate(self.user)
+
+        res = self.client.get(RECIPES_URL, HTTP_X_PROFILE='cpu')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.has_header('X-Profile-Id'))
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_unknown_mode_not_profiled(self):
+        """Test an unknown profiling mode is ignored."""
+        res = self.client.get(RECIPES_URL, HTTP_X_PROFILE='everything')
+
+        self.assertFalse(res.has_header('X-Profile-Id'))
+
+    def test_sampled(self):
+        """Test requests are profiled at the sample rate."""
+        self.client.credentials()
+
+        with self.settings(PROFILE_SAMPLE_RATE=1.0):
+            res = self.profile(HEALTH_CHECK_URL)
+
+        self.assertTrue(res.has_header('X-Profile-Id'))
+
+    def test_download(self):
+        """Test staff users download profile artifacts."""
+        profile_id = self.profile(
+            RECIPES_URL, HTTP_X_PROFILE='cpu',
+        )['X-Profile-Id']
+
+        res = self.client.get(artifact_url(f'{profile_id}.prof'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('attachment', res['Content-Disposition'])
+        self.assertGreater(len(b''.join(res.streaming_content)), 0)
+
+    def test_download_not_found(self):
+        """Test missing and malformed artifact names are not found."""
+        for name in ('missing.txt', 'settings.py', '..%2Fx.txt'):
+            res = self.client.get(artifact_url(name))
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_download_staff_only(self):
+        """Test other users cannot download profile artifacts."""
+        self.authenticate(self.user)
+
+        res = self.client.get(artifact_url('missing.txt'))
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_artifacts_bounded(self):
+        """Test the oldest profiles are removed above the bound."""
+        store = ArtifactStore(self.profile_dir, max_artifacts=2)
+        profiler = cProfile.Profile()
+        for i in range(3):
+            store.save(f'profile-{i}', profiler, 'report')
+            path = os.path.join(self.profile_dir, f'profile-{i}.txt')
+            os.utime(path, (i, i))
+
+        self.assertEqual(
+            sorted(os.listdir(self.profile_dir)),
+            ['profile-1.prof', 'profile-1.txt',
+             'profile-2.prof', 'profile-2.txt'],
+        )
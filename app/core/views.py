@@ -1,11 +1,60 @@
 """
 Core views for app.
 """
-from rest_framework.decorators import api_view
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from rest_framework.authentication import (
+    SessionAuthentication,
+    TokenAuthentication,
+)
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
+from core import metrics as core_metrics
+from core.profiling import artifact_path
+
 
 @api_view(['GET'])
 def health_check(request):
     """Returns successful response."""
     return Response({'alive': True})
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication, SessionAuthentication])
+@permission_classes([IsAdminUser])
+def profile_artifact(request, name):
+    """Download the pstats dump or report of a profiled request."""
+    path = artifact_path(name)
+    try:
+        artifact = open(path, 'rb') if path else None
+    except FileNotFoundError:
+        artifact = None
+    if artifact is None:
+        raise Http404
+    return FileResponse(
+        artifact,
+        as_attachment=True,
+        filename=name,
+        content_type='text/plain' if name.endswith('.txt')
+        else 'application/octet-stream',
+    )
+
+
+def metrics(request):
+    """Return the metrics of all workers in the Prometheus text format.
+
+    Only local scrapers are answered, the proxy passes the address of
+    outside clients on.
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(
+        core_metrics.render(core_metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
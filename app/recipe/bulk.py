@@ -0,0 +1,238 @@
+"""
+Bulk recipe writes.
+
+A bulk request is validated in full before anything is written, so a
+batch is stored whole or not at all. Tag and ingredient names are then
+resolved once for the whole batch, and the recipes are written in chunks
+with bulk_create()/bulk_update() and set-based link changes, so the
+queries per request grow with the number of chunks, not of recipes.
+"""
+from itertools import islice
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Recipe, Tag, Ingredient
+from core.signals import touch_owner
+from recipe.serializers import RecipeBulkSerializer, get_or_create_items
+
+# Recipes written per chunk of a bulk request.
+CHUNK_SIZE = 1000
+
+# Most queries writing a chunk runs: the insert, the locking select and
+# update of changed recipes, three link statements per relation and the
+# update of the derived fields.
+CHUNK_QUERIES = 10
+
+# The nested relations: name, item model, through-table column.
+RELATIONS = (
+    ('tags', Tag, 'tag_id'),
+    ('ingredients', Ingredient, 'ingredient_id'),
+)
+
+INSERT_LINKS_SQL = """
+INSERT INTO {table} (recipe_id, {column})
+SELECT * FROM unnest(%s::bigint[], %s::bigint[])
+"""
+
+DELETE_LINKS_SQL = """
+DELETE FROM {table}
+WHERE (recipe_id, {column}) IN (
+    SELECT * FROM unnest(%s::bigint[], %s::bigint[])
+)
+"""
+
+
+def chunk_count(items):
+    """Return the number of chunks the items are written in."""
+    return -(-len(items) // CHUNK_SIZE)
+
+
+def _chunks(items, size):
+    """Yield lists of at most size items."""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_items(items, user, context):
+    """Return the validated items and the errors of the invalid ones.
+
+    Errors are reported as `{'index': i, 'errors': {...}}` entries.
+    Creates and updates are validated by one list serializer each, so
+    the serializer fields are built twice rather than once per item.
+    """
+    validated, errors = [None] * len(items), []
+    for partial in (False, True):
+        indexes = [
+            index for index, item in enumerate(items)
+            if (isinstance(item, dict) and 'id' in item) == partial
+        ]
+        if not indexes:
+            continue
+        serializer = RecipeBulkSerializer(
+            data=[items[index] for index in indexes],
+            many=True,
+            partial=partial,
+            context=context,
+        )
+        if serializer.is_valid():
+            for index, data in zip(indexes, serializer.validated_data):
+                validated[index] = data
+            continue
+        errors.extend(
+            {'index': index, 'errors': item_errors}
+            for index, item_errors in zip(indexes, serializer.errors)
+            if item_errors
+        )
+    if errors:
+        errors.sort(key=lambda error: error['index'])
+        return validated, errors
+
+    # Updates must name distinct recipes owned by the user.
+    ids = [item['id'] for item in validated if 'id' in item]
+    owned = set(Recipe.objects.filter(
+        user=user, pk__in=ids,
+    ).values_list('pk', flat=True))
+    seen = set()
+    for index, item in enumerate(validated):
+        pk = item.get('id')
+        if pk is None:
+            continue
+        if pk not in owned:
+            errors.append({'index': index, 'errors': {'id': ['Not found.']}})
+        elif pk in seen:
+            errors.append({'index': index, 'errors': {'id': ['Duplicate.']}})
+        seen.add(pk)
+    return validated, errors
+
+
+def _execute_links(sql, through, column, pairs):
+    """Run a links statement over (recipe id, item id) pairs.
+
+    The pairs are sent as two arrays, which keeps one statement per
+    chunk without building a model instance per link.
+    """
+    if not pairs:
+        return
+    recipe_ids, item_ids = zip(*pairs)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.format(
+                table=connection.ops.quote_name(through._meta.db_table),
+                column=connection.ops.quote_name(column),
+            ),
+            [list(recipe_ids), list(item_ids)],
+        )
+
+
+class BulkRecipeWriter:
+    """Write validated recipe items for a user."""
+
+    def __init__(self, user):
+        self.user = user
+
+    @transaction.atomic
+    def write(self, items):
+        """Write the items and return their recipe ids in order."""
+        self.items = {}
+        for name, model, _ in RELATIONS:
+            names = {
+                nested['name']
+                for item in items for nested in item.get(name, [])
+            }
+            self.items[name] = get_or_create_items(model, self.user, names)
+
+        ids = []
+        for chunk in _chunks(items, CHUNK_SIZE):
+            ids.extend(self._write_chunk(chunk))
+
+        # bulk writes send no signals, notify the owner once.
+        touch_owner(self.user.pk)
+        return ids
+
+    def _write_chunk(self, chunk):
+        updates = {item['id']: item for item in chunk if 'id' in item}
+        created = Recipe.objects.bulk_create([
+            Recipe(user=self.user, **self._fields(item))
+            for item in chunk if 'id' not in item
+        ])
+        self._update(updates)
+
+        links = [
+            (recipe.pk, item) for recipe, item in zip(
+                created, (item for item in chunk if 'id' not in item),
+            )
+        ]
+        links += list(updates.items())
+        for name, _, column in RELATIONS:
+            self._set_links(name, column, [
+                (pk, item[name]) for pk, item in links if name in item
+            ], updated=updates)
+
+        pks = [recipe.pk for recipe in created] + list(updates)
+        Recipe.objects.filter(pk__in=pks).update_relation_data()
+
+        created = iter(created)
+        return [
+            item['id'] if 'id' in item else next(created).pk
+            for item in chunk
+        ]
+
+    def _fields(self, item):
+        """Return the model fields of an item."""
+        relations = {name for name, _, _ in RELATIONS}
+        return {
+            name: value for name, value in item.items()
+            if name != 'id' and name not in relations
+        }
+
+    def _update(self, updates):
+        """Apply the field changes of updated recipes."""
+        if not updates:
+            return
+        recipes = Recipe.objects.select_for_update().filter(
+            pk__in=list(updates),
+        )
+        now = timezone.now()
+        fields = {'updated_at'}
+        for recipe in recipes:
+            for name, value in self._fields(updates[recipe.pk]).items():
+                setattr(recipe, name, value)
+                fields.add(name)
+            recipe.updated_at = now
+        Recipe.objects.bulk_update(recipes, sorted(fields))
+
+    def _set_links(self, name, column, recipe_items, updated):
+        """Replace the links of the recipes with the named items.
+
+        Only updated recipes can have links to diff against.
+        """
+        if not recipe_items:
+            return
+        through = getattr(Recipe, name).through
+        pks = self.items[name]
+        wanted = {
+            (recipe_id, pks[nested['name']])
+            for recipe_id, nested_items in recipe_items
+            for nested in nested_items
+        }
+        current = set()
+        updated_ids = [
+            recipe_id for recipe_id, _ in recipe_items
+            if recipe_id in updated
+        ]
+        if updated_ids:
+            current = set(through.objects.filter(
+                recipe_id__in=updated_ids,
+            ).values_list('recipe_id', column))
+
+        _execute_links(
+            DELETE_LINKS_SQL, through, column, sorted(current - wanted),
+        )
+        _execute_links(
+            INSERT_LINKS_SQL, through, column, sorted(wanted - current),
+        )
@@ -0,0 +1,299 @@
+"""
+Versioned per-user response cache for recipe list APIs.
+
+Every cached response is keyed by the user's current version. Writing to
+any of the user's recipes, tags or ingredients bumps that version, which
+makes all of the user's cached responses unreachable at once; the stale
+entries are then dropped by LRU eviction.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.crypto import salted_hmac
+from django.utils.module_loading import import_string
+from rest_framework.response import Response
+
+from core import metrics
+from recipe.filters import param_flag
+
+# Query parameters holding comma separated ids, compared as sets.
+ID_LIST_PARAMS = ('tags', 'ingredients')
+FLAG_PARAMS = ('assigned_only', 'with_counts')
+
+
+def _new_version(previous=None):
+    """Return a version newer than the previous one.
+
+    Versions start from the clock, so a version forgotten by eviction is
+    never handed out again for the same user.
+    """
+    version = time.time_ns()
+    if previous is not None and version <= previous:
+        version = previous + 1
+    return version
+
+
+class BaseBackend:
+    """Size bounded LRU store for cached responses and user versions."""
+
+    def __init__(self, location=None, max_entries=1000):
+        self.max_entries = max_entries
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value of a key, or None."""
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.registry.inc('response_cache_requests_total', {
+            'result': 'miss' if value is None else 'hit',
+        })
+        return value
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries."""
+        raise NotImplementedError
+
+    def get_version(self, user_id):
+        """Return the current version of a user's cached responses."""
+        raise NotImplementedError
+
+    def bump_version(self, user_id):
+        """Invalidate every cached response of a user."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Return the hit and miss counters."""
+        with self._stats_lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+
+class LocMemBackend(BaseBackend):
+    """Keep entries in the memory of the current process.
+
+    Versions are not shared between processes, so use this backend for a
+    single worker, or a FileBackend when running several uwsgi workers.
+    """
+
+    def __init__(self, location=None, max_entries=1000):
+        super().__init__(location, max_entries)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = OrderedDict()
+
+    def _get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_version(self, user_id):
+        with self._lock:
+            version = self._versions.get(user_id)
+            if version is None:
+                version = self._versions[user_id] = _new_version()
+            self._versions.move_to_end(user_id)
+            while len(self._versions) > self.max_entries:
+                self._versions.popitem(last=False)
+            return version
+
+    def bump_version(self, user_id):
+        with self._lock:
+            self._versions[user_id] = _new_version(
+                self._versions.get(user_id)
+            )
+            self._versions.move_to_end(user_id)
+
+
+class FileBackend(BaseBackend):
+    """Keep entries as JSON files shared by all processes on a host.
+
+    Reads refresh a file's modification time, which is the recency used
+    to pick entries for eviction. Entry names are an HMAC of the key with
+    SECRET_KEY, so they cannot be derived from the request, and the
+    directory must never be served: the entries hold users' data.
+    """
+
+    def __init__(self, location, max_entries=1000):
+        super().__init__(location, max_entries)
+        self._entries_dir = os.path.join(location, 'entries')
+        self._versions_dir = os.path.join(location, 'versions')
+        os.makedirs(self._entries_dir, exist_ok=True)
+        os.makedirs(self._versions_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        name = salted_hmac(
+            'recipe.cache.FileBackend', key, algorithm='sha256',
+        ).hexdigest()
+        return os.path.join(self._entries_dir, name)
+
+    def _write(self, path, content):
+        """Atomically replace a file with the content."""
+        directory = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        with os.fdopen(fd, 'w') as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, path)
+
+    def _get(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path) as cache_file:
+                value = json.load(cache_file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def set(self, key, value):
+        self._write(self._entry_path(key), json.dumps(value))
+        self._cull()
+
+    def _cull(self):
+        """Remove the least recently used entries above the size bound."""
+        with os.scandir(self._entries_dir) as entries:
+            files = [
+                entry for entry in entries
+                if not entry.name.startswith('.')
+            ]
+        excess = len(files) - self.max_entries
+        if excess <= 0:
+            return
+
+        def mtime(entry):
+            try:
+                return entry.stat().st_mtime
+            except OSError:
+                return 0
+
+        for entry in sorted(files, key=mtime)[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _version_path(self, user_id):
+        return os.path.join(self._versions_dir, str(user_id))
+
+    def _read_version(self, user_id):
+        try:
+            with open(self._version_path(user_id)) as version_file:
+                return int(version_file.read())
+        except (OSError, ValueError):
+            return None
+
+    def get_version(self, user_id):
+        version = self._read_version(user_id)
+        if version is None:
+            version = _new_version()
+            self._write(self._version_path(user_id), str(version))
+        return version
+
+    def bump_version(self, user_id):
+        version = _new_version(self._read_version(user_id))
+        self._write(self._version_path(user_id), str(version))
+
+
+@lru_cache(maxsize=None)
+def get_response_cache():
+    """Return the configured cache backend, or None when disabled."""
+    config = settings.RESPONSE_CACHE
+    if not config.get('BACKEND'):
+        return None
+    backend_class = import_string(config['BACKEND'])
+    return backend_class(
+        config.get('LOCATION'),
+        max_entries=config.get('MAX_ENTRIES', 1000),
+    )
+
+
+@receiver(setting_changed)
+def _reset_response_cache(setting, **kwargs):
+    if setting == 'RESPONSE_CACHE':
+        get_response_cache.cache_clear()
+
+
+def invalidate_user(user_id):
+    """Bump a user's version now and again once the transaction commits.
+
+    The second bump drops anything cached by a concurrent reader that saw
+    the new version before the write became visible.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return
+    cache.bump_version(user_id)
+    transaction.on_commit(lambda: cache.bump_version(user_id))
+
+
+def _normalize_params(query_params):
+    """Return the query parameters in a canonical order and form."""
+    normalized = []
+    for name in sorted(query_params):
+        value = query_params.get(name)
+        if name in ID_LIST_PARAMS:
+            try:
+                value = sorted({int(qid) for qid in value.split(',')})
+            except ValueError:
+                pass
+        elif name in FLAG_PARAMS:
+            value = param_flag(query_params, name)
+        normalized.append([name, value])
+    return normalized
+
+
+class CachedListMixin:
+    """Serve list responses from the per-user response cache."""
+
+    def get_cache_key(self, cache, request):
+        """Return the cache key of a list request."""
+        user_id = request.user.pk
+        parts = [
+            user_id,
+            cache.get_version(user_id),
+            self.basename,
+            self.action,
+            request.get_host(),
+            _normalize_params(request.query_params),
+        ]
+        return json.dumps(parts, separators=(',', ':'))
+
+    def list(self, request, *args, **kwargs):
+        cache = get_response_cache()
+        if cache is None:
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_cache_key(cache, request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data)
+        return response
@@ -0,0 +1,102 @@
+"""
+Conditional GET support for recipe APIs.
+
+Validators come from modification times, never from the rendered body:
+a detail response is validated by the row's `updated_at`, and a list by
+the owner's `content_updated_at`, which every write to their recipes,
+tags or ingredients moves forward (deletions included). The query
+string and the negotiated media type are part of every ETag, as they
+shape the body too.
+"""
+import hashlib
+
+from django.db.models import prefetch_related_objects
+from django.shortcuts import get_object_or_404
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def make_etag(request, *parts):
+    """Return a weak ETag of the parts and the request's variant."""
+    key = '|'.join(str(part) for part in (
+        *parts,
+        request.accepted_media_type,
+        request.META.get('QUERY_STRING', ''),
+    ))
+    return 'W/"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional_response(request, etag, last_modified):
+    """Return a 304 response if the client's copy is current, else None."""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()),
+    )
+    if response is not None:
+        patch_validators(response, etag, last_modified)
+    return response
+
+
+def patch_validators(response, etag, last_modified):
+    """Add the validators and caching headers to a response."""
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Bodies are per user, shared caches must not store them and
+    # clients revalidate before reuse.
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+class ConditionalListMixin:
+    """Answer list requests with 304 while the owner's data is unchanged."""
+
+    def list(self, request, *args, **kwargs):
+        last_modified = request.user.content_updated_at
+        etag = make_etag(
+            request, self.basename, request.user.pk, last_modified,
+        )
+        response = conditional_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            patch_validators(response, etag, last_modified)
+        return response
+
+
+class ConditionalRetrieveMixin:
+    """Answer detail requests with 304 while the object is unchanged.
+
+    The object is fetched without its prefetches, which only run once
+    the validators show the body is needed. The view's query plan must
+    load `updated_at`.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        plan = self.get_query_plan()
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        instance = get_object_or_404(
+            queryset.prefetch_related(None),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        self.check_object_permissions(request, instance)
+
+        last_modified = instance.updated_at
+        etag = make_etag(request, self.basename, instance.pk, last_modified)
+        response = conditional_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        prefetch_related_objects([instance], *plan.prefetch_related)
+        serializer = self.get_serializer(instance)
+        return patch_validators(
+            Response(serializer.data), etag, last_modified,
+        )
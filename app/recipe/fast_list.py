@@ -0,0 +1,160 @@
+"""
+Fast read-only list serialization for recipe APIs.
+
+ModelSerializer builds a model instance for every recipe, tag and
+ingredient and dispatches every field through its serializer field.
+This module renders the same output from `values()` rows instead: the
+recipes come with their sorted tag/ingredient id arrays, and the names
+of all linked tags and ingredients on a page are read in one query per
+relation.
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import FileField
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from core.models import Recipe
+
+# Nested relations rendered from the denormalized id arrays.
+RELATION_ARRAYS = {
+    'tags': 'tag_ids',
+    'ingredients': 'ingredient_ids',
+}
+
+# Fields whose representation of a database value is the value itself.
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField,
+    serializers.CharField,
+    serializers.BooleanField,
+)
+
+
+def _converter(field):
+    """Return the function rendering a value, or None for identity."""
+    if type(field) in PASSTHROUGH_FIELDS:
+        return None
+    return field.to_representation
+
+
+def _column(model, field):
+    """Return the model column a plain serializer field renders."""
+    if field.write_only or field.source == '*' or \
+            len(field.source_attrs) != 1:
+        return None
+    try:
+        model_field = model._meta.get_field(field.source)
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete or model_field.is_relation or \
+            isinstance(model_field, FileField):
+        return None
+    return model_field.attname
+
+
+class FastRecipeList:
+    """Render recipe lists shaped by a RecipeSerializer from raw rows."""
+
+    def __init__(self, serializer):
+        self.columns = []
+        self.converters = {}
+        self.relations = {}
+        self.supported = True
+        for name, field in serializer.fields.items():
+            if name in RELATION_ARRAYS and \
+                    isinstance(field, serializers.ListSerializer):
+                self._add_relation(name, field.child)
+            else:
+                self._add_column(name, field)
+
+    def _add_column(self, name, field):
+        column = _column(Recipe, field)
+        if column is None:
+            self.supported = False
+            return
+        self.columns.append((name, column))
+        self.converters[name] = _converter(field)
+
+    def _add_relation(self, name, child):
+        model = child.Meta.model
+        child_columns = []
+        for child_name, child_field in child.fields.items():
+            column = _column(model, child_field)
+            if column is None:
+                self.supported = False
+                return
+            child_columns.append(
+                (child_name, column, _converter(child_field))
+            )
+        self.relations[name] = (model, child_columns)
+
+    def values(self, queryset, extra=()):
+        """Return the queryset as rows holding the needed columns."""
+        columns = [column for _, column in self.columns]
+        columns += [RELATION_ARRAYS[name] for name in self.relations]
+        columns += [name for name in extra if name not in columns]
+        return queryset.values(*columns)
+
+    def render(self, rows):
+        """Return the serialized data of the rows."""
+        related = {
+            name: self._related_items(name, rows)
+            for name in self.relations
+        }
+        data = []
+        for row in rows:
+            item = {}
+            for name, column in self.columns:
+                value = row[column]
+                convert = self.converters[name]
+                if value is not None and convert is not None:
+                    value = convert(value)
+                item[name] = value
+            for name, items in related.items():
+                item[name] = [
+                    items[pk] for pk in row[RELATION_ARRAYS[name]]
+                    if pk in items
+                ]
+            data.append(item)
+        return data
+
+    def _related_items(self, name, rows):
+        """Return the rendered related items of the rows by id."""
+        model, child_columns = self.relations[name]
+        ids = {pk for row in rows for pk in row[RELATION_ARRAYS[name]]}
+        if not ids:
+            return {}
+        columns = [column for _, column, _ in child_columns]
+        items = {}
+        for values in model.objects.filter(pk__any=ids).values_list(
+            'pk', *columns,
+        ):
+            item = {}
+            for (child_name, _, convert), value in zip(
+                child_columns, values[1:],
+            ):
+                if value is not None and convert is not None:
+                    value = convert(value)
+                item[child_name] = value
+            items[values[0]] = item
+        return items
+
+
+class FastListMixin:
+    """Render recipe lists without per-object serializer overhead.
+
+    The view provides `get_filtered_queryset()`, its queryset before the
+    query plan is applied.
+    """
+
+    def list(self, request, *args, **kwargs):
+        fast_list = FastRecipeList(self.get_serializer())
+        if not settings.FAST_RECIPE_LIST or not fast_list.supported:
+            return super().list(request, *args, **kwargs)
+
+        ordering = [field.lstrip('-') for field in self.get_ordering()]
+        rows = fast_list.values(self.get_filtered_queryset(), ordering)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(fast_list.render(list(rows)))
+        return self.get_paginated_response(fast_list.render(page))
@@ -0,0 +1,68 @@
+"""
+Filters for recipe APIs.
+"""
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.models import Recipe
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+
+# Values of a flag parameter that leave it off.
+FLAG_OFF = ('', '0', 'false')
+
+
+def param_flag(query_params, name):
+    """Return whether a 1/0 flag parameter is set."""
+    return query_params.get(name, '').lower() not in FLAG_OFF
+
+
+def filter_by_related(queryset, relation, ids, match=MATCH_ANY):
+    """Filter recipes linked to any or all of the related ids.
+
+    The filters test the recipe's denormalized id array with the GIN
+    indexed overlap (`&&`) and containment (`@>`) operators, so the
+    through-table is not read at all.
+    """
+    field = Recipe._meta.get_field(relation)
+    array_field = f'{field.m2m_reverse_field_name()}_ids'
+    ids = sorted(set(ids))
+    lookup = 'contains' if match == MATCH_ALL else 'overlap'
+    return queryset.filter(**{f'{array_field}__{lookup}': ids})
+
+
+def _links(model):
+    """Return the through-table rows linking recipes to an item model."""
+    through = model.recipe_set.through
+    return through.objects.filter(
+        **{model._meta.model_name: OuterRef('pk')}
+    )
+
+
+def filter_assigned(queryset):
+    """Filter tags or ingredients used by at least one recipe.
+
+    A correlated EXISTS stops at the first link of each item, where a
+    join would produce a row per link to sort and deduplicate.
+    """
+    return queryset.filter(Exists(_links(queryset.model)))
+
+
+def annotate_recipe_count(queryset):
+    """Annotate tags or ingredients with the number of recipes using them.
+
+    Items only link recipes of their owner, so the links are counted
+    straight from the through-table's index on the item column, one
+    count per item. A grouped join would count the links of every user:
+    the planner hashes the whole through-table rather than probe it by
+    item. Ordering by usage still counts each of the user's items and
+    sorts them all, no index holds the counts.
+    """
+    links = _links(queryset.model)
+    count = links.order_by().values(
+        queryset.model._meta.model_name,
+    ).annotate(count=Count('*')).values('count')
+    return queryset.annotate(recipe_count=Coalesce(
+        Subquery(count, output_field=IntegerField()), 0,
+    ))
@@ -0,0 +1,157 @@
+"""
+Resized variants of recipe images, made outside the request.
+
+Once the transaction saving a new image commits, the image is queued to
+a pool of IMAGE_VARIANT_WORKERS processes. A worker decodes it once and
+writes each size of IMAGE_VARIANT_SIZES, in each format of
+IMAGE_VARIANT_FORMATS that Pillow can save, next to the original:
+
+    uploads/recipe/<uuid>.jpg -> uploads/recipe/<uuid>-thumb.webp, ...
+
+The pool thread of the request worker then records the variants on the
+recipe, only while the recipe still has that image, so a slow job never
+overwrites the variants of a newer upload. Until then the recipe has no
+variants and clients use the original. Without workers, images are
+processed in the committing thread instead.
+
+Workers read and write the files by path, so the image storage must be
+on the local filesystem.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def can_save(image_format):
+    """Return whether Pillow was built with an encoder for a format."""
+    Image.init()
+    if image_format.upper() in Image.SAVE:
+        return True
+    logger.warning('Pillow cannot save %s, no such variants are made.',
+                   image_format)
+    return False
+
+
+def variant_path(path, label, image_format):
+    """Return the path of a variant of an image, or its storage name."""
+    return f'{os.path.splitext(path)[0]}-{label}.{image_format}'
+
+
+def render_variants(path, sizes, formats, quality):
+    """Write the variants of an image and return their dimensions.
+
+    Runs in a pool process. Each size is scaled down from the next
+    larger one, and images are never scaled up.
+    """
+    variants = {}
+    with Image.open(path) as image:
+        # JPEGs decode straight to the smallest scale still large enough.
+        largest = max(sizes.values())
+        image.draft('RGB', (largest, largest))
+        current = ImageOps.exif_transpose(image).convert('RGB')
+
+    for label, edge in sorted(
+        sizes.items(), key=lambda item: item[1], reverse=True,
+    ):
+        current.thumbnail((edge, edge), Image.LANCZOS)
+        for image_format in formats:
+            current.save(
+                variant_path(path, label, image_format),
+                format=image_format.upper(), quality=quality,
+            )
+        variants[label] = {'width': current.width, 'height': current.height}
+    return variants
+
+
+def get_pool():
+    """Return the process pool of this process, made on first use."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Forked workers start without re-importing the project.
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                mp_context=multiprocessing.get_context('fork'),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def queue_variants(recipe, clear=True):
+    """Forget the variants of a recipe's previous image and make new ones.
+
+    The new image is processed once the current transaction commits.
+    Pass `clear=False` when the saved row has no variants already.
+    """
+    if clear:
+        Recipe.objects.filter(pk=recipe.pk).update(image_variants={})
+    recipe.image_variants = {}
+    name = recipe.image.name
+    if name:
+        transaction.on_commit(partial(submit, recipe.pk, name))
+
+
+def submit(recipe_id, name):
+    """Make and record the variants of a recipe's image."""
+    formats = [
+        image_format for image_format in settings.IMAGE_VARIANT_FORMATS
+        if can_save(image_format)
+    ]
+    args = (
+        Recipe._meta.get_field('image').storage.path(name),
+        settings.IMAGE_VARIANT_SIZES,
+        formats,
+        settings.IMAGE_VARIANT_QUALITY,
+    )
+    if not settings.IMAGE_VARIANT_WORKERS:
+        try:
+            variants = render_variants(*args)
+        except Exception:
+            logger.exception('Could not make the variants of %s', name)
+            return None
+        record(recipe_id, name, formats, variants)
+        return None
+    future = get_pool().submit(render_variants, *args)
+    future.add_done_callback(partial(_done, recipe_id, name, formats))
+    return future
+
+
+def _done(recipe_id, name, formats, future):
+    """Record the variants of a finished job, from the pool thread."""
+    try:
+        variants = future.result()
+    except Exception:
+        logger.exception('Could not make the variants of %s', name)
+        return
+    close_old_connections()
+    try:
+        record(recipe_id, name, formats, variants)
+    finally:
+        close_old_connections()
+
+
+def record(recipe_id, name, formats, variants):
+    """Store the variants on the recipe, if it still has the image."""
+    for label, variant in variants.items():
+        for image_format in formats:
+            variant[image_format] = variant_path(name, label, image_format)
+    Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants=variants, updated_at=timezone.now(),
+    )
@@ -0,0 +1,261 @@
+"""
+Pagination for recipe APIs.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import (
+    BooleanField,
+    Expression,
+    F,
+    FloatField,
+    IntegerField,
+    Q,
+    Value,
+)
+from django.utils.translation import gettext_lazy as t
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginate with opaque cursors that seek on the view's ordering.
+
+    A cursor stores the ordering values of the last row sent, and the next
+    page is fetched with a `WHERE` clause that continues after those values.
+    Every page costs the same index seek and no `COUNT(*)` is run.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = t('Invalid cursor.')
+    ordering = ('-id',)
+
+    def __init__(self):
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def get_ordering(self, view):
+        """Return the ordering fields, which must end with a unique field."""
+        if hasattr(view, 'get_ordering'):
+            return tuple(view.get_ordering())
+        return tuple(getattr(view, 'ordering', self.ordering))
+
+    def get_page_size(self, request):
+        """Return the requested page size, capped at the maximum."""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        if position is not None:
+            position = self.clean_position(queryset, position)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(_invert(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(_seek(ordering, position))
+
+        # Fetch one extra row to learn whether more rows follow.
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        self.rows = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    def decode_cursor(self, request):
+        """Return the position and direction stored in the cursor."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, reverse = cursor['p'], bool(cursor['r'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or \
+                len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def clean_position(self, queryset, position):
+        """Return the cursor values as the types of their ordering fields.
+
+        Cursors come from the client, a value of another type would fail
+        in the database rather than be rejected.
+        """
+        cleaned = []
+        for field, value in zip(self.ordering, position):
+            output_field = _output_field(queryset, field.lstrip('-'))
+            if isinstance(output_field, IntegerField):
+                types = (int,)
+            elif isinstance(output_field, FloatField):
+                types = (int, float)
+            else:
+                types = (str,)
+            if not isinstance(value, types) or isinstance(value, bool):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                cleaned.append(output_field.to_python(value))
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    def encode_cursor(self, row, reverse):
+        """Return the url of the page that follows or precedes a row."""
+        position = [
+            _field_value(row, field.lstrip('-')) for field in self.ordering
+        ]
+        cursor = json.dumps({'p': position, 'r': int(reverse)})
+        encoded = base64.urlsafe_b64encode(cursor.encode()).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+
+def _invert(field):
+    """Return the ordering field with its direction flipped."""
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def _output_field(queryset, name):
+    """Return the model field or annotation output field of a name."""
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _field_value(row, name):
+    """Return a JSON friendly ordering value of a row or values() dict."""
+    value = row[name] if isinstance(row, dict) else getattr(row, name)
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+class RowComparison(Expression):
+    """A row-value comparison such as `(a, b) < (x, y)`.
+
+    Postgres matches a row comparison on consecutive index columns as one
+    index condition, where the equivalent OR of column comparisons is
+    only applied as a filter to every row the scan reads.
+    """
+    conditional = True
+    output_field = BooleanField()
+
+    def __init__(self, names, operator, values):
+        super().__init__()
+        self.operator = operator
+        self.fields = [F(name) for name in names]
+        self.values = [Value(value) for value in values]
+
+    def get_source_expressions(self):
+        return [*self.fields, *self.values]
+
+    def set_source_expressions(self, exprs):
+        self.fields = exprs[:len(self.fields)]
+        self.values = exprs[len(self.fields):]
+
+    def as_sql(self, compiler, connection):
+        sides, params = [], []
+        for exprs in (self.fields, self.values):
+            parts = []
+            for expr in exprs:
+                sql, expr_params = compiler.compile(expr)
+                parts.append(sql)
+                params.extend(expr_params)
+            sides.append(', '.join(parts))
+        return f'ROW({sides[0]}) {self.operator} ROW({sides[1]})', params
+
+
+def _seek(ordering, position):
+    """Return a filter that selects rows after the position.
+
+    When every field sorts the same way, an ordering (a, b) seeks with
+    `(a, b) > (x, y)`, or `<` when descending. Otherwise the filter is
+    `a > x OR (a = x AND b > y)` with each comparison flipped for
+    descending fields, bounded by `a >= x` so that an index on the
+    leading field can start the scan at the position.
+    """
+    names = [field.lstrip('-') for field in ordering]
+    descending = [field.startswith('-') for field in ordering]
+    if len(ordering) > 1 and len(set(descending)) == 1:
+        operator = '<' if descending[0] else '>'
+        return RowComparison(names, operator, position)
+
+    condition = Q()
+    equal = {}
+    for name, desc, value in zip(names, descending, position):
+        lookup = 'lt' if desc else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    if len(ordering) > 1:
+        bound = 'lte' if descending[0] else 'gte'
+        condition &= Q(**{f'{names[0]}__{bound}': position[0]})
+    return condition
@@ -0,0 +1,139 @@
+"""
+Eager loading plans built from serializer declarations.
+
+Serializers declare the relations they render through their nested
+fields. The helpers here walk those fields and turn them into the
+matching `select_related`, `prefetch_related` and `only()` calls, so a
+viewset never issues one query per row for nested data.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+class QueryPlan:
+    """The loading strategy for a serializer's model queryset."""
+
+    def __init__(self):
+        self.select_related = []
+        self.prefetch_related = []
+        # None means every column is needed.
+        self.only = []
+
+    def defer_nothing(self):
+        """Load every column, the fields cannot be fully resolved."""
+        self.only = None
+
+    def apply(self, queryset):
+        """Return the queryset with the plan applied."""
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+
+def _unwrap(serializer):
+    """Return the child serializer of a list serializer."""
+    if isinstance(serializer, serializers.ListSerializer):
+        return serializer.child
+    return serializer
+
+
+def build_query_plan(serializer):
+    """Build a QueryPlan for the fields of a model serializer."""
+    serializer = _unwrap(serializer)
+    model = serializer.Meta.model
+    plan = QueryPlan()
+    plan.only.append(model._meta.pk.name)
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*' or len(field.source_attrs) != 1:
+            plan.defer_nothing()
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            # Properties and methods may touch any column.
+            plan.defer_nothing()
+            continue
+
+        nested = _unwrap(field)
+        if isinstance(nested, serializers.ModelSerializer):
+            _plan_nested(plan, field.source, model_field, nested)
+        elif isinstance(field, serializers.ManyRelatedField):
+            plan.prefetch_related.append(field.source)
+        elif model_field.concrete and plan.only is not None:
+            plan.only.append(model_field.name)
+
+    return plan
+
+
+def _plan_nested(plan, source, model_field, nested):
+    """Add the loading strategy for a nested serializer field."""
+    child_plan = build_query_plan(nested)
+
+    if model_field.many_to_one or model_field.one_to_one:
+        if model_field.concrete and plan.only is not None:
+            plan.only.append(model_field.name)
+        plan.select_related.append(source)
+        if child_plan.only is not None and plan.only is not None:
+            plan.only.extend(f'{source}__{name}' for name in child_plan.only)
+        plan.select_related.extend(
+            f'{source}__{name}' for name in child_plan.select_related
+        )
+        plan.prefetch_related.extend(
+            _prefix_lookup(source, lookup)
+            for lookup in child_plan.prefetch_related
+        )
+        return
+
+    if model_field.one_to_many and child_plan.only is not None:
+        # The reverse foreign key is needed to attach rows to parents.
+        child_plan.only.append(model_field.field.name)
+    queryset = child_plan.apply(nested.Meta.model.objects.all())
+    plan.prefetch_related.append(Prefetch(source, queryset=queryset))
+
+
+def _prefix_lookup(prefix, lookup):
+    """Prefix a prefetch lookup with a select_related path."""
+    if isinstance(lookup, Prefetch):
+        return Prefetch(
+            f'{prefix}__{lookup.prefetch_through}',
+            queryset=lookup.queryset,
+        )
+    return f'{prefix}__{lookup}'
+
+
+class QueryPlanMixin:
+    """Load viewset querysets with the plan of the active serializer."""
+    # Columns loaded even when no serializer field renders them.
+    query_plan_fields = []
+
+    def get_query_plan(self):
+        """Return the query plan for the current action's serializer."""
+        plan = build_query_plan(self.get_serializer())
+        if plan.only is not None:
+            plan.only.extend(self.query_plan_fields)
+            plan.only.extend(self._ordering_fields())
+        return plan
+
+    def _ordering_fields(self):
+        """Return the model fields the ordering reads from each row."""
+        if hasattr(self, 'get_ordering'):
+            ordering = self.get_ordering()
+        else:
+            ordering = getattr(self, 'ordering', None) or []
+        columns = {
+            field.name for field in self.queryset.model._meta.concrete_fields
+        }
+        names = [field.lstrip('-') for field in ordering]
+        return [name for name in names if name in columns]
+
+    def apply_query_plan(self, queryset):
+        """Return the queryset loaded according to the query plan."""
+        return self.get_query_plan().apply(queryset)
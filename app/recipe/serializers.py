@@ -1,7 +1,15 @@
 """
 Serializers for recipe APIs.
 """
+from contextlib import contextmanager
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from recipe import images
+from recipe.filters import param_flag
 
 from core.models import (
     Recipe,
@@ -10,7 +18,143 @@ from core.models import (
 )
 
 
-class TagSerializer(serializers.ModelSerializer):
+def _param_names(request, name):
+    """Return the set of comma separated names in a query parameter."""
+    value = request.query_params.get(name, '')
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+UPSERT_ITEMS_SQL = """
+INSERT INTO {table} (user_id, name, updated_at)
+SELECT %s, name, %s FROM unnest(%s::text[]) AS name
+ON CONFLICT (user_id, name) DO NOTHING
+RETURNING id, name
+"""
+
+
+def get_or_create_items(model, user, names):
+    """Return the ids of the user's items by name, creating missing ones.
+
+    Existing names are read with one query and the missing ones inserted
+    with one `INSERT ... ON CONFLICT DO NOTHING`. A name a concurrent
+    writer inserted in between is skipped by the insert and read back.
+    No post_save is sent: the recipe write linking the new items sends
+    the signals the owner needs.
+    """
+    names = set(names)
+    if not names:
+        return {}
+    queryset = model.objects.filter(user=user)
+    items = dict(
+        queryset.filter(name__in=names).values_list('name', 'pk')
+    )
+    missing = sorted(names - set(items))
+    if missing:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                UPSERT_ITEMS_SQL.format(
+                    table=connection.ops.quote_name(model._meta.db_table),
+                ),
+                [user.pk, timezone.now(), missing],
+            )
+            items.update((name, pk) for pk, name in cursor.fetchall())
+    raced = names - set(items)
+    if raced:
+        items.update(
+            queryset.filter(name__in=raced).values_list('name', 'pk')
+        )
+    return items
+
+
+class RecipeCountMixin:
+    """Render how many recipes use an item when `with_counts` is set.
+
+    The count is read from the `recipe_count` annotation of the view's
+    queryset.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = kwargs.get('context', {}).get('request')
+        if request is not None and request.method in SAFE_METHODS and \
+                param_flag(request.query_params, 'with_counts'):
+            self.fields['recipe_count'] = serializers.IntegerField(
+                read_only=True,
+            )
+
+
+class UniqueNameMixin:
+    """Reject names the user already gave another item.
+
+    Nested items are matched by name instead, so only a serializer a
+    view builds directly checks. A concurrent write of the same name
+    passes the check and trips the unique constraint, which is reported
+    the same way.
+    """
+    unique_name_message = 'An item with this name already exists.'
+
+    def validate_name(self, value):
+        if self.parent is not None:
+            return value
+        queryset = self.Meta.model.objects.filter(
+            user=self.context['request'].user, name=value,
+        )
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError(self.unique_name_message)
+        return value
+
+    def create(self, validated_data):
+        with self._unique_name():
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with self._unique_name():
+            return super().update(instance, validated_data)
+
+    @contextmanager
+    def _unique_name(self):
+        """Report a name written concurrently as a validation error."""
+        try:
+            with transaction.atomic():
+                yield
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {'name': [self.unique_name_message]},
+            )
+
+
+class SparseFieldsMixin:
+    """Prune the rendered fields with the `fields` and `omit` parameters.
+
+    Only the serializer a view builds is pruned, nested serializers keep
+    their fields. Views derive their query plan from the pruned fields,
+    so omitted columns and relations are not loaded either.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = kwargs.get('context', {}).get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        fields = _param_names(request, 'fields')
+        omit = _param_names(request, 'omit')
+        unknown = (fields | omit) - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({
+                'fields': f'Unknown fields: {", ".join(sorted(unknown))}.'
+            })
+        for name in list(self.fields):
+            if (fields and name not in fields) or name in omit:
+                self.fields.pop(name)
+
+
+class TagSerializer(SparseFieldsMixin,
+                    RecipeCountMixin,
+                    UniqueNameMixin,
+                    serializers.ModelSerializer):
     """Serializer for tags."""
 
     class Meta:
@@ -19,7 +163,10 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(SparseFieldsMixin,
+                           RecipeCountMixin,
+                           UniqueNameMixin,
+                           serializers.ModelSerializer):
     """Serializer for ingredients."""
 
     class Meta:
@@ -28,7 +175,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Define the serializer for recipes."""
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
@@ -40,57 +187,115 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """The resized copies of a recipe image, by size.
+
+    Each size has its width, height and the URL of every format. Empty
+    while the copies are being made, or without an image.
+    """
+
+    def to_representation(self, value):
+        storage = Recipe._meta.get_field('image').storage
+        request = self.context.get('request')
+
+        def url(name):
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+
+        return {
+            label: {
+                key: item if key in ('width', 'height') else url(item)
+                for key, item in variant.items()
+            }
+            for label, variant in value.items()
+        }
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer for recipe detail view."""
+    image_variants = ImageVariantsField()
 
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + [
+            'description', 'image', 'image_variants',
+        ]
 
-    def _get_or_create_tags(self, recipe, tags):
-        user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(user=user, **tag)
-            recipe.tags.add(tag_obj)
+    def _set_items(self, recipe, tags, ingredients, created=False):
+        """Link the named items, touching only links that change.
 
-    def _get_or_create_ingredients(self, recipe, ingredients):
+        set() reads the current links once, then deletes the dropped
+        ones and inserts the new ones with a statement each. A new
+        recipe has no links to diff against.
+        """
         user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=user,
-                **ingredient
-            )
-            recipe.ingredients.add(ingredient_obj)
+        for manager, model, items in (
+            (recipe.tags, Tag, tags),
+            (recipe.ingredients, Ingredient, ingredients),
+        ):
+            if items is None:
+                continue
+            names = list(dict.fromkeys(item['name'] for item in items))
+            pks = get_or_create_items(model, user, names)
+            if created:
+                manager.add(*[pks[name] for name in names])
+            else:
+                manager.set([pks[name] for name in names])
 
+    @transaction.atomic
     def create(self, validated_data):
-        """Create a recipe and attach a tag."""
+        """Create a recipe with its tags and ingredients."""
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
         recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(recipe, tags)
-        self._get_or_create_ingredients(recipe, ingredients)
+        self._set_items(
+            recipe, tags or None, ingredients or None, created=True,
+        )
+        if recipe.image:
+            images.queue_variants(recipe, clear=False)
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Support update for nested tag field."""
+        """Support update for nested tag and ingredient fields."""
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
-        if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(instance, tags)
-        if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(instance, ingredients)
+        self._set_items(instance, tags, ingredients)
         recipe = super().update(instance, validated_data)
-        recipe.save()
+        if 'image' in validated_data:
+            images.queue_variants(recipe)
 
         return recipe
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+
+class RecipeBulkSerializer(RecipeDetailSerializer):
+    """Serializer for one recipe of a bulk write.
+
+    Items with an `id` update that recipe, the others create one. Bulk
+    writes are done by recipe.bulk, not by this serializer.
+    """
+    id = serializers.IntegerField(required=False)
+
+    class Meta(RecipeDetailSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['description']
+        read_only_fields = []
+
+
+class RecipeImageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for uploading image for recipes."""
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'image_variants']
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': True}}
+
+    def update(self, instance, validated_data):
+        """Save the image and queue its resized copies."""
+        instance.image = validated_data['image']
+        instance.image_variants = {}
+        instance.save(update_fields=['image', 'image_variants'])
+        images.queue_variants(instance, clear=False)
+
+        return instance
@@ -0,0 +1,19 @@
+"""
+Signal handlers for recipe APIs.
+"""
+from django.dispatch import receiver
+
+from core.signals import owners_touched
+
+from recipe.cache import invalidate_user
+
+
+@receiver(owners_touched)
+def invalidate_on_touch(sender, user_ids, **kwargs):
+    """Invalidate the cached responses of users whose data changed.
+
+    Every write to a user's recipes, tags and ingredients, signal
+    handlers and bulk writes alike, marks the owner modified.
+    """
+    for user_id in user_ids:
+        invalidate_user(user_id)
@@ -0,0 +1,169 @@
+"""
+Tests for the bulk recipe API.
+"""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe import bulk
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def recipe_payload(index, **params):
+    """Return the payload of a bulk recipe item."""
+    payload = {
+        'title': f'Recipe {index}',
+        'time_minutes': 10,
+        'price': '5.00',
+        'tags': [{'name': f'Tag {index % 3}'}, {'name': 'Shared'}],
+        'ingredients': [{'name': f'Ingredient {index % 5}'}],
+    }
+    payload.update(params)
+    return payload
+
+
+class BulkRecipeAPITests(TestCase):
+    """Test bulk creates and updates."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, items):
+        return self.client.post(BULK_URL, items, format='json')
+
+    def test_bulk_create(self):
+        """Test creating recipes with shared nested names."""
+        Tag.objects.create(user=self.user, name='Shared')
+
+        res = self.post([recipe_payload(i) for i in range(10)])
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data['ids']), 10)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(Ingredient.objects.count(), 5)
+        recipe = Recipe.objects.get(pk=res.data['ids'][4])
+        self.assertEqual(recipe.title, 'Recipe 4')
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Shared', 'Tag 1'],
+        )
+        self.assertFalse(Recipe.objects.out_of_sync().exists())
+
+    def test_bulk_update(self):
+        """Test items with an id update the recipe and its links."""
+        ids = self.post([recipe_payload(i) for i in range(2)]).data['ids']
+
+        res = self.post([
+            {'id': ids[0], 'title': 'Renamed', 'tags': [{'name': 'New'}]},
+            recipe_payload(2),
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['ids'][0], ids[0])
+        recipe = Recipe.objects.get(pk=ids[0])
+        self.assertEqual(recipe.title, 'Renamed')
+        self.assertEqual(recipe.price, Decimal('5.00'))
+        self.assertEqual(
+            list(recipe.tags.values_list('name', flat=True)), ['New'],
+        )
+        self.assertEqual(recipe.ingredients.count(), 1)
+        self.assertFalse(Recipe.objects.out_of_sync().exists())
+
+    def test_bulk_search_vector(self):
+        """Test bulk created recipes are searchable by tag names."""
+        self.post([recipe_payload(0)])
+
+        res = self.client.get(
+            reverse('recipe:recipe-list'), {'search': 'shared'},
+        )
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_bulk_errors_by_index(self):
+        """Test invalid items are reported and nothing is written."""
+        other = get_user_model().objects.create_user('other@example.com')
+        other_recipe = Recipe.objects.create(
+            user=other, title='Other', time_minutes=1, price=Decimal('1'),
+        )
+
+        res = self.post([
+            recipe_payload(0),
+            recipe_payload(1, price='invalid'),
+            {'id': other_recipe.id, 'title': 'Stolen'},
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['errors'][0]['index'], 1)
+        self.assertIn('price', res.data['errors'][0]['errors'])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 0)
+
+        res = self.post([{'id': other_recipe.id, 'title': 'Stolen'}])
+
+        self.assertEqual(res.data['errors'][0]['errors']['id'], ['Not found.'])
+
+    def test_bulk_not_a_list(self):
+        """Test the payload must be a list."""
+        res = self.post(recipe_payload(0))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_max_items(self):
+        """Test batches above the limit are rejected."""
+        with self.settings(API_BULK_MAX_ITEMS=2):
+            res = self.post([recipe_payload(i) for i in range(3)])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_queries_grow_with_chunks(self):
+        """Test the queries depend on the chunks, not the recipes."""
+        counts = []
+        for size in (10, 100):
+            # Every run creates its nested items.
+            Tag.objects.all().delete()
+            Ingredient.objects.all().delete()
+            with CaptureQueriesContext(connection) as queries:
+                res = self.post([recipe_payload(i) for i in range(size)])
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+        bulk.CHUNK_SIZE, chunk_size = 40, bulk.CHUNK_SIZE
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                self.post([recipe_payload(i) for i in range(100)])
+        finally:
+            bulk.CHUNK_SIZE = chunk_size
+        self.assertGreater(len(queries), counts[1])
+
+    def test_bulk_budget_per_chunk(self):
+        """Test batches above one chunk stay within the query budget."""
+        existing = [
+            self.post([recipe_payload(i)]).data['ids'][0] for i in range(50)
+        ]
+        items = [recipe_payload(i) for i in range(80)] + [
+            recipe_payload(i, id=pk, tags=[{'name': 'New'}])
+            for i, pk in enumerate(existing)
+        ]
+
+        with mock.patch.object(bulk, 'CHUNK_SIZE', 40):
+            res = self.post(items)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data['ids']), 130)
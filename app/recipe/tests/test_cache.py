@@ -0,0 +1,207 @@
+"""
+Tests for the recipe response cache.
+"""
+import hashlib
+import os
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag
+from core.signals import touch_owner
+
+from recipe.cache import (
+    FileBackend,
+    LocMemBackend,
+    get_response_cache,
+)
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a recipe."""
+    defaults = {
+        'title': 'Recipe title',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class LocMemBackendTests(SimpleTestCase):
+    """Test the local memory backend."""
+
+    def setUp(self):
+        self.backend = LocMemBackend(max_entries=2)
+
+    def test_evicts_least_recently_used(self):
+        """Test the least recently read entry is evicted first."""
+        self.backend.set('a', 1)
+        self.backend.set('b', 2)
+        self.backend.get('a')
+        self.backend.set('c', 3)
+
+        self.assertEqual(self.backend.get('a'), 1)
+        self.assertIsNone(self.backend.get('b'))
+        self.assertEqual(self.backend.get('c'), 3)
+
+    def test_counts_hits_and_misses(self):
+        """Test hits and misses are counted."""
+        self.backend.set('a', 1)
+        self.backend.get('a')
+        self.backend.get('missing')
+
+        self.assertEqual(self.backend.stats(), {'hits': 1, 'misses': 1})
+
+    def test_bump_version(self):
+        """Test bumping a version changes it."""
+        version = self.backend.get_version(1)
+        self.assertEqual(self.backend.get_version(1), version)
+
+        self.backend.bump_version(1)
+
+        self.assertGreater(self.backend.get_version(1), version)
+
+
+class FileBackendTests(SimpleTestCase):
+    """Test the file based backend."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.backend = FileBackend(self.tmp_dir.name, max_entries=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_set_and_get(self):
+        """Test values survive a new backend on the same directory."""
+        self.backend.set('a', {'results': [1, 2]})
+        other = FileBackend(self.tmp_dir.name)
+
+        self.assertEqual(other.get('a'), {'results': [1, 2]})
+
+    def test_size_bounded(self):
+        """Test entries above the bound are evicted."""
+        for key in 'abcd':
+            self.backend.set(key, key)
+
+        stored = [key for key in 'abcd' if self.backend.get(key)]
+        self.assertEqual(stored, ['c', 'd'])
+
+    def test_entry_names_keyed(self):
+        """Test entry names cannot be derived without the secret key."""
+        self.backend.set('a', 'value')
+        with override_settings(SECRET_KEY='another secret'):
+            other = FileBackend(self.tmp_dir.name)
+            self.assertIsNone(other.get('a'))
+
+        names = os.listdir(os.path.join(self.tmp_dir.name, 'entries'))
+        self.assertNotIn(hashlib.sha256(b'a').hexdigest(), names)
+
+    def test_versions_shared(self):
+        """Test a bump is seen by other backends on the directory."""
+        other = FileBackend(self.tmp_dir.name)
+        version = other.get_version(7)
+
+        self.backend.bump_version(7)
+
+        self.assertGreater(other.get_version(7), version)
+
+
+class CachedListAPITests(TestCase):
+    """Test caching of list endpoints."""
+
+    def setUp(self):
+        get_response_cache.cache_clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_list_served_from_cache(self):
+        """Test a repeated list request runs no queries."""
+        create_recipe(self.user)
+        res = self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(RECIPES_URL)
+
+        self.assertEqual(cached.data, res.data)
+        self.assertEqual(get_response_cache().stats()['hits'], 1)
+
+    def test_normalized_params_share_entry(self):
+        """Test id lists in any order share a cache entry."""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Quick')
+        self.client.get(RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        with self.assertNumQueries(0):
+            self.client.get(RECIPES_URL, {'tags': f'{tag2.id},{tag1.id}'})
+
+    def test_update_recipe_invalidates(self):
+        """Test updating a recipe through the API invalidates the list."""
+        recipe = create_recipe(self.user)
+        self.client.get(RECIPES_URL)
+
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+        self.client.patch(url, {'title': 'New title'})
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['title'], 'New title')
+
+    def test_delete_tag_invalidates(self):
+        """Test deleting a tag invalidates the tag list."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        self.client.delete(reverse('recipe:tag-detail', args=[tag.id]))
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_touch_owner_invalidates(self):
+        """Test writes that send no model signals invalidate the list."""
+        self.client.get(RECIPES_URL)
+
+        Recipe.objects.bulk_create([
+            Recipe(user=self.user, title='Raw', time_minutes=1,
+                   price=Decimal('1.00')),
+        ])
+        touch_owner(self.user.pk)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['title'], 'Raw')
+
+    def test_cache_private_to_user(self):
+        """Test cached lists are not shared between users."""
+        create_recipe(self.user)
+        self.client.get(RECIPES_URL)
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
+    def test_disabled_cache(self):
+        """Test lists query the database when the cache is disabled."""
+        create_recipe(self.user)
+        with self.settings(RESPONSE_CACHE={'BACKEND': ''}):
+            self.client.get(RECIPES_URL)
+            with self.assertNumQueries(1):
+                self.client.get(RECIPES_URL)
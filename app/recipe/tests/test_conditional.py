@@ -0,0 +1,144 @@
+"""
+Tests for conditional GET requests on recipe APIs.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag
+
+from recipe.cache import get_response_cache
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def detail_url(recipe_id):
+    """Return a recipe detail url."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ConditionalRequestTests(TestCase):
+    """Test ETag and Last-Modified validation."""
+
+    def setUp(self):
+        get_response_cache.cache_clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        # The user is loaded per request, like it is in production.
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Recipe title',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+
+    def test_detail_validators(self):
+        """Test detail responses carry validators and cache headers."""
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', res)
+        self.assertIn('private', res['Cache-Control'])
+        self.assertIn('Authorization', res['Vary'])
+
+    def test_detail_not_modified(self):
+        """Test a matching ETag answers 304 without loading relations."""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        # The recipe row, the token lookup is cached by the first request.
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertIn('private', res['Cache-Control'])
+
+    def test_detail_if_modified_since(self):
+        """Test Last-Modified is honoured through If-Modified-Since."""
+        url = detail_url(self.recipe.id)
+        last_modified = self.client.get(url)['Last-Modified']
+
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_modified_by_new_tag(self):
+        """Test linking a tag changes the recipe's ETag."""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 1)
+
+    def test_detail_modified_by_tag_rename(self):
+        """Test renaming a linked tag changes the recipe's ETag."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_detail_etag_depends_on_fields(self):
+        """Test sparse fieldsets have their own ETags."""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, {'fields': 'id'}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_list_not_modified(self):
+        """Test an unchanged list answers 304 after the token lookup."""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_modified_by_delete(self):
+        """Test deleting a recipe changes the list validators."""
+        res = self.client.get(RECIPES_URL)
+
+        self.recipe.delete()
+        res = self.client.get(
+            RECIPES_URL,
+            HTTP_IF_NONE_MATCH=res['ETag'],
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
+    def test_tag_list_modified_by_relink(self):
+        """Test linking a tag changes the assigned tag list."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        params = {'assigned_only': 1}
+        etag = self.client.get(TAGS_URL, params)['ETag']
+
+        self.recipe.tags.add(tag)
+        res = self.client.get(TAGS_URL, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
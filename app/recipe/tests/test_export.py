@@ -0,0 +1,138 @@
+"""
+Tests for the recipe export API.
+"""
+import csv
+import io
+import json
+import shutil
+import tarfile
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag, Ingredient
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def content(response):
+    """Return the body of a streaming response."""
+    return b''.join(response.streaming_content)
+
+
+class RecipeExportTests(TestCase):
+    """Test streaming recipe exports."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipes = []
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                description=f'Step {i}',
+                time_minutes=i,
+                price=Decimal('5.50'),
+            )
+            recipe.tags.add(
+                Tag.objects.get_or_create(user=self.user, name='Vegan')[0],
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.get_or_create(
+                    user=self.user, name=f'Ingredient {i % 2}',
+                )[0],
+            )
+            self.recipes.append(recipe)
+        other_user = get_user_model().objects.create_user('other@example.com')
+        Recipe.objects.create(
+            user=other_user,
+            title='Other recipe',
+            time_minutes=1,
+            price=Decimal('1.00'),
+        )
+
+    def test_export_ndjson(self):
+        """Test exporting the user's recipes as NDJSON."""
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        self.assertIn('recipes.ndjson', res['Content-Disposition'])
+        items = [json.loads(line) for line in content(res).splitlines()]
+        self.assertEqual(
+            [item['id'] for item in items],
+            [recipe.id for recipe in reversed(self.recipes)],
+        )
+        self.assertEqual(items[0]['description'], 'Step 4')
+        self.assertEqual(items[0]['price'], '5.50')
+        self.assertEqual([tag['name'] for tag in items[0]['tags']], ['Vegan'])
+        self.assertIsNone(items[0]['image'])
+
+    def test_export_csv(self):
+        """Test exporting recipes as CSV."""
+        res = self.client.get(EXPORT_URL, {'output': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(content(res).decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['title'], 'Recipe 4')
+        self.assertEqual(rows[0]['tags'], 'Vegan')
+        self.assertEqual(rows[0]['ingredients'], 'Ingredient 0')
+
+    def test_export_chunks(self):
+        """Test relations are loaded per chunk, not per recipe."""
+        with mock.patch('recipe.export.CHUNK_SIZE', 2):
+            res = self.client.get(EXPORT_URL)
+            # The recipe cursor, then a query per relation per chunk.
+            with self.assertNumQueries(1 + 3 * 2):
+                body = content(res)
+
+        self.assertEqual(len(body.splitlines()), 5)
+
+    def test_export_filtered(self):
+        """Test the list filters apply to exports."""
+        tag = Tag.objects.create(user=self.user, name='Quick')
+        self.recipes[0].tags.add(tag)
+
+        res = self.client.get(EXPORT_URL, {'tags': tag.id})
+
+        items = [json.loads(line) for line in content(res).splitlines()]
+        self.assertEqual([item['id'] for item in items], [self.recipes[0].id])
+
+    def test_export_invalid_output(self):
+        """Test an unknown output format is rejected."""
+        res = self.client.get(EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_images(self):
+        """Test images are bundled with the recipes in a tar archive."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            self.recipes[0].image.save('photo.jpg', ContentFile(b'jpeg'))
+            res = self.client.get(EXPORT_URL, {'images': 1})
+            body = content(res)
+
+        self.assertEqual(res['Content-Type'], 'application/x-tar')
+        with tarfile.open(fileobj=io.BytesIO(body)) as archive:
+            names = archive.getnames()
+            image = archive.extractfile(self.recipes[0].image.name).read()
+            items = archive.extractfile('recipes.ndjson').read()
+        self.assertEqual(names, [self.recipes[0].image.name, 'recipes.ndjson'])
+        self.assertEqual(image, b'jpeg')
+        self.assertEqual(len(items.splitlines()), 5)
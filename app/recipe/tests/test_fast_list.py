@@ -0,0 +1,115 @@
+"""
+Tests for the fast recipe list renderer.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, RequestFactory
+from django.urls import reverse
+
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe.cache import get_response_cache
+from recipe.fast_list import FastRecipeList
+from recipe.serializers import RecipeSerializer
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def serializer_context(**params):
+    """Return a serializer context for a list request."""
+    request = Request(RequestFactory().get(RECIPES_URL, params))
+    return {'request': request}
+
+
+def sort_nested(data):
+    """Return list data with nested items in id order."""
+    for item in data:
+        for name in ('tags', 'ingredients'):
+            if name in item:
+                item[name] = sorted(item[name], key=lambda x: x['id'])
+    return data
+
+
+class FastRecipeListParityTests(TestCase):
+    """Test the fast renderer matches RecipeSerializer."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Vegan', 'Dessert', 'Quick')
+        ]
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        prices = [Decimal('1'), Decimal('5.50'), Decimal('99.99')]
+        for i, price in enumerate(prices):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=i,
+                price=price,
+                link='' if i else 'https://example.com/recipe.pdf',
+            )
+            recipe.tags.add(*tags[i:])
+            if i:
+                recipe.ingredients.add(ingredient)
+        self.queryset = Recipe.objects.order_by('-id')
+
+    def assert_parity(self, **params):
+        context = serializer_context(**params)
+        expected = RecipeSerializer(
+            self.queryset, many=True, context=context,
+        ).data
+        fast_list = FastRecipeList(RecipeSerializer(context=context))
+        rows = list(fast_list.values(self.queryset))
+
+        self.assertTrue(fast_list.supported)
+        self.assertEqual(
+            sort_nested(fast_list.render(rows)),
+            sort_nested([dict(item) for item in expected]),
+        )
+
+    def test_parity(self):
+        """Test every field renders as the serializer renders it."""
+        self.assert_parity()
+
+    def test_parity_sparse_fields(self):
+        """Test sparse fieldsets render the same fields."""
+        self.assert_parity(fields='id,price,tags')
+        self.assert_parity(omit='tags,ingredients')
+
+    def test_empty_relations_skip_queries(self):
+        """Test no related query runs without linked rows."""
+        Recipe.objects.update(tag_ids=[], ingredient_ids=[])
+        fast_list = FastRecipeList(
+            RecipeSerializer(context=serializer_context()),
+        )
+        rows = list(fast_list.values(self.queryset))
+
+        with self.assertNumQueries(0):
+            data = fast_list.render(rows)
+
+        self.assertEqual(data[0]['tags'], [])
+
+    def test_api_parity(self):
+        """Test the API responds the same with the fast path disabled."""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        get_response_cache.cache_clear()
+
+        with self.settings(RESPONSE_CACHE={'BACKEND': ''}):
+            fast = client.get(RECIPES_URL, {'page_size': 2})
+            with self.settings(FAST_RECIPE_LIST=False):
+                slow = client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(fast.data['next'], slow.data['next'])
+        self.assertEqual(
+            sort_nested(fast.data['results']),
+            sort_nested([dict(item) for item in slow.data['results']]),
+        )
@@ -0,0 +1,164 @@
+"""
+Tests for the resized variants of recipe images.
+"""
+import io
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe
+from recipe import images
+
+SIZES = {'thumb': 40, 'large': 100}
+
+
+def image_upload(size, name='photo.jpg'):
+    """Return an uploaded JPEG of a size."""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(
+    IMAGE_VARIANT_WORKERS=0,
+    IMAGE_VARIANT_SIZES=SIZES,
+    IMAGE_VARIANT_FORMATS=['jpeg'],
+)
+class ImageVariantTests(TestCase):
+    """Test making and exposing the variants of uploaded images."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=5,
+            price=Decimal('5.00'),
+        )
+        self.upload_url = reverse(
+            'recipe:recipe-upload-image', args=[self.recipe.id],
+        )
+        self.detail_url = reverse(
+            'recipe:recipe-detail', args=[self.recipe.id],
+        )
+
+    def upload(self, size):
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                self.upload_url, {'image': image_upload(size)},
+                format='multipart',
+            )
+        self.recipe.refresh_from_db()
+        return res
+
+    def test_upload_makes_variants(self):
+        """Test every size is made once the upload commits."""
+        res = self.upload((400, 200))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_variants'], {})
+        variants = self.recipe.image_variants
+        self.assertEqual(
+            (variants['thumb']['width'], variants['thumb']['height']),
+            (40, 20),
+        )
+        self.assertEqual(
+            (variants['large']['width'], variants['large']['height']),
+            (100, 50),
+        )
+        path = self.recipe.image.storage.path(variants['thumb']['jpeg'])
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (40, 20))
+
+    def test_detail_exposes_variants(self):
+        """Test the detail view answers the URL of every variant."""
+        self.upload((400, 200))
+
+        res = self.client.get(self.detail_url)
+
+        thumb = res.data['image_variants']['thumb']
+        self.assertEqual(thumb['width'], 40)
+        self.assertTrue(thumb['jpeg'].startswith('http://testserver/'))
+        self.assertTrue(thumb['jpeg'].endswith('-thumb.jpeg'))
+
+    def test_not_scaled_up(self):
+        """Test images smaller than a size keep their dimensions."""
+        self.upload((30, 10))
+
+        for variant in self.recipe.image_variants.values():
+            self.assertEqual((variant['width'], variant['height']), (30, 10))
+
+    def test_new_upload_replaces_variants(self):
+        """Test variants of a previous image are forgotten."""
+        self.upload((400, 200))
+        previous = self.recipe.image.name
+
+        with self.captureOnCommitCallbacks():
+            self.client.post(
+                self.upload_url, {'image': image_upload((400, 200))},
+                format='multipart',
+            )
+        images.record(
+            self.recipe.pk, previous, ['jpeg'], {'thumb': {'width': 1}},
+        )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+
+    def test_update_keeps_variants(self):
+        """Test saving other fields leaves the variants alone."""
+        self.upload((400, 200))
+        variants = self.recipe.image_variants
+
+        self.client.patch(self.detail_url, {'title': 'Red curry'})
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, variants)
+
+    def test_unsupported_format_skipped(self):
+        """Test formats Pillow cannot save are left out."""
+        with override_settings(IMAGE_VARIANT_FORMATS=['jpeg', 'nosuch']), \
+                self.assertLogs('recipe.images', 'WARNING'):
+            self.upload((400, 200))
+
+        self.assertEqual(
+            set(self.recipe.image_variants['thumb']),
+            {'width', 'height', 'jpeg'},
+        )
+
+    def test_process_pool(self):
+        """Test the variants are rendered by a pool process."""
+        path = os.path.join(tempfile.mkdtemp(), 'photo.jpg')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        Image.new('RGB', (400, 200)).save(path, format='JPEG')
+
+        with override_settings(IMAGE_VARIANT_WORKERS=1):
+            future = images.get_pool().submit(
+                images.render_variants, path, SIZES, ['jpeg'], 80,
+            )
+            variants = future.result(timeout=30)
+
+        self.assertEqual(variants['thumb'], {'width': 40, 'height': 20})
+        self.assertTrue(os.path.exists(
+            images.variant_path(path, 'large', 'jpeg'),
+        ))
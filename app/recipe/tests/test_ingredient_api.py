@@ -60,7 +60,7 @@ class PrivateIngredientAPITests(TestCase):
         ingredients = Ingredient.objects.all().order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """Test user access to ingredients of the user."""
@@ -70,9 +70,9 @@ class PrivateIngredientAPITests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
-        self.assertEqual(res.data[0]['id'], ingredient.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
+        self.assertEqual(res.data['results'][0]['id'], ingredient.id)
 
     def test_updating_ingredient(self):
         """Test user updating the ingredient of a recipe."""
@@ -121,8 +121,8 @@ class PrivateIngredientAPITests(TestCase):
         s1 = IngredientSerializer(ing1)
         s2 = IngredientSerializer(ing2)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filter_ingredients_unique(self):
         """Test filtering result list unique."""
@@ -143,4 +143,22 @@ class PrivateIngredientAPITests(TestCase):
         recipe1.ingredients.add(ingredient)
         recipe2.ingredients.add(ingredient)
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_with_counts(self):
+        """Test ingredients list with their recipe counts."""
+        ingredient = create_ingredient(user=self.user, name='Lemon')
+        create_ingredient(user=self.user, name='Salt')
+        recipe = Recipe.objects.create(
+            title='Lemonade',
+            time_minutes=3,
+            price=Decimal('2.00'),
+            user=self.user
+        )
+        recipe.ingredients.add(ingredient)
+
+        res = self.client.get(INGREDIENTS_URL, {'with_counts': 1})
+
+        counts = {item['name']: item['recipe_count']
+                  for item in res.data['results']}
+        self.assertEqual(counts, {'Lemon': 1, 'Salt': 0})
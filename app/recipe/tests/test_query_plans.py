@@ -0,0 +1,218 @@
+"""
+Query plan regression tests for recipe APIs.
+
+Every query an endpoint runs is explained against a seeded dataset, and
+the test fails when the plan reads a whole table or sorts rows that an
+index should deliver in order.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag, Ingredient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+USERS = 20
+RECIPES_PER_USER = 500
+ITEMS_PER_USER = 300
+LINKS_PER_RECIPE = 3
+
+SORT_NODES = ('Sort', 'Incremental Sort')
+
+
+def detail_url(recipe_id):
+    """Return a recipe detail url."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def plan_nodes(sql):
+    """Return the nodes of a query's plan."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0][0]['Plan']
+    nodes, pending = [], [plan]
+    while pending:
+        node = pending.pop()
+        nodes.append(node)
+        pending.extend(node.get('Plans', []))
+    return nodes
+
+
+def explain(sql):
+    """Return the plan nodes of a query as (node type, relation) pairs."""
+    return [
+        (node['Node Type'], node.get('Relation Name'))
+        for node in plan_nodes(sql)
+    ]
+
+
+def analyze():
+    """Collect the statistics the planner needs to prefer indexes."""
+    with connection.cursor() as cursor:
+        for model in (Recipe, Tag, Ingredient,
+                      Recipe.tags.through, Recipe.ingredients.through):
+            cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+
+def seed():
+    """Create users with recipes linked to their tags and ingredients."""
+    users = []
+    for n in range(USERS):
+        user = get_user_model().objects.create_user(f'plan{n}@example.com')
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=f'Tag {i}') for i in range(ITEMS_PER_USER)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(user=user, name=f'Ingredient {i}')
+            for i in range(ITEMS_PER_USER)
+        )
+        recipes = []
+        for i in range(RECIPES_PER_USER):
+            linked = [
+                (i + j) % ITEMS_PER_USER for j in range(LINKS_PER_RECIPE)
+            ]
+            recipes.append(Recipe(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=i % 120,
+                price=Decimal('9.99'),
+                tag_ids=sorted(tags[k].pk for k in linked),
+                ingredient_ids=sorted(ingredients[k].pk for k in linked),
+            ))
+        # bulk_create sends no signals, so the id arrays are set above.
+        recipes = Recipe.objects.bulk_create(recipes)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe in recipes for tag_id in recipe.tag_ids
+        )
+        Recipe.ingredients.through.objects.bulk_create(
+            Recipe.ingredients.through(
+                recipe_id=recipe.pk, ingredient_id=ingredient_id,
+            )
+            for recipe in recipes for ingredient_id in recipe.ingredient_ids
+        )
+        users.append(user)
+    analyze()
+    # Search vectors are only needed for the user under test.
+    Recipe.objects.filter(user=users[0]).update_relation_data()
+    analyze()
+    return users
+
+
+class QueryPlanTests(TestCase):
+    """Test endpoint queries are served by indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed()[0]
+        cls.recipe = Recipe.objects.filter(user=cls.user).first()
+        cls.tag_ids = list(
+            Tag.objects.filter(user=cls.user).values_list('pk', flat=True)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertIndexedPlans(self, url, params=None, allow=()):
+        """Assert the queries of a request neither seq scan nor sort."""
+        with self.settings(RESPONSE_CACHE={'BACKEND': ''}):
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        selects = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT')
+        ]
+        self.assertTrue(selects)
+        for sql in selects:
+            for node, relation in explain(sql):
+                if node in allow:
+                    continue
+                self.assertNotEqual(
+                    node, 'Seq Scan', f'{relation} scanned by:\n{sql}',
+                )
+                self.assertNotIn(node, SORT_NODES, f'Sorted by:\n{sql}')
+        return res
+
+    def test_recipe_list(self):
+        """Test recipe pages are read from the user's id index."""
+        res = self.assertIndexedPlans(RECIPES_URL)
+
+        self.assertIndexedPlans(res.data['next'])
+
+    def test_recipe_detail(self):
+        """Test a recipe and its relations are fetched by key."""
+        self.assertIndexedPlans(detail_url(self.recipe.id))
+
+    def test_recipe_list_filtered(self):
+        """Test filters use the id array index, few matches are sorted."""
+        params = {'tags': ','.join(str(pk) for pk in self.tag_ids[:2])}
+
+        self.assertIndexedPlans(RECIPES_URL, params, allow=SORT_NODES)
+        self.assertIndexedPlans(
+            RECIPES_URL, {**params, 'match': 'all'}, allow=SORT_NODES,
+        )
+
+    def test_recipe_search(self):
+        """Test search is served by the index, results sort by rank."""
+        self.assertIndexedPlans(
+            RECIPES_URL, {'search': 'recipe'}, allow=SORT_NODES,
+        )
+
+    def test_tag_list(self):
+        """Test tag pages are read in keyset order from the index."""
+        res = self.assertIndexedPlans(TAGS_URL, {'page_size': 10})
+
+        self.assertIndexedPlans(res.data['next'])
+
+    def test_tag_list_seek(self):
+        """Test later tag pages start in the index at the cursor."""
+        with self.settings(RESPONSE_CACHE={'BACKEND': ''}):
+            res = self.client.get(TAGS_URL, {'page_size': 10})
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(res.data['next'])
+
+        sql = next(
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT')
+            and 'FROM "core_tag"' in query['sql']
+        )
+        scans = [
+            node for node in plan_nodes(sql)
+            if node.get('Relation Name') == 'core_tag'
+        ]
+        self.assertEqual(len(scans), 1)
+        self.assertIn('ROW(name, id) <', scans[0].get('Index Cond', ''))
+        self.assertNotIn('Filter', scans[0])
+
+    def test_tag_list_assigned(self):
+        """Test assigned tags are probed through the link index."""
+        self.assertIndexedPlans(TAGS_URL, {'assigned_only': 1})
+
+    def test_tag_list_counts(self):
+        """Test recipe counts come from the link index."""
+        self.assertIndexedPlans(TAGS_URL, {'with_counts': 1})
+
+    def test_tag_list_usage(self):
+        """Test usage ordering counts through indexes, then sorts."""
+        self.assertIndexedPlans(
+            TAGS_URL, {'ordering': 'usage'}, allow=SORT_NODES,
+        )
+
+    def test_ingredient_list(self):
+        """Test filtered and counted ingredients use indexes."""
+        self.assertIndexedPlans(
+            INGREDIENTS_URL, {'assigned_only': 1, 'with_counts': 1},
+        )
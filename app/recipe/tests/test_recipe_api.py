@@ -1,6 +1,8 @@
 """
 Tests for recipe APIs.
 """
+import base64
+import json
 from decimal import Decimal
 import tempfile
 import os
@@ -8,7 +10,9 @@ import os
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework.test import APIClient
@@ -19,6 +23,7 @@ from core.models import Recipe, Tag, Ingredient
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
+    get_or_create_items,
 )
 
 RECIPES_URL = reverse('recipe:recipe-list')
@@ -54,6 +59,16 @@ def create_recipe(user, **recipe):
     return recipe
 
 
+def create_recipe_with_relations(user, index):
+    """Create and return a recipe with a tag and an ingredient."""
+    recipe = create_recipe(user=user, title=f'Recipe {index}')
+    recipe.tags.add(Tag.objects.create(user=user, name=f'Tag {index}'))
+    recipe.ingredients.add(
+        Ingredient.objects.create(user=user, name=f'Ingredient {index}')
+    )
+    return recipe
+
+
 class PublicRecipeAPITests(TestCase):
     """Test unauthenticated API requests."""
 
@@ -86,7 +101,7 @@ class PrivateRecipeAPITests(TestCase):
         # Comparable recipe objects
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """Test list of recipes is limited to authenticated user."""
@@ -99,7 +114,7 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_recipe_detail(self):
         """Test getting recipe detail."""
@@ -393,9 +408,9 @@ class PrivateRecipeAPITests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredients."""
@@ -413,9 +428,382 @@ class PrivateRecipeAPITests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def _count_list_queries(self):
+        """Return the number of queries used to list recipes."""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_list_recipes_query_count_constant(self):
+        """Test listing recipes costs the same queries for any size."""
+        create_recipe_with_relations(self.user, 0)
+        baseline = self._count_list_queries()
+
+        for index in range(1, 20):
+            create_recipe_with_relations(self.user, index)
+
+        self.assertEqual(self._count_list_queries(), baseline)
+        self.assertLessEqual(baseline, 3)
+
+    def test_get_recipe_detail_prefetches_relations(self):
+        """Test a recipe detail loads nested relations up front."""
+        recipe = create_recipe(user=self.user)
+        for index in range(5):
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {index}')
+            )
+
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(len(res.data['tags']), 5)
+
+    def _count_write_queries(self, method, url, names):
+        """Return the queries of a write linking the named items."""
+        payload = {
+            'title': 'Curry',
+            'time_minutes': 20,
+            'price': Decimal('8.00'),
+            'tags': [{'name': name} for name in names],
+            'ingredients': [{'name': name} for name in names],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            res = getattr(self.client, method)(url, payload, format='json')
+        self.assertIn(res.status_code, (200, 201))
+        self.assertEqual(len(res.data['tags']), len(names))
+        return len(queries)
+
+    def test_create_nested_query_count_constant(self):
+        """Test creating a recipe costs the same queries for any size."""
+        counts = []
+        for size in (1, 10, 100):
+            # One existing item and the given number of new ones.
+            Tag.objects.create(user=self.user, name=f'Old {size}')
+            Ingredient.objects.create(user=self.user, name=f'Old {size}')
+            names = [f'Old {size}'] + [
+                f'New {size} {i}' for i in range(size)
+            ]
+            counts.append(
+                self._count_write_queries('post', RECIPES_URL, names)
+            )
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(counts[1], counts[2])
+        self.assertEqual(Tag.objects.filter(name='Old 100').count(), 1)
+
+    def test_update_nested_query_count_constant(self):
+        """Test updating a recipe costs the same queries for any size."""
+        counts = []
+        for size in (1, 10, 100):
+            recipe = create_recipe(user=self.user)
+            old = [f'Old {size} {i}' for i in range(size + 1)]
+            recipe.tags.set(
+                Tag.objects.create(user=self.user, name=name) for name in old
+            )
+            # Drop one linked item, keep the rest and add new ones.
+            names = old[1:] + [f'New {size} {i}' for i in range(size)]
+            counts.append(
+                self._count_write_queries('put', detail_url(recipe.id), names)
+            )
+            recipe.refresh_from_db()
+            self.assertEqual(
+                sorted(recipe.tags.values_list('name', flat=True)),
+                sorted(names),
+            )
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(counts[1], counts[2])
+
+    def test_nested_duplicate_names(self):
+        """Test repeated names in a payload link a single item."""
+        payload = {
+            'title': 'Curry',
+            'time_minutes': 20,
+            'price': Decimal('8.00'),
+            'tags': [{'name': 'Vegan'}, {'name': 'Vegan'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(name='Vegan').count(), 1)
+        self.assertEqual(len(res.data['tags']), 1)
+
+    def test_get_or_create_items_upserts(self):
+        """Test names resolve with one lookup and one upsert."""
+        existing = Tag.objects.create(user=self.user, name='Vegan')
+
+        with self.assertNumQueries(2):
+            pks = get_or_create_items(Tag, self.user, ['Vegan', 'Quick'])
+
+        self.assertEqual(pks['Vegan'], existing.id)
+        self.assertEqual(Tag.objects.get(name='Quick').id, pks['Quick'])
+
+    def test_filter_match_all_tags(self):
+        """Test filtering recipes having all of the given tags."""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Quick')
+        r1 = create_recipe(user=self.user, title='Salad')
+        r1.tags.add(tag1, tag2)
+        r2 = create_recipe(user=self.user, title='Stew')
+        r2.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [r1.id])
+
+    def test_filter_match_all_tags_and_ingredients(self):
+        """Test match all applies to tags and ingredients together."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        in1 = Ingredient.objects.create(user=self.user, name='Tofu')
+        in2 = Ingredient.objects.create(user=self.user, name='Rice')
+        r1 = create_recipe(user=self.user)
+        r1.tags.add(tag)
+        r1.ingredients.add(in1, in2)
+        r2 = create_recipe(user=self.user)
+        r2.ingredients.add(in1, in2)
+
+        params = {
+            'tags': str(tag.id),
+            'ingredients': f'{in1.id},{in2.id},{in1.id}',
+            'match': 'all',
+        }
+        res = self.client.get(RECIPES_URL, params)
+
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [r1.id])
+
+    def test_filter_without_distinct(self):
+        """Test a recipe matching several tags is listed once."""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Quick')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag1, tag2)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(
+                RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'}
+            )
+
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [recipe.id])
+        self.assertNotIn('DISTINCT', queries[0]['sql'])
+
+    def test_filter_invalid_match(self):
+        """Test an unknown match mode returns an error."""
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_sparse_fields(self):
+        """Test listing only the requested fields."""
+        create_recipe_with_relations(self.user, 0)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title,price'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        item = res.data['results'][0]
+        self.assertEqual(set(item), {'id', 'title', 'price'})
+
+    def test_list_omit_fields(self):
+        """Test omitted relations are not loaded."""
+        create_recipe_with_relations(self.user, 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {'omit': 'tags'})
+
+        self.assertNotIn('tags', res.data['results'][0])
+        self.assertIn('ingredients', res.data['results'][0])
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('core_tag', queries[1]['sql'])
+
+    def test_detail_sparse_fields(self):
+        """Test retrieving a recipe with only some fields."""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(detail_url(recipe.id), {'fields': 'id,image'})
+
+        self.assertEqual(set(res.data), {'id', 'image'})
+
+    def test_sparse_fields_unknown(self):
+        """Test unknown field names return an error."""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,secret'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sparse_fields_ignored_on_write(self):
+        """Test sparse fieldsets do not limit writes."""
+        recipe = create_recipe(user=self.user)
+        url = f'{detail_url(recipe.id)}?fields=id'
+
+        res = self.client.patch(url, {'title': 'New title'})
+
+        self.assertEqual(res.data['title'], 'New title')
+
+    def test_list_recipes_paginated(self):
+        """Test walking recipe pages with cursors."""
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+        expected = [recipe.id for recipe in reversed(recipes)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+        ids = [item['id'] for item in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids.extend(item['id'] for item in res.data['results'])
+
+        self.assertEqual(ids, expected)
+        self.assertNotIn('count', res.data)
+
+    def test_list_recipes_previous_page(self):
+        """Test a previous cursor returns the preceding page."""
+        for _ in range(4):
+            create_recipe(user=self.user)
+        first = self.client.get(RECIPES_URL, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+
+        res = self.client.get(second.data['previous'])
+
+        self.assertEqual(res.data['results'], first.data['results'])
+        self.assertIsNone(res.data['previous'])
+
+    def test_list_recipes_page_size_capped(self):
+        """Test page size is limited to the configured maximum."""
+        for _ in range(3):
+            create_recipe(user=self.user)
+
+        with self.settings(API_MAX_PAGE_SIZE=2):
+            res = self.client.get(RECIPES_URL, {'page_size': 50})
+
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_list_recipes_invalid_cursor(self):
+        """Test an invalid cursor returns an error."""
+        res = self.client.get(RECIPES_URL, {'cursor': 'notacursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_recipes_tampered_cursor(self):
+        """Test cursor values of the wrong type return an error."""
+        create_recipe(user=self.user)
+        for position in (['x'], [{}], [[1]], [None], [True], [1.5]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps({'p': position, 'r': 0}).encode(),
+            ).decode()
+
+            res = self.client.get(RECIPES_URL, {'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_tampered_cursor(self):
+        """Test a rank cursor value must be a number."""
+        create_recipe(user=self.user, title='Curry')
+        for position, code in (
+            ([0.5, 1], status.HTTP_200_OK),
+            (['0.5', 1], status.HTTP_404_NOT_FOUND),
+            ([0.5, '1'], status.HTTP_404_NOT_FOUND),
+        ):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps({'p': position, 'r': 0}).encode(),
+            ).decode()
+
+            res = self.client.get(
+                RECIPES_URL, {'search': 'curry', 'cursor': cursor},
+            )
+
+            self.assertEqual(res.status_code, code)
+
+    def test_filtered_pages_query_count_constant(self):
+        """Test later pages of a filtered list cost the same queries."""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        for index in range(6):
+            recipe = create_recipe_with_relations(self.user, index)
+            recipe.tags.add(tag)
+        params = {'page_size': 2, 'tags': str(tag.id)}
+
+        with CaptureQueriesContext(connection) as first_page:
+            res = self.client.get(RECIPES_URL, params)
+        with CaptureQueriesContext(connection) as next_page:
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertEqual(len(first_page), len(next_page))
+
+    def test_search_ranks_title_above_description(self):
+        """Test searching recipes ranks title matches first."""
+        r1 = create_recipe(
+            user=self.user,
+            title='Weeknight dinner',
+            description='Quick lentil soup.',
+        )
+        r2 = create_recipe(user=self.user, title='Lentil curry')
+        create_recipe(user=self.user, title='Pancakes')
+
+        res = self.client.get(RECIPES_URL, {'search': 'lentil'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [r2.id, r1.id])
+
+    def test_search_tag_and_ingredient_names(self):
+        """Test searching matches linked tag and ingredient names."""
+        r1 = create_recipe(user=self.user, title='Curry')
+        r1.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        r2 = create_recipe(user=self.user, title='Stew')
+        r2.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Vegan butter')
+        )
+        create_recipe(user=self.user, title='Steak')
+
+        res = self.client.get(RECIPES_URL, {'search': 'vegan'})
+
+        ids = {item['id'] for item in res.data['results']}
+        self.assertEqual(ids, {r1.id, r2.id})
+
+    def test_search_follows_updates(self):
+        """Test updating a recipe through the API updates the index."""
+        recipe = create_recipe(user=self.user, title='Omelette')
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        recipe.tags.add(tag)
+
+        self.client.patch(detail_url(recipe.id), {'title': 'Frittata'})
+        tag.name = 'Brunch'
+        tag.save()
+
+        res = self.client.get(RECIPES_URL, {'search': 'frittata brunch'})
+        self.assertEqual(len(res.data['results']), 1)
+        res = self.client.get(RECIPES_URL, {'search': 'omelette'})
+        self.assertEqual(res.data['results'], [])
+
+    def test_search_with_tag_filter_and_pages(self):
+        """Test search combines with tag filters and pagination."""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        expected = set()
+        for index in range(3):
+            recipe = create_recipe(user=self.user, title=f'Soup {index}')
+            recipe.tags.add(tag)
+            expected.add(recipe.id)
+        create_recipe(user=self.user, title='Soup without tag')
+
+        params = {'search': 'soup', 'tags': str(tag.id), 'page_size': 2}
+        res = self.client.get(RECIPES_URL, params)
+        ids = [item['id'] for item in res.data['results']]
+        res = self.client.get(res.data['next'])
+        ids.extend(item['id'] for item in res.data['results'])
+
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(set(ids), expected)
+
 
 class ImageUploadTest(TestCase):
     """Tests for the image upload API."""
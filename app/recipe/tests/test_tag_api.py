@@ -1,10 +1,15 @@
 """
 Tests for tag APIs.
 """
+import base64
+import json
 from decimal import Decimal
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework.test import APIClient
@@ -58,7 +63,7 @@ class PrivateTagsApiTests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test list of tags is limited to authenticated user."""
@@ -69,9 +74,9 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
         serializer = TagSerializer(tag)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
-        self.assertEqual(res.data[0], serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0], serializer.data)
 
     def test_update_tag(self):
         """Test updating a tag."""
@@ -119,8 +124,8 @@ class PrivateTagsApiTests(TestCase):
         s1 = TagSerializer(tag1)
         s2 = TagSerializer(tag2)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filter_tags_unique(self):
         """Test filtering result list unique."""
@@ -141,4 +146,157 @@ class PrivateTagsApiTests(TestCase):
         recipe1.tags.add(tag)
         recipe2.tags.add(tag)
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_list_tags_query_count_constant(self):
+        """Test listing tags costs one query for any number of tags."""
+        for index in range(10):
+            Tag.objects.create(user=self.user, name=f'Tag {index}')
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(len(res.data['results']), 10)
+
+    def test_list_tags_paginated_by_name(self):
+        """Test tag pages do not skip or repeat tags."""
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Same', 'Other', 'Another')]
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        ids = [item['id'] for item in res.data['results']]
+        res = self.client.get(res.data['next'])
+        ids.extend(item['id'] for item in res.data['results'])
+
+        self.assertEqual(ids, [tag.id for tag in tags])
+        self.assertIsNone(res.data['next'])
+
+    def test_list_tags_tampered_cursor(self):
+        """Test a name cursor with values of the wrong type is rejected."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        for position in (['Vegan', 'x'], [1, 1], [['Vegan'], 1]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps({'p': position, 'r': 0}).encode(),
+            ).decode()
+
+            res = self.client.get(TAGS_URL, {'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_tags_by_usage_tampered_cursor(self):
+        """Test a usage cursor must hold integer counts."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        cursor = base64.urlsafe_b64encode(
+            json.dumps({'p': ['many', 1], 'r': 0}).encode(),
+        ).decode()
+
+        res = self.client.get(
+            TAGS_URL, {'ordering': 'usage', 'cursor': cursor},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_tag_duplicate_name(self):
+        """Test renaming a tag to a name in use is rejected."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        tag = Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_tag_duplicate_name_raced(self):
+        """Test a name written after the check is rejected all the same."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        tag = Tag.objects.create(user=self.user, name='Dessert')
+
+        # The other write lands between the check and the update.
+        with patch.object(TagSerializer, 'validate_name',
+                          lambda self, value: value):
+            res = self.client.patch(detail_url(tag.id), {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data['name'], ['An item with this name already exists.'],
+        )
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Dessert')
+
+    def test_list_tags_sparse_fields_paginated(self):
+        """Test sparse tag pages keep the ordering columns loaded."""
+        for index in range(4):
+            Tag.objects.create(user=self.user, name=f'Tag {index}')
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL, {'fields': 'id', 'page_size': 2})
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(set(res.data['results'][0]), {'id'})
+        self.assertEqual(len(res.data['results']), 2)
+
+    def _create_used_tags(self):
+        """Return tags used by 0, 2 and 1 recipes."""
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Unused', 'Popular', 'Niche')]
+        for index in range(2):
+            recipe = Recipe.objects.create(
+                title=f'Recipe {index}',
+                time_minutes=5,
+                price=Decimal('4.50'),
+                user=self.user,
+            )
+            recipe.tags.add(tags[1])
+            if index:
+                recipe.tags.add(tags[2])
+        return tags
+
+    def test_filter_assigned_uses_exists(self):
+        """Test assigned tags are filtered without a join or DISTINCT."""
+        self._create_used_tags()
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        sql = queries[0]['sql']
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+        names = [tag['name'] for tag in res.data['results']]
+        self.assertEqual(names, ['Popular', 'Niche'])
+
+    def test_assigned_only_off(self):
+        """Test assigned_only=0 lists unused tags too."""
+        self._create_used_tags()
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 0})
+
+        self.assertEqual(len(res.data['results']), 3)
+
+    def test_with_counts(self):
+        """Test recipe counts are returned in the list query."""
+        self._create_used_tags()
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        counts = {tag['name']: tag['recipe_count']
+                  for tag in res.data['results']}
+        self.assertEqual(counts, {'Unused': 0, 'Popular': 2, 'Niche': 1})
+
+    def test_order_by_usage_paginated(self):
+        """Test tags page by usage, most used first."""
+        tags = self._create_used_tags()
+
+        params = {'ordering': 'usage', 'page_size': 2}
+        res = self.client.get(TAGS_URL, params)
+        ids = [tag['id'] for tag in res.data['results']]
+        res = self.client.get(res.data['next'])
+        ids.extend(tag['id'] for tag in res.data['results'])
+
+        self.assertEqual(ids, [tags[1].id, tags[2].id, tags[0].id])
+        self.assertNotIn('recipe_count', res.data['results'][0])
+
+    def test_invalid_ordering(self):
+        """Test an unknown ordering returns an error."""
+        res = self.client.get(TAGS_URL, {'ordering': 'title'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,189 @@
+"""
+Tests for the memory-bounded image uploads.
+"""
+import io
+import shutil
+import struct
+import tempfile
+import tracemalloc
+import zlib
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework import status
+
+from core.models import Recipe
+from recipe.uploads import BoundedMultiPartParser
+
+
+def png_chunk(kind, data):
+    """Return a PNG chunk with its length and checksum."""
+    return (
+        struct.pack('>I', len(data)) + kind + data
+        + struct.pack('>I', zlib.crc32(kind + data))
+    )
+
+
+def png_header(width, height):
+    """Return a PNG announcing a size, without its pixel data."""
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0,
+                                         0, 0, 0))
+        + png_chunk(b'IDAT', zlib.compress(b''))
+        + png_chunk(b'IEND', b'')
+    )
+
+
+def image_file(image_format='JPEG', size=(10, 10), name='photo'):
+    """Return an uploaded image of a format."""
+    buffer = io.BytesIO()
+    Image.new('RGB', size).save(buffer, format=image_format)
+    return SimpleUploadedFile(
+        f'{name}.{image_format.lower()}', buffer.getvalue(),
+    )
+
+
+class BoundedUploadTests(TestCase):
+    """Test uploads are streamed, limited and checked from their header."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=5,
+            price=Decimal('5.00'),
+        )
+        self.url = reverse(
+            'recipe:recipe-upload-image', args=[self.recipe.id],
+        )
+
+    def upload(self, upload):
+        res = self.client.post(self.url, {'image': upload},
+                               format='multipart')
+        self.recipe.refresh_from_db()
+        return res
+
+    def multipart_request(self, upload):
+        """Return a request with a multipart body, not parsed yet."""
+        return Request(
+            APIRequestFactory().post(
+                '/', {'image': upload}, format='multipart',
+            ),
+            parsers=[BoundedMultiPartParser()],
+        )
+
+    def test_small_upload_on_disk(self):
+        """Test even small uploads are written to a temporary file."""
+        files = self.multipart_request(image_file()).FILES
+
+        self.assertTrue(files['image'].temporary_file_path())
+
+    def test_upload_memory_bounded(self):
+        """Test parsing a large upload holds a chunk of it at a time."""
+        upload = SimpleUploadedFile(
+            'photo.png', png_header(10, 10) + b'\0' * (4 * 1024 * 1024),
+        )
+        request = self.multipart_request(upload)
+
+        tracemalloc.start()
+        try:
+            files = request.FILES
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(files['image'].size, upload.size)
+        self.assertLess(peak, 1024 * 1024)
+
+    def test_valid_formats(self):
+        """Test each accepted format is stored."""
+        for image_format in ('JPEG', 'PNG'):
+            res = self.upload(image_file(image_format))
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertTrue(self.recipe.image.name.endswith(
+                image_format.lower(),
+            ))
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1024)
+    def test_too_large(self):
+        """Test uploads above the byte limit are rejected."""
+        upload = SimpleUploadedFile(
+            'photo.png', png_header(10, 10) + b'\0' * 4096,
+        )
+
+        res = self.upload(upload)
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1024)
+    def test_too_large_while_streaming(self):
+        """Test the limit holds when the announced length is within it."""
+        upload = SimpleUploadedFile(
+            'photo.png', png_header(10, 10) + b'\0' * 4096,
+        )
+
+        with mock.patch('recipe.uploads.MULTIPART_OVERHEAD', 1024 * 1024):
+            res = self.upload(upload)
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+        self.assertIn('1024 bytes', res.data['detail'])
+
+    def test_decompression_bomb(self):
+        """Test images announcing too many pixels are never decoded."""
+        upload = SimpleUploadedFile('bomb.png', png_header(10000, 5000))
+
+        with override_settings(IMAGE_UPLOAD_MAX_PIXELS=40000000):
+            res = self.upload(upload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pixels', str(res.data['image']))
+        self.assertFalse(self.recipe.image)
+
+    def test_pillow_decompression_bomb(self):
+        """Test images Pillow refuses to open as bombs are rejected."""
+        upload = SimpleUploadedFile('bomb.png', png_header(100000, 100000))
+
+        res = self.upload(upload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pixels', str(res.data['image']))
+
+    def test_format_not_accepted(self):
+        """Test images of other formats are rejected."""
+        res = self.upload(image_file('GIF'))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('JPEG', str(res.data['image']))
+
+    def test_not_an_image(self):
+        """Test files that are no image are rejected."""
+        res = self.upload(SimpleUploadedFile('notes.jpg', b'not an image'))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.recipe.image)
@@ -0,0 +1,96 @@
+"""
+Memory-bounded image uploads.
+
+Django keeps uploads below FILE_UPLOAD_MAX_MEMORY_SIZE in memory, and
+image validation then reads the whole file again. BoundedMultiPartParser
+streams every uploaded file to a temporary file instead, one chunk at a
+time, and stops reading the body once the files exceed
+IMAGE_UPLOAD_MAX_BYTES. Each complete file is checked from its header
+only: Pillow reads the format and dimensions without decoding pixels,
+so images above IMAGE_UPLOAD_MAX_PIXELS are rejected before anything
+decodes them. A worker holds one chunk of an upload at a time, whatever
+its size.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image
+from rest_framework import exceptions, parsers, status
+
+# Room for the multipart boundaries, headers and form fields around the
+# files, when checking the announced length of a body.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(exceptions.APIException):
+    """An upload above the byte limit."""
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'The upload is too large.'
+    default_code = 'upload_too_large'
+
+
+def check_image_header(path):
+    """Return the format and size of an image, read from its header.
+
+    Raise ValueError when the image is not accepted.
+    """
+    try:
+        with Image.open(path) as image:
+            image_format, size = image.format, image.size
+    except Image.DecompressionBombError:
+        image_format, size = None, None
+    except Exception:
+        raise ValueError('Upload a valid image.')
+
+    formats = settings.IMAGE_UPLOAD_FORMATS
+    if size is None or size[0] * size[1] > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise ValueError(
+            f'Images may have at most {settings.IMAGE_UPLOAD_MAX_PIXELS} '
+            f'pixels.'
+        )
+    if image_format not in formats:
+        raise ValueError(f'Upload a {", ".join(formats)} image.')
+    return image_format, size
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Write uploads to disk up to a byte limit and check their headers."""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        self.max_bytes = settings.IMAGE_UPLOAD_MAX_BYTES
+        self.received = 0
+        if content_length > self.max_bytes + MULTIPART_OVERHEAD:
+            raise self._too_large()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self.file.close()
+            raise self._too_large()
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        try:
+            check_image_header(file.temporary_file_path())
+        except ValueError as error:
+            file.close()
+            raise exceptions.ValidationError({self.field_name: [str(error)]})
+        return file
+
+    def _too_large(self):
+        return UploadTooLarge(
+            f'Uploads may have at most {self.max_bytes} bytes.'
+        )
+
+
+class BoundedMultiPartParser(parsers.MultiPartParser):
+    """Multipart parser streaming files through BoundedUploadHandler."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        # Set on the Django request, which the base parser reads them from.
+        request._request.upload_handlers = [
+            BoundedUploadHandler(request._request),
+        ]
+        return super().parse(stream, media_type, parser_context)
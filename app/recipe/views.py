@@ -1,6 +1,10 @@
 """
 Views for recipe APIs.
 """
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -9,14 +13,54 @@ from drf_spectacular.utils import (
 )
 
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, JSONParser
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 
 from recipe import serializers
+from recipe.bulk import (
+    BulkRecipeWriter,
+    CHUNK_QUERIES,
+    chunk_count,
+    validate_items,
+)
+from recipe.cache import CachedListMixin
+from recipe.conditional import ConditionalListMixin, ConditionalRetrieveMixin
+from recipe.export import RecipeExport, WRITERS
+from recipe.fast_list import FastListMixin
+from recipe.filters import (
+    annotate_recipe_count,
+    filter_assigned,
+    filter_by_related,
+    param_flag,
+    MATCH_ALL,
+    MATCH_ANY,
+)
+from recipe.pagination import KeysetPagination
+from recipe.query_plan import QueryPlanMixin
+from recipe.uploads import BoundedMultiPartParser
+
+from core.middleware import extend_query_budget
+from core.models import Recipe, Tag, Ingredient, SEARCH_CONFIG
+from user.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
 
-from core.models import Recipe, Tag, Ingredient
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma seperated list of fields to return.',
+    ),
+    OpenApiParameter(
+        'omit',
+        OpenApiTypes.STR,
+        description='Comma seperated list of fields to leave out.',
+    ),
+]
 
 
 @extend_schema_view(
@@ -27,25 +71,68 @@ from core.models import Recipe, Tag, Ingredient
                 OpenApiTypes.INT, enum = [1, 0],
                 description='Filter by items that are assigned to a recipe.',
             ),
-        ]
+            OpenApiParameter(
+                'with_counts',
+                OpenApiTypes.INT, enum=[1, 0],
+                description='Include the number of recipes using each item.',
+            ),
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR, enum=['name', 'usage'],
+                description='Order by name (default) or by recipe count.',
+            ),
+        ] + SPARSE_FIELDS_PARAMETERS
     )
 )
-class BaseRecipeAttrViewSet(mixins.UpdateModelMixin,
+class BaseRecipeAttrViewSet(ConditionalListMixin,
+                            CachedListMixin,
+                            QueryPlanMixin,
+                            mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             mixins.DestroyModelMixin,
                             viewsets.GenericViewSet):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication, SignedTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    # The owner is read by the signals that invalidate cached responses.
+    query_plan_fields = ['user']
+    # The id keeps the keyset ordering total where names and counts tie.
+    orderings = {
+        'name': ['-name', '-id'],
+        'usage': ['-recipe_count', '-id'],
+    }
+    ordering = orderings['name']
+    # Most queries per action, the token lookup included.
+    query_budget = {
+        'list': 3,
+        'update': 6,
+        'partial_update': 6,
+        'destroy': 6,
+    }
+
+    def get_ordering(self):
+        """Return the requested ordering."""
+        name = self.request.query_params.get('ordering', 'name')
+        if name not in self.orderings:
+            raise ValidationError({
+                'ordering': f'Must be one of {", ".join(self.orderings)}.'
+            })
+        return self.orderings[name]
 
     def get_queryset(self):
         """Retrieve ingredients for the authenticated user."""
-        assigned = bool(self.request.query_params.get('assigned_only', 0))
-        queryset = self.queryset
-        if assigned:
-            queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-name').distinct()
+        params = self.request.query_params
+        queryset = self.queryset.filter(user=self.request.user)
+        if param_flag(params, 'assigned_only'):
+            queryset = filter_assigned(queryset)
+        ordering = self.get_ordering()
+        if param_flag(params, 'with_counts') or \
+                '-recipe_count' in ordering:
+            queryset = annotate_recipe_count(queryset)
+        return self.apply_query_plan(queryset.order_by(*ordering))
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -59,37 +146,105 @@ class BaseRecipeAttrViewSet(mixins.UpdateModelMixin,
                 'ingredients',
                 OpenApiTypes.STR,
                 description='Comma seperated list of ingredient ids.',
-            )
-        ]
-    )
+            ),
+            OpenApiParameter(
+                'match',
+                OpenApiTypes.STR, enum=[MATCH_ANY, MATCH_ALL],
+                description='Match any (default) or all of the given ids.',
+            ),
+            OpenApiParameter(
+                'search',
+                OpenApiTypes.STR,
+                description='Search text, results are ranked by relevance.',
+            ),
+        ] + SPARSE_FIELDS_PARAMETERS
+    ),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalListMixin,
+                    ConditionalRetrieveMixin,
+                    CachedListMixin,
+                    FastListMixin,
+                    QueryPlanMixin,
+                    viewsets.ModelViewSet):
     """Viewset for manage recipe APIs, providing multipule endpoints."""
     serializer_class = serializers.RecipeDetailSerializer
     # Specify the available objects that are manageable through the APIs.
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication, SignedTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    # Uploaded images are streamed to disk and checked from their header.
+    parser_classes = [JSONParser, FormParser, BoundedMultiPartParser]
+    pagination_class = KeysetPagination
+    # The modification time validates conditional detail requests.
+    query_plan_fields = ['user', 'updated_at']
+    ordering = ['-id']
+    # Most queries per action, the token lookup included. Writes cost the
+    # same for any number of nested tags and ingredients, and exports run
+    # theirs as the response streams, after the count. Bulk writes get
+    # CHUNK_QUERIES more per chunk past the first.
+    query_budget = {
+        'list': 5,
+        'retrieve': 5,
+        'create': 21,
+        'update': 28,
+        'partial_update': 28,
+        'destroy': 8,
+        'upload_image': 4,
+        'bulk': 18,
+        'export': 1,
+    }
 
     def _param_to_ints(self, qs):
         """Convert the query string to a list of ints."""
         return [int(qid) for qid in qs.split(',')]
 
+    def get_ordering(self):
+        """Order search results by relevance."""
+        if self.request.query_params.get('search'):
+            return ['-rank', '-id']
+        return self.ordering
+
     def get_queryset(self):
         """Retrieve recipes for authenticated user."""
+        return self.apply_query_plan(self.get_filtered_queryset())
+
+    def get_filtered_queryset(self):
+        """Retrieve the filtered recipes before choosing what to load."""
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('search')
+        match = self.request.query_params.get('match', MATCH_ANY)
+        if match not in (MATCH_ANY, MATCH_ALL):
+            raise ValidationError(
+                {'match': f'Must be {MATCH_ANY} or {MATCH_ALL}.'}
+            )
         queryset = self.queryset
+        if search:
+            query = SearchQuery(
+                search,
+                search_type='websearch',
+                config=SEARCH_CONFIG,
+            )
+            # A double precision rank survives the round trip through
+            # pagination cursors unchanged.
+            queryset = queryset.filter(search_vector=query).annotate(
+                rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+            )
         if tags:
             tag_ids = self._param_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = filter_by_related(queryset, 'tags', tag_ids, match)
         if ingredients:
             ingredient_ids = self._param_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = filter_by_related(
+                queryset, 'ingredients', ingredient_ids, match,
+            )
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).order_by(*self.get_ordering())
 
     def get_serializer_class(self):
         """return a proper serializer for the recipe view (request)."""
@@ -97,6 +252,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'bulk':
+            return serializers.RecipeBulkSerializer
         return serializers.RecipeDetailSerializer
 
     def perform_create(self, serializer):
@@ -116,6 +273,78 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.errors, status= status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        request=serializers.RecipeBulkSerializer(many=True),
+        responses={status.HTTP_201_CREATED: OpenApiTypes.OBJECT},
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """Create and update many recipes in one request.
+
+        Items with an id update that recipe, the others are created. The
+        batch is written only if every item is valid, otherwise the
+        errors are reported by item index.
+        """
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Expected a list.']})
+        if len(items) > settings.API_BULK_MAX_ITEMS:
+            raise ValidationError({'non_field_errors': [
+                f'At most {settings.API_BULK_MAX_ITEMS} items are allowed.'
+            ]})
+
+        validated, errors = validate_items(
+            items, request.user, self.get_serializer_context(),
+        )
+        if errors:
+            return Response(
+                {'errors': errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        extend_query_budget(
+            request, (chunk_count(validated) - 1) * CHUNK_QUERIES,
+        )
+        ids = BulkRecipeWriter(request.user).write(validated)
+        return Response({'ids': ids}, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'output',
+                OpenApiTypes.STR,
+                enum=list(WRITERS),
+                description='Format of the exported recipes.',
+            ),
+            OpenApiParameter(
+                'images',
+                OpenApiTypes.INT,
+                enum=[1, 0],
+                description='Bundle the images with the recipes in a tar '
+                            'archive.',
+            ),
+        ],
+        responses={status.HTTP_200_OK: OpenApiTypes.BINARY},
+    )
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """Stream all matching recipes as NDJSON or CSV.
+
+        The list filters apply, pagination does not: the export is
+        written while the recipes are read, a chunk at a time.
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in WRITERS:
+            raise ValidationError(
+                {'output': f'Must be one of {", ".join(WRITERS)}.'}
+            )
+        return RecipeExport(
+            self.get_filtered_queryset(),
+            # The export always has every field, whatever `fields` asks.
+            serializers.RecipeSerializer(),
+            output=output,
+            images=param_flag(request.query_params, 'images'),
+        ).response()
+
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -0,0 +1,262 @@
+"""
+Token authentication with cached token lookups.
+
+DRF's TokenAuthentication joins the token and user tables on every
+request. CachedTokenAuthentication keeps the user's columns in a bounded
+per-process cache instead, for TOKEN_AUTH_CACHE['TIMEOUT'] seconds.
+
+Each request gets its own user instance built from the cached columns.
+The password and `content_updated_at` are left deferred, so the views
+that read them load them fresh. In particular, list ETags never come
+from a cached modification time.
+
+Deleting a token, and saving or deleting a user, invalidates the cached
+lookups through the signals in user.signals. Without a shared cache this
+only reaches the current process, and the other workers drop the entry
+when its timeout expires. When TOKEN_AUTH_CACHE['SHARED'] names a cache
+every worker reads, the lookups are kept there as well. Each user then
+has a generation in that cache, which invalidation replaces, and every
+cached hit is checked against it. Bulk updates of users send no
+signals, so they are only seen once the entries expire.
+
+SignedTokenAuthentication accepts the signed tokens of user.tokens, sent
+as `Authorization: Bearer <token>`. Their user is looked up through the
+same cache, so a deleted or deactivated user is rejected like one of a
+stored token.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import router, transaction
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication,
+    TokenAuthentication,
+    get_authorization_header,
+)
+
+from user import tokens
+
+# Columns loaded lazily rather than cached.
+UNCACHED_FIELDS = ('password', 'content_updated_at')
+
+
+def _cached_fields():
+    """Return the attribute names of the user columns that are cached."""
+    return [
+        field.attname for field in get_user_model()._meta.concrete_fields
+        if field.name not in UNCACHED_FIELDS
+    ]
+
+
+def _digest(key):
+    """Return the token as stored in cache keys, never in the clear."""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class TokenUserCache:
+    """Bounded, expiring map of tokens to the columns of their user."""
+
+    def __init__(self, timeout=60, max_entries=10000, shared=None):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.shared = shared
+        self._lock = threading.Lock()
+        # Digest: (expiry, (generation, user id, values)).
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached column values of a token's user, or None."""
+        digest = _digest(key)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[digest]
+                entry = None
+            elif entry is not None:
+                self._entries.move_to_end(digest)
+                entry = entry[1]
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(f'token-auth:{digest}')
+            if entry is not None:
+                self._store(digest, entry)
+        if entry is None:
+            return None
+        generation, user_id, values = entry
+        if self.shared is not None and \
+                generation != self._shared_generation(user_id):
+            self.delete(key)
+            return None
+        return values
+
+    def set(self, key, user):
+        """Cache the columns of a token's user."""
+        generation = None
+        if self.shared is not None:
+            generation = self._shared_generation(user.pk, create=True)
+        entry = (
+            generation,
+            user.pk,
+            [getattr(user, name) for name in _cached_fields()],
+        )
+        digest = _digest(key)
+        if self.shared is not None:
+            self.shared.set(f'token-auth:{digest}', entry, self.timeout)
+        self._store(digest, entry)
+
+    def delete(self, key):
+        """Forget a token."""
+        digest = _digest(key)
+        with self._lock:
+            self._entries.pop(digest, None)
+        if self.shared is not None:
+            self.shared.delete(f'token-auth:{digest}')
+
+    def invalidate_user(self, user_id):
+        """Forget every token of a user, in all processes sharing a cache."""
+        if self.shared is not None:
+            self.shared.set(
+                f'token-auth-generation:{user_id}', time.time_ns(), None,
+            )
+        with self._lock:
+            for digest in [
+                digest for digest, (_, (_, cached_id, _))
+                in self._entries.items() if cached_id == user_id
+            ]:
+                del self._entries[digest]
+
+    def _store(self, digest, entry):
+        with self._lock:
+            self._entries[digest] = (time.monotonic() + self.timeout, entry)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _shared_generation(self, user_id, create=False):
+        """Return the generation of a user's lookups in the shared cache."""
+        key = f'token-auth-generation:{user_id}'
+        generation = self.shared.get(key)
+        if generation is None and create:
+            self.shared.add(key, time.time_ns(), None)
+            generation = self.shared.get(key)
+        return generation
+
+
+@lru_cache(maxsize=None)
+def get_token_cache():
+    """Return the configured token cache, or None when disabled."""
+    config = settings.TOKEN_AUTH_CACHE
+    if not config.get('TIMEOUT'):
+        return None
+    shared = caches[config['SHARED']] if config.get('SHARED') else None
+    return TokenUserCache(
+        timeout=config['TIMEOUT'],
+        max_entries=config.get('MAX_ENTRIES', 10000),
+        shared=shared,
+    )
+
+
+@receiver(setting_changed)
+def _reset_token_cache(setting, **kwargs):
+    if setting in ('TOKEN_AUTH_CACHE', 'CACHES'):
+        get_token_cache.cache_clear()
+
+
+def invalidate_token(key):
+    """Forget a token now and again once the transaction commits."""
+    cache = get_token_cache()
+    if cache is None:
+        return
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def invalidate_user(user_id):
+    """Forget a user's tokens now and again once the transaction commits.
+
+    The second pass drops anything cached by a concurrent request that
+    read the user before the write became visible.
+    """
+    cache = get_token_cache()
+    if cache is None:
+        return
+    cache.invalidate_user(user_id)
+    transaction.on_commit(lambda: cache.invalidate_user(user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that skips the database on cached tokens."""
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        if cache is None:
+            return super().authenticate_credentials(key)
+
+        values = cache.get(key)
+        if values is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(key, user)
+            return user, token
+
+        user = _user_from_cache(values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'),
+            )
+        return user, self.get_model()(key=key, user=user)
+
+
+def _user_from_cache(values):
+    """Return a user built from its cached columns."""
+    model = get_user_model()
+    return model.from_db(router.db_for_read(model), _cached_fields(), values)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """Authenticate signed access tokens by their signature alone."""
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header.'),
+            )
+        try:
+            claims = tokens.verify(auth[1].decode(), tokens.ACCESS)
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        except tokens.InvalidToken as error:
+            raise exceptions.AuthenticationFailed(str(error))
+        return self.authenticate_credentials(auth[1].decode(), claims)
+
+    def authenticate_credentials(self, key, claims):
+        cache = get_token_cache()
+        values = cache.get(key) if cache is not None else None
+        if values is not None:
+            user = _user_from_cache(values)
+        else:
+            user = get_user_model()._default_manager.defer(
+                *UNCACHED_FIELDS,
+            ).filter(pk=claims.user_id).first()
+            if user is not None and cache is not None:
+                cache.set(key, user)
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'),
+            )
+        return user, claims
+
+    def authenticate_header(self, request):
+        return self.keyword
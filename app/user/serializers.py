@@ -8,6 +8,8 @@ from django.contrib.auth import (
 from django.utils.translation import gettext_lazy as t
 from rest_framework import serializers
 
+from user import tokens
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Define the serializer for user model."""
@@ -57,3 +59,50 @@ class AuthTokenSerializer(serializers.Serializer):
             raise serializers.ValidationError(msg, code='authorization')
         attrs['user'] = user
         return attrs
+
+
+class TokenRefreshSerializer(serializers.Serializer):
+    """Serializer for exchanging a refresh token for new tokens."""
+    refresh = serializers.CharField(trim_whitespace=False)
+
+    def validate_refresh(self, value):
+        """Validate the refresh token and return its claims."""
+        try:
+            claims = tokens.verify(value, tokens.REFRESH)
+        except tokens.InvalidToken as error:
+            raise serializers.ValidationError(str(error), code='invalid')
+        user_exists = get_user_model().objects.filter(
+            pk=claims.user_id, is_active=True,
+        ).exists()
+        if not user_exists:
+            msg = t('User inactive or deleted.')
+            raise serializers.ValidationError(msg, code='invalid')
+        return claims
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    """Serializer for revoking a refresh token and its access token."""
+    refresh = serializers.CharField(trim_whitespace=False)
+    token = serializers.CharField(required=False, trim_whitespace=False)
+
+    def validate_refresh(self, value):
+        """Validate the refresh token and return its claims."""
+        return self._claims(value, tokens.REFRESH)
+
+    def validate_token(self, value):
+        """Validate the access token and return its claims."""
+        return self._claims(value, tokens.ACCESS)
+
+    def _claims(self, value, kind):
+        try:
+            return tokens.verify(value, kind)
+        except tokens.InvalidToken as error:
+            raise serializers.ValidationError(str(error), code='invalid')
+
+    def validate(self, attrs):
+        """Check both tokens belong to the same user."""
+        access = attrs.get('token')
+        if access and access.user_id != attrs['refresh'].user_id:
+            msg = t('The tokens belong to different users.')
+            raise serializers.ValidationError(msg, code='invalid')
+        return attrs
@@ -0,0 +1,22 @@
+"""
+Signal handlers for the user APIs.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user.authentication import invalidate_token, invalidate_user
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_tokens_on_user_write(sender, instance, **kwargs):
+    """Forget the cached lookups of a user's tokens after a write."""
+    invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_on_delete(sender, instance, **kwargs):
+    """Forget the cached lookup of a deleted token."""
+    invalidate_token(instance.key)
@@ -0,0 +1,186 @@
+"""
+Tests for the cached token authentication.
+"""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from user.authentication import TokenUserCache
+
+ME_URL = reverse('user:me')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+@override_settings(TOKEN_AUTH_CACHE={'TIMEOUT': 60, 'SHARED': ''})
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating requests with cached tokens."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'password123', name='Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_lookup(self):
+        """Test the token is looked up once."""
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        with self.assertNumQueries(0):
+            cached = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.data, res.data)
+
+    def test_invalid_token(self):
+        """Test unknown tokens are rejected."""
+        self.client.credentials(HTTP_AUTHORIZATION='Token unknown')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token(self):
+        """Test a deleted token is rejected at once."""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user(self):
+        """Test the tokens of a deactivated user are rejected."""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_updated_user(self):
+        """Test changes to the user are seen by the next request."""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'name': 'New name'})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New name')
+
+    def test_update_keeps_uncached_fields(self):
+        """Test saving a cached user leaves the deferred columns alone."""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'name': 'New name'})
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('password123'))
+
+    def test_password_change(self):
+        """Test the password is updated through a cached user."""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'password': 'newpassword123'})
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('newpassword123'))
+
+    def test_list_etag_follows_writes(self):
+        """Test list validators are not read from the cached user."""
+        etag = self.client.get(RECIPES_URL)['ETag']
+        Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=5,
+            price=Decimal('5.00'),
+        )
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+
+    @override_settings(TOKEN_AUTH_CACHE={'TIMEOUT': 0})
+    def test_disabled(self):
+        """Test every request looks the token up without the cache."""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+
+class TokenUserCacheTests(TestCase):
+    """Test the token lookup cache."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', name='Name',
+        )
+
+    def test_expiry(self):
+        """Test entries expire after the timeout."""
+        cache = TokenUserCache(timeout=10)
+        with mock.patch('user.authentication.time.monotonic') as monotonic:
+            monotonic.return_value = 100
+            cache.set('key', self.user)
+            monotonic.return_value = 109
+            self.assertIsNotNone(cache.get('key'))
+            monotonic.return_value = 111
+            self.assertIsNone(cache.get('key'))
+
+    def test_bounded(self):
+        """Test the least recently used entries are evicted."""
+        cache = TokenUserCache(max_entries=2)
+        for key in ('a', 'b'):
+            cache.set(key, self.user)
+        cache.get('a')
+        cache.set('c', self.user)
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_invalidate_user(self):
+        """Test invalidating a user forgets all of their tokens."""
+        other = get_user_model().objects.create_user('other@example.com')
+        cache = TokenUserCache()
+        cache.set('a', self.user)
+        cache.set('b', self.user)
+        cache.set('c', other)
+
+        cache.invalidate_user(self.user.pk)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_shared_lookup(self):
+        """Test a lookup cached by one process is read by another."""
+        shared = LocMemCache('token-test-lookup', {})
+        TokenUserCache(shared=shared).set('key', self.user)
+
+        values = TokenUserCache(shared=shared).get('key')
+
+        self.assertIn(self.user.email, values)
+
+    def test_shared_invalidation(self):
+        """Test invalidations reach the other processes' entries."""
+        shared = LocMemCache('token-test-invalidation', {})
+        first = TokenUserCache(shared=shared)
+        second = TokenUserCache(shared=shared)
+        first.set('key', self.user)
+        second.get('key')
+
+        first.invalidate_user(self.user.pk)
+
+        self.assertIsNone(second.get('key'))
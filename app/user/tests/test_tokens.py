@@ -0,0 +1,225 @@
+"""
+Tests for the signed access and refresh tokens.
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import RevokedToken
+from user import tokens
+
+TOKEN_URL = reverse('user:token')
+REFRESH_URL = reverse('user:token-refresh')
+REVOKE_URL = reverse('user:token-revoke')
+ME_URL = reverse('user:me')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class SignedTokenTests(TestCase):
+    """Test issuing and checking signed tokens."""
+
+    def test_verify(self):
+        """Test a token carries its user and kind."""
+        claims = tokens.verify(tokens.issue(7, tokens.ACCESS), tokens.ACCESS)
+
+        self.assertEqual(claims.user_id, 7)
+        self.assertEqual(claims.kind, tokens.ACCESS)
+
+    def test_verify_without_queries(self):
+        """Test checking a token does not read the database."""
+        token = tokens.issue(7, tokens.ACCESS)
+        tokens.denylist.sync()
+
+        with self.assertNumQueries(0):
+            tokens.verify(token, tokens.ACCESS)
+
+    def test_tampered(self):
+        """Test a token changed by a client is rejected."""
+        token = tokens.issue(7, tokens.ACCESS)
+        tampered = token.replace('a.7.', 'a.8.', 1)
+
+        with self.assertRaisesMessage(tokens.InvalidToken, 'Invalid token.'):
+            tokens.verify(tampered, tokens.ACCESS)
+
+    def test_wrong_kind(self):
+        """Test a refresh token is not accepted as an access token."""
+        token = tokens.issue(7, tokens.REFRESH)
+
+        with self.assertRaisesMessage(tokens.InvalidToken, 'Invalid token.'):
+            tokens.verify(token, tokens.ACCESS)
+
+    def test_expired(self):
+        """Test a token is rejected once its lifetime has passed."""
+        with mock.patch('user.tokens.time.time', return_value=1000):
+            token = tokens.issue(7, tokens.ACCESS)
+
+        with self.assertRaisesMessage(tokens.InvalidToken, 'Token expired.'):
+            tokens.verify(token, tokens.ACCESS)
+
+    def test_revoked(self):
+        """Test a revoked token is rejected until it expires."""
+        claims = tokens.verify(
+            tokens.issue(7, tokens.REFRESH), tokens.REFRESH,
+        )
+
+        tokens.revoke(claims)
+
+        self.assertTrue(RevokedToken.objects.filter(jti=claims.jti).exists())
+        self.assertTrue(tokens.denylist.is_revoked(claims.jti))
+
+    def test_revocations_of_other_processes(self):
+        """Test a sync loads the tokens revoked by other processes."""
+        claims = tokens.verify(
+            tokens.issue(7, tokens.REFRESH), tokens.REFRESH,
+        )
+        denylist = tokens.Denylist()
+        denylist.sync()
+        tokens.revoke(claims)
+        self.assertNotIn(claims.jti, denylist._revoked)
+
+        denylist.sync()
+
+        self.assertTrue(denylist.is_revoked(claims.jti))
+
+
+@override_settings(AUTH_TOKEN_MODE='signed')
+class SignedTokenApiTests(TestCase):
+    """Test the token endpoints with signed tokens."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'password123', name='Name',
+        )
+        self.client = APIClient()
+        res = self.client.post(TOKEN_URL, {
+            'email': 'user@example.com', 'password': 'password123',
+        })
+        self.tokens = res.data
+
+    def authenticate(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_create_token(self):
+        """Test the token endpoint answers signed tokens."""
+        self.assertIn('refresh', self.tokens)
+        self.assertEqual(
+            self.tokens['expires_in'], settings.SIGNED_TOKEN_ACCESS_LIFETIME,
+        )
+
+    def test_authenticate(self):
+        """Test an access token authenticates requests."""
+        self.authenticate(self.tokens['token'])
+
+        me = self.client.get(ME_URL)
+        recipes = self.client.get(RECIPES_URL)
+
+        self.assertEqual(me.status_code, status.HTTP_200_OK)
+        self.assertEqual(me.data, {
+            'email': 'user@example.com', 'name': 'Name',
+        })
+        self.assertEqual(recipes.status_code, status.HTTP_200_OK)
+
+    def test_authenticate_deleted_user(self):
+        """Test the access token of a deleted user is rejected."""
+        self.authenticate(self.tokens['token'])
+        self.client.get(RECIPES_URL)
+        self.user.delete()
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_AUTH_CACHE={'TIMEOUT': 0})
+    def test_authenticate_inactive_user(self):
+        """Test the access token of a deactivated user is rejected."""
+        self.user.is_active = False
+        self.user.save()
+        self.authenticate(self.tokens['token'])
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_token_rejected(self):
+        """Test a refresh token does not authenticate requests."""
+        self.authenticate(self.tokens['refresh'])
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res['WWW-Authenticate'], 'Token')
+
+    def test_refresh(self):
+        """Test a refresh token is exchanged once for new tokens."""
+        res = self.client.post(
+            REFRESH_URL, {'refresh': self.tokens['refresh']},
+        )
+        again = self.client.post(
+            REFRESH_URL, {'refresh': self.tokens['refresh']},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['refresh'], self.tokens['refresh'])
+        self.authenticate(res.data['token'])
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refresh_replayed(self):
+        """Test a refresh token used in another process is rejected."""
+        claims = tokens.verify(self.tokens['refresh'], tokens.REFRESH)
+        RevokedToken.objects.create(
+            jti=claims.jti, expires_at=timezone.now() + timedelta(days=1),
+        )
+
+        # This process has not synced the revocation yet.
+        with mock.patch.object(tokens.denylist, 'is_revoked',
+                               return_value=False):
+            res = self.client.post(
+                REFRESH_URL, {'refresh': self.tokens['refresh']},
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['refresh'], ['Token revoked.'])
+
+    def test_refresh_inactive_user(self):
+        """Test a deactivated user cannot refresh their tokens."""
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.post(
+            REFRESH_URL, {'refresh': self.tokens['refresh']},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('token', res.data)
+
+    def test_revoke(self):
+        """Test revoked tokens can neither authenticate nor refresh."""
+        res = self.client.post(REVOKE_URL, self.tokens)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.authenticate(self.tokens['token'])
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        refresh = self.client.post(
+            REFRESH_URL, {'refresh': self.tokens['refresh']},
+        )
+        self.assertEqual(refresh.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_revoke_other_users_token(self):
+        """Test the access token revoked must belong to the same user."""
+        other = tokens.issue(self.user.pk + 1, tokens.ACCESS)
+
+        res = self.client.post(REVOKE_URL, {
+            'refresh': self.tokens['refresh'], 'token': other,
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,142 @@
+"""
+Short-lived signed access tokens and their refresh tokens.
+
+A signed token carries its kind, the user id, its expiry and a random
+id, followed by an HMAC-SHA256 signature keyed by SECRET_KEY:
+
+    <a|r>.<user id>.<expiry>.<id>:<signature>
+
+Checking a token is pure computation. Revoked token ids are stored in
+the RevokedToken table until the tokens expire. Every process keeps the
+unexpired ids in memory, and reloads them at most once every
+SIGNED_TOKEN_DENYLIST_SYNC_INTERVAL seconds, so a revocation reaches
+the other workers within that interval.
+
+Checking a token does not read its user, see SignedTokenAuthentication
+for that. Refreshing reads the user and rejects inactive ones, and
+rotates the refresh token: the old one is revoked.
+"""
+import secrets
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from core.models import RevokedToken
+
+ACCESS = 'a'
+REFRESH = 'r'
+
+TokenClaims = namedtuple('TokenClaims', ['kind', 'user_id', 'expires', 'jti'])
+
+
+class InvalidToken(Exception):
+    """A signed token that is malformed, expired or revoked."""
+
+
+def _signer():
+    return signing.Signer(salt='user.tokens', algorithm='sha256')
+
+
+def issue(user_id, kind):
+    """Return a new signed token of a kind for a user."""
+    lifetime = (
+        settings.SIGNED_TOKEN_ACCESS_LIFETIME if kind == ACCESS
+        else settings.SIGNED_TOKEN_REFRESH_LIFETIME
+    )
+    expires = int(time.time()) + lifetime
+    jti = secrets.token_urlsafe(12)
+    return _signer().sign(f'{kind}.{user_id}.{expires}.{jti}')
+
+
+def issue_pair(user_id):
+    """Return the access and refresh tokens answered to a client."""
+    return {
+        'token': issue(user_id, ACCESS),
+        'refresh': issue(user_id, REFRESH),
+        'expires_in': settings.SIGNED_TOKEN_ACCESS_LIFETIME,
+    }
+
+
+def verify(token, kind):
+    """Return the claims of a valid token of a kind."""
+    try:
+        value = _signer().unsign(token)
+    except signing.BadSignature:
+        raise InvalidToken('Invalid token.')
+    try:
+        token_kind, user_id, expires, jti = value.split('.')
+        claims = TokenClaims(token_kind, int(user_id), int(expires), jti)
+    except ValueError:
+        raise InvalidToken('Invalid token.')
+    if claims.kind != kind:
+        raise InvalidToken('Invalid token.')
+    if claims.expires <= time.time():
+        raise InvalidToken('Token expired.')
+    if denylist.is_revoked(claims.jti):
+        raise InvalidToken('Token revoked.')
+    return claims
+
+
+def revoke(claims):
+    """Reject a token from now until it expires.
+
+    Return whether this call revoked it. The unique token id makes one of
+    concurrent calls win, whatever the denylists of their processes say.
+    """
+    expires_at = datetime.fromtimestamp(claims.expires, timezone.utc)
+    _, created = RevokedToken.objects.get_or_create(
+        jti=claims.jti, defaults={'expires_at': expires_at},
+    )
+    RevokedToken.objects.filter(
+        expires_at__lte=timezone.now(),
+    ).delete()
+    denylist.add(claims.jti, claims.expires)
+    return created
+
+
+class Denylist:
+    """The revoked token ids of this process, with their expiry."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._next_sync = 0
+
+    def is_revoked(self, jti):
+        """Return whether a token id is revoked."""
+        if time.monotonic() >= self._next_sync:
+            self.sync()
+        return jti in self._revoked
+
+    def add(self, jti, expires):
+        """Record a revocation made by this process."""
+        with self._lock:
+            self._revoked[jti] = expires
+
+    def sync(self):
+        """Reload the unexpired revocations of every process."""
+        now = timezone.now()
+        revoked = {
+            jti: int(expires_at.timestamp())
+            for jti, expires_at in RevokedToken.objects.filter(
+                expires_at__gt=now,
+            ).values_list('jti', 'expires_at')
+        }
+        with self._lock:
+            # Revocations added while the rows were read are kept.
+            revoked.update(
+                (jti, expires) for jti, expires in self._revoked.items()
+                if expires > now.timestamp()
+            )
+            self._revoked = revoked
+            self._next_sync = (
+                time.monotonic() + settings.SIGNED_TOKEN_DENYLIST_SYNC_INTERVAL
+            )
+
+
+denylist = Denylist()
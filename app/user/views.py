@@ -1,32 +1,95 @@
 """
 Views for the user APIs.
 """
-from rest_framework import generics, authentication, permissions
+from django.conf import settings
+from rest_framework import generics, permissions, serializers, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
+from user import tokens
+from user.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
+    TokenRefreshSerializer,
+    TokenRevokeSerializer,
 )
 
 
 class CreateUserView(generics.CreateAPIView):
     """Create a user in system."""
     serializer_class = UserSerializer
+    query_budget = 2
 
 
 class CreateTokenView(ObtainAuthToken):
-    """Create a auth token for a user."""
+    """Create a auth token for a user.
+
+    With AUTH_TOKEN_MODE set to 'signed', answer a signed access token
+    and its refresh token instead of the user's database token.
+    """
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    query_budget = 5
+
+    def post(self, request, *args, **kwargs):
+        if settings.AUTH_TOKEN_MODE != 'signed':
+            return super().post(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        return Response(tokens.issue_pair(user.pk))
+
+
+class TokenRefreshView(generics.GenericAPIView):
+    """Exchange a refresh token for new signed tokens."""
+    serializer_class = TokenRefreshSerializer
+    authentication_classes = []
+    permission_classes = []
+    query_budget = 6
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        claims = serializer.validated_data['refresh']
+        # Each refresh token is used once, the denylist may not know yet
+        # of a concurrent refresh in another process.
+        if not tokens.revoke(claims):
+            raise serializers.ValidationError(
+                {'refresh': ['Token revoked.']}, code='invalid',
+            )
+        return Response(tokens.issue_pair(claims.user_id))
+
+
+class TokenRevokeView(generics.GenericAPIView):
+    """Revoke a refresh token, and optionally its access token."""
+    serializer_class = TokenRevokeSerializer
+    authentication_classes = []
+    permission_classes = []
+    query_budget = 9
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        for key in ('refresh', 'token'):
+            if key in serializer.validated_data:
+                tokens.revoke(serializer.validated_data[key])
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Retrieve a authenticated user profile."""
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication, SignedTokenAuthentication,
+    ]
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = UserSerializer
+    # Most queries per method, the token lookup included.
+    query_budget = {'get': 2, 'put': 3, 'patch': 3}
 
     def get_object(self):
         """Retrieve and return a authenticated user."""
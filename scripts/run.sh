@@ -7,4 +7,10 @@ set -e
  python manage.py collectstatic --noinput
  python manage.py migrate
 
+# Metrics of a previous run would add up with the new workers' counters.
+ rm -f "${METRICS_DIR:-/vol/metrics}"/*.json
+
+# Response caches of earlier releases were written under the served volume.
+ rm -rf /vol/web/cache
+
  uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file